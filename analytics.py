@@ -0,0 +1,92 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from constants import ANALYTICS_DEFAULT_DAYS, PERIOD_DAY, PERIOD_MONTH, PERIOD_WEEK
+from date_functions import day_label, month_label, week_label
+from habit import CheckOff
+from streaks import streak_interval
+
+# Label of the period a check-off falls in, computed by the database from the day column
+PERIOD_BUCKETS = {
+    PERIOD_DAY: lambda: day_label(CheckOff.day),
+    # The Monday of the week
+    PERIOD_WEEK: lambda: week_label(CheckOff.day),
+    PERIOD_MONTH: lambda: month_label(CheckOff.day),
+}
+
+
+def period_bucket(period: str):
+    """
+    Return the SQL expression labelling the day, week (by its Monday) or month of a check-off.
+    """
+    if period not in PERIOD_BUCKETS:
+        raise ValueError(f"Invalid period {period}. Use {', '.join(PERIOD_BUCKETS)}.")
+    return PERIOD_BUCKETS[period]()
+
+
+def archived_period_counts(date_times, period: str) -> Dict[str, int]:
+    """
+    Count the datetime64 date_times of archived check-offs per period, labelled like period_bucket labels them.
+    """
+    import numpy as np
+
+    days = date_times.astype("datetime64[D]")
+    if period == PERIOD_WEEK:
+        # Day 0, 1970-01-01, was a Thursday: move each day back to its Monday
+        days = days - (days.astype(np.int64) + 3) % 7
+    elif period == PERIOD_MONTH:
+        days = days.astype("datetime64[M]")
+    labels, counts = np.unique(days, return_counts=True)
+    return dict(zip((str(label) for label in labels), counts.tolist()))
+
+
+def analysis_range(since: Optional[datetime], until: Optional[datetime], now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """
+    Return the [since, until) range to analyze, by default the last ANALYTICS_DEFAULT_DAYS days up to today included.
+    """
+    if until is None:
+        until = datetime.combine((now or datetime.utcnow()).date() + timedelta(days=1), datetime.min.time())
+    if since is None:
+        since = until - timedelta(days=ANALYTICS_DEFAULT_DAYS)
+    if since >= until:
+        raise ValueError(f"Invalid range: {since} is not before {until}.")
+    return since, until
+
+
+def expected_check_offs(periodicity: int, first_day: date, last_day: date) -> int:
+    """
+    Return the number of check-offs that complete a habit from first_day to last_day, inclusive:
+    one per day for daily habits, one per started week for weekly habits.
+    """
+    days = (last_day - first_day).days + 1
+    if days <= 0:
+        return 0
+    interval = streak_interval(periodicity)
+    return (days + interval - 1) // interval
+
+
+def split_by_month(since: datetime, until: datetime) -> Tuple[Optional[Tuple[date, date]], List[Tuple[datetime, datetime]]]:
+    """
+    Split [since, until) into the whole months it covers, as a [first month, end month) range of month starts
+    or None, and the ranges before and after them, which cover parts of a month.
+    """
+    first_month = since.date().replace(day=1)
+    if datetime.combine(first_month, datetime.min.time()) < since:
+        first_month = _next_month(first_month)
+    end_month = until.date().replace(day=1)
+
+    first_month_start = datetime.combine(first_month, datetime.min.time())
+    end_month_start = datetime.combine(end_month, datetime.min.time())
+    if first_month >= end_month:
+        return None, [(since, until)]
+
+    partial_ranges = []
+    if since < first_month_start:
+        partial_ranges.append((since, first_month_start))
+    if end_month_start < until:
+        partial_ranges.append((end_month_start, until))
+    return (first_month, end_month), partial_ranges
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
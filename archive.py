@@ -0,0 +1,280 @@
+import heapq
+import os
+import shutil
+import threading
+import uuid
+from datetime import date, datetime
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+
+from database import is_in_memory_database
+from habit import ArchivedCheckOffs, Habit
+
+ARCHIVE_SUFFIX = ".archive"
+ID_COLUMN = "ids.npy"
+DATE_TIME_COLUMN = "date_times.npy"
+TEMPORARY_SUFFIX = ".tmp"
+
+# Archived check-offs of a habit: ids and datetime64[us] date_times, both sorted by date_time
+History = Tuple[object, object]
+
+
+def resolve_archive_path(config: dict) -> Optional[str]:
+    """
+    Return the configured archive directory, by default the database file path with an .archive suffix.
+    In-memory databases have no default archive.
+    """
+    if config["archive_path"]:
+        return config["archive_path"]
+    url = make_url(config["database_url"])
+    if url.get_backend_name() != "sqlite" or is_in_memory_database(url):
+        return None
+    return url.database + ARCHIVE_SUFFIX
+
+
+def archive_index_statement(criterion=None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Return a query of the (habit_id, segment, start, stop) index rows of the archived check-offs of the habits
+    matching criterion, or of every habit, keeping only segments with check-offs in [since, until).
+    """
+    statement = select(ArchivedCheckOffs.habit_id, ArchivedCheckOffs.segment, ArchivedCheckOffs.start, ArchivedCheckOffs.stop)
+    if criterion is not None:
+        statement = statement.join(Habit, Habit.id == ArchivedCheckOffs.habit_id).where(criterion)
+    if since is not None:
+        statement = statement.where(ArchivedCheckOffs.last_check_off >= since)
+    if until is not None:
+        statement = statement.where(ArchivedCheckOffs.first_check_off < until)
+    return statement.order_by(ArchivedCheckOffs.habit_id, ArchivedCheckOffs.segment)
+
+
+class CheckOffArchive:
+    """
+    Check-offs moved out of the check_offs table, in immutable segments under path.
+    A segment is a directory of two columnar .npy files, ids and date_times as int64 microseconds since the epoch,
+    sorted by habit and date_time. The ArchivedCheckOffs rows of the database are its offset index: they locate
+    the rows of each habit in a segment, and a segment without index rows is not read.
+    The columns are memory-mapped, so reading the history of a habit only pages in its slice of them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Memory maps of the segments read so far, by segment name
+        self._columns: Dict[str, Tuple[object, object]] = {}
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.path)
+
+    def write_segment(self, rows: Sequence[Tuple[int, int, datetime]]) -> Tuple[str, List[dict]]:
+        """
+        Write (id, habit_id, date_time) check-offs to a new segment, synced to disk.
+        Returns the name of the segment and its ArchivedCheckOffs index rows.
+        """
+        import numpy as np
+
+        rows = sorted(rows, key=itemgetter(1, 2))
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        habit_ids = np.array([row[1] for row in rows], dtype=np.int64)
+        date_times = np.array([row[2] for row in rows], dtype="datetime64[us]")
+
+        segment = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        directory = os.path.join(self.path, segment)
+        temporary = directory + TEMPORARY_SUFFIX
+        os.makedirs(temporary)
+        for name, column in ((ID_COLUMN, ids), (DATE_TIME_COLUMN, date_times.view(np.int64))):
+            with open(os.path.join(temporary, name), "wb") as file:
+                np.save(file, column)
+                file.flush()
+                os.fsync(file.fileno())
+        # A segment is only visible under its name once complete
+        os.rename(temporary, directory)
+
+        starts = np.flatnonzero(np.diff(habit_ids)) + 1
+        bounds = zip(np.concatenate(([0], starts)).tolist(), np.concatenate((starts, [len(rows)])).tolist())
+        index = [
+            {
+                "habit_id": rows[start][1],
+                "segment": segment,
+                "start": start,
+                "stop": stop,
+                "first_check_off": rows[start][2],
+                "last_check_off": rows[stop - 1][2],
+            }
+            for start, stop in bounds
+        ]
+        return segment, index
+
+    def max_id(self) -> Optional[int]:
+        """
+        Return the largest id of the archived check-offs, or None if nothing is archived.
+        """
+        if not self.exists():
+            return None
+        ids = [
+            int(self._open(name)[0].max()) for name in os.listdir(self.path) if not name.endswith(TEMPORARY_SUFFIX)
+        ]
+        return max(ids, default=None)
+
+    def remove_segments(self, keep: Set[str]) -> None:
+        """
+        Delete the segments not in keep, such as segments whose habits were all deleted.
+        """
+        if not self.exists():
+            return
+        for name in os.listdir(self.path):
+            if name not in keep:
+                self.remove_segment(name)
+
+    def remove_segment(self, segment: str) -> None:
+        with self._lock:
+            self._columns.pop(segment, None)
+        shutil.rmtree(os.path.join(self.path, segment), ignore_errors=True)
+
+    def histories(self, index_rows: Iterable[Tuple[int, str, int, int]]) -> Dict[int, History]:
+        """
+        Return the archived (ids, date_times) of each habit from (habit_id, segment, start, stop) index rows
+        ordered by habit. The history of a habit archived in a single segment is a view of its memory maps.
+        """
+        import numpy as np
+
+        histories = {}
+        for habit_id, habit_rows in groupby(index_rows, key=itemgetter(0)):
+            parts = [self._read(segment, start, stop) for _, segment, start, stop in habit_rows]
+            if len(parts) == 1:
+                histories[habit_id] = parts[0]
+                continue
+            ids = np.concatenate([part[0] for part in parts])
+            date_times = np.concatenate([part[1] for part in parts])
+            order = np.argsort(date_times, kind="stable")
+            histories[habit_id] = (ids[order], date_times[order])
+        return histories
+
+    def _read(self, segment: str, start: int, stop: int) -> History:
+        with self._lock:
+            columns = self._columns.get(segment)
+            if columns is None:
+                columns = self._columns[segment] = self._open(segment)
+        ids, date_times = columns
+        return ids[start:stop], date_times[start:stop]
+
+    def _open(self, segment: str) -> Tuple[object, object]:
+        import numpy as np
+
+        directory = os.path.join(self.path, segment)
+        ids = np.load(os.path.join(directory, ID_COLUMN), mmap_mode="r")
+        date_times = np.load(os.path.join(directory, DATE_TIME_COLUMN), mmap_mode="r").view("datetime64[us]")
+        return ids, date_times
+
+
+def to_datetimes(date_times) -> List[datetime]:
+    return date_times.astype("datetime64[us]").tolist()
+
+
+def merge_archived(rows: Sequence[tuple], histories: Dict[int, History]) -> Sequence[tuple]:
+    """
+    Merge the archived check-offs of histories into rows ordered by habit and date_time, such as
+    (habit_id, periodicity, date_time) rows of an outer join, whose last column is the date_time of a live check-off,
+    None for a habit without live check-offs.
+    """
+    if not histories:
+        return rows
+
+    merged = []
+    for habit_id, habit_rows in groupby(rows, key=itemgetter(0)):
+        habit_rows = list(habit_rows)
+        history = histories.get(habit_id)
+        if history is None:
+            merged.extend(habit_rows)
+            continue
+        columns = tuple(habit_rows[0][:-1])
+        live = [row[-1] for row in habit_rows if row[-1] is not None]
+        merged.extend(columns + (date_time,) for date_time in heapq.merge(to_datetimes(history[1]), live))
+    return merged
+
+
+def archived_rows(
+    histories: Dict[int, History],
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[Tuple[int, int, datetime]]:
+    """
+    Return the (id, habit_id, date_time) rows of the archived check-offs within [since, until), filtered and ordered
+    like a page of HabitTracker._filter_check_offs: by id, after after_id and up to limit rows, when paginated.
+    """
+    import numpy as np
+
+    rows = []
+    for habit_id, (ids, date_times) in histories.items():
+        first = 0 if since is None else np.searchsorted(date_times, np.datetime64(since, "us"))
+        last = len(date_times) if until is None else np.searchsorted(date_times, np.datetime64(until, "us"))
+        ids, date_times = ids[first:last], date_times[first:last]
+        if after_id is not None:
+            selected = ids > after_id
+            ids, date_times = ids[selected], date_times[selected]
+        rows.extend(zip(ids.tolist(), [habit_id] * len(ids), to_datetimes(date_times)))
+
+    if after_id is not None or limit is not None:
+        rows.sort()
+        rows = rows[:limit]
+    return rows
+
+
+def merge_pages(live: list, archived: list, limit: Optional[int], paginated: bool) -> list:
+    """
+    Merge a page of live check-offs with one of archived check-offs, both ordered by id when paginated.
+    """
+    if not archived:
+        return live
+    if not paginated:
+        return archived + list(live)
+    return list(heapq.merge(archived, live, key=lambda row: row[0]))[:limit]
+
+
+def archived_days(histories: Dict[int, History], candidates: Iterable[Tuple[int, date]]) -> Set[Tuple[int, date]]:
+    """
+    Return the (habit_id, day) candidates on which the habit has an archived check-off.
+    """
+    import numpy as np
+
+    found = set()
+    for habit_id, day in candidates:
+        history = histories.get(habit_id)
+        if history is None:
+            continue
+        start = np.datetime64(day, "us")
+        first = np.searchsorted(history[1], start)
+        if first < len(history[1]) and history[1][first] < start + np.timedelta64(1, "D"):
+            found.add((habit_id, day))
+    return found
+
+
+def within(histories: Dict[int, History], ranges: Sequence[Tuple[datetime, datetime]]) -> Dict[int, object]:
+    """
+    Return the archived date_times of each habit within the [since, until) ranges, as sorted datetime64[us] arrays.
+    """
+    import numpy as np
+
+    selected = {}
+    for habit_id, (_, date_times) in histories.items():
+        parts = [
+            date_times[np.searchsorted(date_times, np.datetime64(since, "us")):np.searchsorted(date_times, np.datetime64(until, "us"))]
+            for since, until in ranges
+        ]
+        parts = [part for part in parts if len(part)]
+        if parts:
+            selected[habit_id] = np.concatenate(parts) if len(parts) > 1 else parts[0]
+    return selected
+
+
+def last_check_off(history: History) -> Tuple[int, datetime]:
+    """
+    Return the id and date_time of the last archived check-off of a history.
+    """
+    ids, date_times = history
+    return int(ids[-1]), to_datetimes(date_times[-1:])[0]
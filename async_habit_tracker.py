@@ -0,0 +1,287 @@
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from archive import (
+    CheckOffArchive,
+    History,
+    archive_index_statement,
+    archived_days,
+    last_check_off,
+    merge_archived,
+    resolve_archive_path,
+)
+from bitmap import add_to_history, history_states
+from config import load_config
+from constants import PERIODICITY_DAILY, PERIODICITY_WEEKLY
+from database import create_async_database_engine
+from exceptions import HabitNotFoundError, MultipleCheckOffError
+from habit import ArchivedCheckOffs, Habit, CheckOff, HabitStreak
+from habit_tracker import HabitTracker
+from migrations import upgrade_schema_on_connection
+from rollups import add_to_rollups_statement, rollup_rows
+from streaks import advance_streak, longest_streaks, streak_states
+from validation import (
+    DAILY_CHECK_OFF_LIMIT_MESSAGE,
+    WEEKLY_CHECK_OFF_LIMIT_MESSAGE,
+    daily_check_off_error,
+    habit_not_found_message,
+    invalid_periodicity_message,
+    weekly_check_off_error,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHabitTracker:
+    """
+    asyncio counterpart of HabitTracker on SQLAlchemy's AsyncSession, for embedding in an event loop
+    without a thread per call. Check-offs are validated with the same rules and update the same streak cache.
+    Call create_schema once before the first operation on a database created by this tracker.
+    """
+
+    def __init__(
+        self,
+        session: Optional[AsyncSession] = None,
+        database_url: Optional[str] = None,
+        config: Optional[dict] = None,
+        archive_path: Optional[str] = None,
+    ):
+        """
+        Use the given session for every operation, or open a new session per operation on the configured database.
+        The database URL and pool settings come from config, or from load_config with database_url taking precedence.
+        Archived check-offs are read from archive_path, by default the configured archive of the database.
+        """
+        self.session = session
+        self.archive = CheckOffArchive(archive_path) if archive_path else None
+        if session is None:
+            self.config = config or load_config(database_url=database_url)
+            if archive_path is None:
+                archive_path = resolve_archive_path(self.config)
+                self.archive = CheckOffArchive(archive_path) if archive_path else None
+            self.engine = create_async_database_engine(self.config)
+            self.session_factory = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    async def create_schema(self) -> None:
+        """
+        Create or upgrade the database schema, like HabitTracker does when it is constructed.
+        """
+        async with self.engine.begin() as connection:
+            await connection.run_sync(upgrade_schema_on_connection, self.archive)
+
+    async def dispose(self) -> None:
+        """
+        Close the pooled connections of the engine.
+        """
+        if self.session is None:
+            await self.engine.dispose()
+
+    @asynccontextmanager
+    async def _session_scope(self) -> AsyncIterator[AsyncSession]:
+        if self.session is not None:
+            yield self.session
+            return
+
+        async with self.session_factory() as session:
+            yield session
+
+    async def add_habit(self, name: str, description: str, periodicity: int) -> Habit:
+        async with self._session_scope() as session:
+            habit = Habit(name=name, description=description, periodicity=periodicity, streak=HabitStreak())
+            session.add(habit)
+            await session.commit()
+            logger.info(f"Habit added: {habit}")
+            return habit
+
+    async def check_off_habit(self, habit_id: int, check_off_date: Optional[datetime] = None) -> CheckOff:
+        if check_off_date is None:
+            check_off_date = datetime.utcnow()
+
+        async with self._session_scope() as session:
+            # Every exit without a commit rolls back, so a shared session does not keep holding the write lock
+            try:
+                check_off = await self._check_off(session, habit_id, check_off_date)
+            except BaseException:
+                await session.rollback()
+                raise
+            logger.info(f"Check-off added: {check_off}")
+            return check_off
+
+    async def _check_off(self, session: AsyncSession, habit_id: int, check_off_date: datetime) -> CheckOff:
+        day = check_off_date.date()
+        # Taken before the streak is read, like HabitTracker.check_off_habit, so concurrent check-offs wait
+        await session.execute(HabitTracker._lock_streak_statement(habit_id), execution_options={"synchronize_session": False})
+        habit = await self._get_habit(session, habit_id)
+
+        if habit.periodicity == PERIODICITY_DAILY:
+            error = daily_check_off_error(await self._is_checked_off(session, habit.id, day))
+            limit_message = DAILY_CHECK_OFF_LIMIT_MESSAGE
+        elif habit.periodicity == PERIODICITY_WEEKLY:
+            last_check_off = await self._get_last_check_off_date(session, habit.id)
+            error = weekly_check_off_error(last_check_off, day)
+            limit_message = WEEKLY_CHECK_OFF_LIMIT_MESSAGE
+        else:
+            raise ValueError(invalid_periodicity_message(habit.id, habit.periodicity))
+
+        if error:
+            raise MultipleCheckOffError(error)
+
+        check_off = CheckOff(habit_id=habit.id, date_time=check_off_date, day=day)
+        session.add(check_off)
+        # Updating the caches can autoflush the check-off, which is where a concurrent duplicate is detected
+        try:
+            await self._update_streak_cache(session, habit, check_off_date)
+            await session.execute(
+                add_to_rollups_statement(session.get_bind().dialect.name), rollup_rows([(habit.id, check_off_date)])
+            )
+            await session.commit()
+        except IntegrityError:
+            raise MultipleCheckOffError(limit_message)
+        return check_off
+
+    async def _get_habit(self, session: AsyncSession, habit_id: int) -> Habit:
+        # The streak relationship is eagerly joined, so it is loaded without lazy IO
+        habit = await session.get(Habit, habit_id)
+        if not habit:
+            raise HabitNotFoundError(habit_not_found_message(habit_id))
+        return habit
+
+    async def _is_checked_off(self, session: AsyncSession, habit_id: int, day: date) -> bool:
+        existing_check_off = await session.scalar(
+            select(CheckOff.id).filter_by(habit_id=habit_id).filter(CheckOff.day == day).limit(1)
+        )
+        if existing_check_off is not None:
+            return True
+        day_start = datetime.combine(day, datetime.min.time())
+        histories = await self._archived_histories(session, Habit.id == habit_id, day_start, day_start + timedelta(days=1))
+        return bool(archived_days(histories, [(habit_id, day)]))
+
+    async def _get_last_check_off_date(self, session: AsyncSession, habit_id: int) -> Optional[datetime]:
+        last_check_off = await session.scalar(
+            select(CheckOff.date_time).filter_by(habit_id=habit_id).order_by(CheckOff.date_time.desc()).limit(1)
+        )
+        if self.archive is None or not self.archive.exists():
+            return last_check_off
+        archived_last_check_off = await session.scalar(
+            select(func.max(ArchivedCheckOffs.last_check_off)).filter_by(habit_id=habit_id)
+        )
+        if archived_last_check_off is not None and (last_check_off is None or archived_last_check_off > last_check_off):
+            return archived_last_check_off
+        return last_check_off
+
+    async def _archived_histories(
+        self,
+        session: AsyncSession,
+        criterion=None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Dict[int, History]:
+        """
+        Return the archived (ids, date_times) of the habits matching criterion, like HabitTracker._archived_histories.
+        """
+        if self.archive is None or not self.archive.exists():
+            return {}
+        result = await session.execute(archive_index_statement(criterion, since, until))
+        return self.archive.histories(result.all())
+
+    async def _update_streak_cache(self, session: AsyncSession, habit: Habit, check_off_date: datetime) -> None:
+        if habit.streak is not None and advance_streak(habit.streak, check_off_date, habit.periodicity):
+            add_to_history(habit.streak, habit.periodicity, habit.creation_date, check_off_date)
+            return
+
+        check_offs = await session.scalars(
+            select(CheckOff.date_time).filter_by(habit_id=habit.id).order_by(CheckOff.date_time.asc())
+        )
+        rows = [(habit.id, habit.periodicity, date_time) for date_time in check_offs] or [(habit.id, habit.periodicity, None)]
+        rows = merge_archived(rows, await self._archived_histories(session, Habit.id == habit.id))
+        state = streak_states(rows)[habit.id]
+        state.update(history_states([(habit.id, habit.periodicity, habit.creation_date, row[2]) for row in rows])[habit.id])
+
+        if habit.streak is None:
+            habit.streak = HabitStreak(**state)
+        else:
+            for column, value in state.items():
+                setattr(habit.streak, column, value)
+
+    async def get_habits(self, after_id: Optional[int] = None, limit: Optional[int] = None) -> List[Habit]:
+        async with self._session_scope() as session:
+            result = await session.scalars(HabitTracker._paginate(select(Habit), Habit.id, after_id, limit))
+            return list(result.unique())
+
+    async def get_habit(self, habit_id: int) -> Habit:
+        async with self._session_scope() as session:
+            return await self._get_habit(session, habit_id)
+
+    async def delete_habit(self, habit_id: int) -> None:
+        async with self._session_scope() as session:
+            for statement in HabitTracker._delete_habits_statements(Habit.id == habit_id):
+                result = await session.execute(statement, execution_options={"synchronize_session": False})
+            if not result.rowcount:
+                await session.rollback()
+                raise HabitNotFoundError(habit_not_found_message(habit_id))
+            await session.commit()
+            logger.info(f"Habit deleted: {habit_id}")
+
+    async def get_last_check_off_for_habit(self, habit_id: int) -> Optional[CheckOff]:
+        async with self._session_scope() as session:
+            check_off = await session.scalar(
+                select(CheckOff).filter_by(habit_id=habit_id).order_by(CheckOff.date_time.desc()).limit(1)
+            )
+            history = (await self._archived_histories(session, Habit.id == habit_id)).get(habit_id)
+            if history is not None:
+                check_off_id, date_time = last_check_off(history)
+                if check_off is None or date_time > check_off.date_time:
+                    check_off = CheckOff(id=check_off_id, habit_id=habit_id, date_time=date_time, day=date_time.date())
+            return check_off
+
+    async def get_all_check_offs_for_habit(
+        self,
+        habit_id: int,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[CheckOff]:
+        async with self._session_scope() as session:
+            statement = HabitTracker._filter_check_offs(select(CheckOff).filter_by(habit_id=habit_id), after_id, limit, since, until)
+            live = list(await session.scalars(statement))
+            histories = await self._archived_histories(session, Habit.id == habit_id, since, until)
+            return HabitTracker._merge_archived_check_offs(live, histories, after_id, limit, since, until)
+
+    async def get_longest_check_off_streak_for_habit(self, habit_id: int) -> int:
+        async with self._session_scope() as session:
+            habit = await self._get_habit(session, habit_id)
+            if habit.streak is not None:
+                return habit.streak.longest_streak
+
+            check_offs = await session.scalars(
+                select(CheckOff.date_time).filter_by(habit_id=habit_id).order_by(CheckOff.date_time.asc())
+            )
+            rows = [(habit_id, habit.periodicity, date_time) for date_time in check_offs] or [(habit_id, habit.periodicity, None)]
+            rows = merge_archived(rows, await self._archived_histories(session, Habit.id == habit_id))
+            return longest_streaks(rows).get(habit_id, 0)
+
+    async def get_longest_check_off_streaks(self) -> Dict[int, int]:
+        async with self._session_scope() as session:
+            result = await session.execute(
+                select(Habit.id, Habit.periodicity, CheckOff.date_time)
+                .outerjoin(CheckOff, CheckOff.habit_id == Habit.id)
+                .order_by(Habit.id, CheckOff.date_time)
+            )
+            return longest_streaks(merge_archived(result.all(), await self._archived_histories(session)))
+
+    async def get_longest_streak_of_all_habits(self) -> Tuple[int, Optional[int]]:
+        longest_streak = 0
+        habit_with_longest_streak = None
+
+        for habit_id, streak in (await self.get_longest_check_off_streaks()).items():
+            if streak > longest_streak:
+                longest_streak = streak
+                habit_with_longest_streak = habit_id
+
+        return longest_streak, habit_with_longest_streak
@@ -0,0 +1,155 @@
+"""
+Measure how the check-off, listing and streak hot paths of HabitTracker scale on synthetic data.
+
+Usage:
+    python benchmarks/bench_hot_paths.py [--habits 100] [--days 365] [--weekly-ratio 0.2] [--repeats 5]
+                                         [--save-baseline benchmarks/baseline.json]
+                                         [--compare benchmarks/baseline.json] [--tolerance 0.25]
+
+Every case reports the median time per call over --repeats runs and the peak memory allocated by one call.
+--save-baseline writes the results with the data size they were measured on; --compare measures on data generated with
+the parameters of the baseline and exits with status 1 when a case is slower than its baseline by more than --tolerance,
+so regressions in these paths can be caught in CI. Timings depend on the machine: benchmarks/baseline.json is a small
+reference run, to be saved again on the machine that compares against it.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from habit_tracker import HabitTracker  # noqa: E402
+from synthetic_data import DEFAULT_START_DATE, generate_synthetic_data  # noqa: E402
+
+# Parameters of the generated data, taken from the baseline when comparing against it
+DATA_PARAMETERS = ("habits", "days", "weekly_ratio", "check_off_ratio", "seed")
+
+
+def measure(function, repeats):
+    """
+    Return the median seconds of a call to function and the peak bytes it allocated.
+    function is called with the index of the run, so cases that write can use a fresh day per run.
+    """
+    timings = []
+    for run in range(repeats):
+        start = time.perf_counter()
+        function(run)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function(repeats)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def benchmark_cases(habit_tracker, habit_ids, days):
+    # Check-offs after the end of the generated history, one week per run so weekly habits accept them too
+    first_free_day = DEFAULT_START_DATE + timedelta(days=days + 7)
+    sample_habit_id = habit_ids[len(habit_ids) // 2]
+
+    def check_off_all_habits(run):
+        check_off_date = first_free_day + timedelta(weeks=run)
+        for habit_id in habit_ids:
+            habit_tracker.check_off_habit(habit_id, check_off_date)
+
+    def check_off_all_habits_write_behind(run):
+        # Weeks after those of check_off_all_habits, so both cases can run on the same data
+        check_off_date = first_free_day + timedelta(weeks=run + 1000)
+        with habit_tracker.write_behind() as queue:
+            for habit_id in habit_ids:
+                queue.check_off_habit(habit_id, check_off_date)
+
+    return {
+        "check_off_habit": (check_off_all_habits, len(habit_ids)),
+        "check_off_habit_write_behind": (check_off_all_habits_write_behind, len(habit_ids)),
+        "get_all_check_offs": (lambda run: habit_tracker.get_all_check_offs(), 1),
+        "get_all_check_offs_page": (lambda run: habit_tracker.get_all_check_offs(after_id=days, limit=100), 1),
+        "get_check_off_rows": (lambda run: habit_tracker.get_check_off_rows(), 1),
+        "get_longest_check_off_streak_for_habit": (
+            lambda run: habit_tracker.get_longest_check_off_streak_for_habit(sample_habit_id), 1,
+        ),
+        "get_longest_check_off_streaks": (lambda run: habit_tracker.get_longest_check_off_streaks(), 1),
+        "get_longest_streak_of_all_habits": (lambda run: habit_tracker.get_longest_streak_of_all_habits(), 1),
+        "get_period_streaks": (lambda run: habit_tracker.get_period_streaks(), 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the cases slower than their baseline by more than tolerance, as (name, seconds, baseline seconds).
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected and result["seconds"] > expected["seconds"] * (1 + tolerance):
+            regressions.append((name, result["seconds"], expected["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--habits", type=int, default=100)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--weekly-ratio", type=float, default=0.2)
+    parser.add_argument("--check-off-ratio", type=float, default=0.8)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", default=None)
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        for name in DATA_PARAMETERS:
+            setattr(args, name, baseline["parameters"][name])
+
+    with tempfile.TemporaryDirectory() as directory:
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{os.path.join(directory, 'bench.db')}")
+
+        start = time.perf_counter()
+        habit_ids, check_offs = generate_synthetic_data(
+            habit_tracker,
+            habits=args.habits,
+            days=args.days,
+            weekly_ratio=args.weekly_ratio,
+            check_off_ratio=args.check_off_ratio,
+            seed=args.seed,
+        )
+        print(f"Generated {len(habit_ids)} habits and {check_offs} check-offs in {time.perf_counter() - start:.2f} s")
+
+        results = {}
+        for name, (function, calls) in benchmark_cases(habit_tracker, habit_ids, args.days).items():
+            seconds, peak = measure(function, args.repeats)
+            results[name] = {"seconds": seconds / calls, "peak_bytes": peak}
+            print(f"{name:42} {seconds / calls * 1000:10.3f} ms {peak / 1024:10.1f} KiB")
+
+        habit_tracker.engine.dispose()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump({"parameters": vars(args) | {"check_offs": check_offs}, "results": results}, file, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for name, seconds, expected in regressions:
+            print(f"{name} regressed: {seconds * 1000:.3f} ms, baseline {expected * 1000:.3f} ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measure the startup cost of the CLI: importing cli.py and running a command end to end.
+
+Usage:
+    python benchmarks/bench_import.py [--runs 20] [--max-import-ms 150]
+
+Exits with status 1 when the median import time exceeds --max-import-ms, so it can guard against regressions in CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_command(args, runs, cwd):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    env_python = [sys.executable, "-c"]
+    baseline = time_command(env_python + ["pass"], args.runs, ROOT)
+    import_cli = time_command(env_python + [f"import sys; sys.path.insert(0, {ROOT!r}); import cli"], args.runs, ROOT)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cli = os.path.join(ROOT, "cli.py")
+        time_command([sys.executable, cli, "list_habits", "--limit", "1"], 1, directory)
+        list_habits = time_command([sys.executable, cli, "list_habits", "--limit", "1"], args.runs, directory)
+
+    print(f"python startup:         {baseline:8.1f} ms")
+    print(f"import cli:             {import_cli - baseline:8.1f} ms")
+    print(f"cli.py list_habits:     {list_habits - baseline:8.1f} ms")
+
+    if args.max_import_ms is not None and import_cli - baseline > args.max_import_ms:
+        print(f"Import time exceeds {args.max_import_ms} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
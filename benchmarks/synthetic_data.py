@@ -0,0 +1,82 @@
+"""
+Generate synthetic habits and check-off histories for benchmarks.
+
+Unlike HabitTracker.generate_example_data, which validates every check-off, the histories are valid by construction
+(at most one check-off per day for daily habits, one every 7 days or more for weekly habits), so they are inserted
+with multi-row INSERTs and the streak cache and rollups are computed once at the end.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import insert
+
+from constants import BULK_CHECK_OFF_BATCH_SIZE, PERIODICITY_DAILY, PERIODICITY_WEEKLY
+from habit import Habit, CheckOff
+from habit_tracker import HabitTracker
+from streaks import streak_interval
+
+DEFAULT_START_DATE = datetime(2020, 1, 1, 8)
+
+
+def generate_synthetic_data(
+    habit_tracker: HabitTracker,
+    habits: int = 100,
+    days: int = 365,
+    weekly_ratio: float = 0.2,
+    check_off_ratio: float = 0.8,
+    start_date: datetime = DEFAULT_START_DATE,
+    seed: int = 0,
+) -> Tuple[List[int], int]:
+    """
+    Add habits, a weekly_ratio share of them weekly, each with a history of days days starting at start_date
+    in which every period is checked off with probability check_off_ratio.
+    The same arguments always generate the same data.
+    Returns the ids of the added habits and the number of added check-offs.
+    """
+    rng = random.Random(seed)
+    periodicities = [
+        PERIODICITY_WEEKLY if rng.random() < weekly_ratio else PERIODICITY_DAILY
+        for _ in range(habits)
+    ]
+
+    with habit_tracker._session_scope() as session:
+        habit_ids = list(session.scalars(
+            insert(Habit).returning(Habit.id, sort_by_parameter_order=True),
+            [
+                {
+                    "name": f"Habit {index}",
+                    "description": f"Synthetic habit {index}",
+                    "periodicity": periodicity,
+                    "creation_date": start_date,
+                }
+                for index, periodicity in enumerate(periodicities)
+            ],
+        ))
+
+        count = 0
+        check_offs = _check_off_rows(rng, habit_ids, periodicities, days, check_off_ratio, start_date)
+        for batch in HabitTracker._batched(check_offs, BULK_CHECK_OFF_BATCH_SIZE):
+            session.execute(insert(CheckOff), batch)
+            count += len(batch)
+        session.commit()
+
+    habit_tracker.rebuild_streak_cache()
+    habit_tracker.rebuild_rollups()
+    return habit_ids, count
+
+
+def _check_off_rows(
+    rng: random.Random,
+    habit_ids: List[int],
+    periodicities: List[int],
+    days: int,
+    check_off_ratio: float,
+    start_date: datetime,
+) -> Iterator[dict]:
+    for habit_id, periodicity in zip(habit_ids, periodicities):
+        for offset in range(0, days, streak_interval(periodicity)):
+            if rng.random() < check_off_ratio:
+                # Vary the time of day without leaving the day, so daily habits never get two check-offs a day
+                date_time = start_date + timedelta(days=offset, minutes=rng.randrange(12 * 60))
+                yield {"habit_id": habit_id, "date_time": date_time, "day": date_time.date()}
@@ -0,0 +1,156 @@
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+from streaks import streak_interval
+
+
+def _popcount(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+# int.bit_count is only available from Python 3.10
+popcount = getattr(int, "bit_count", _popcount)
+
+
+def longest_run(bits: int) -> int:
+    """
+    Return the length of the longest run of set bits, in O(log n) big integer operations.
+    """
+    if not bits:
+        return 0
+
+    # runs[j] has bit i set when bits i to i + 2^j - 1 are all set
+    runs = [bits]
+    while True:
+        longer = runs[-1] & (runs[-1] >> (1 << (len(runs) - 1)))
+        if not longer:
+            break
+        runs.append(longer)
+
+    # Extend the longest power of two run with shorter ones, longest first
+    length = 1 << (len(runs) - 1)
+    starts = runs[-1]
+    for j in range(len(runs) - 2, -1, -1):
+        extended = starts & (runs[j] >> length)
+        if extended:
+            starts = extended
+            length += 1 << j
+    return length
+
+
+def run_ending_at(bits: int, index: int) -> int:
+    """
+    Return the number of consecutive set bits ending at bit index, 0 if it is not set.
+    """
+    if index < 0:
+        return 0
+    mask = (1 << (index + 1)) - 1
+    unset = ~bits & mask
+    return index + 1 if not unset else index + 1 - unset.bit_length()
+
+
+def count_range(bits: int, start: int, stop: int) -> int:
+    """
+    Return the number of set bits from bit start to bit stop, excluded.
+    """
+    start = max(start, 0)
+    if stop <= start:
+        return 0
+    return popcount((bits >> start) & ((1 << (stop - start)) - 1))
+
+
+class PeriodHistory(NamedTuple):
+    """
+    Check-off history of a habit as a bitset: bit N is set when the habit was checked off in the Nth period (day or
+    week, by periodicity) from origin, the creation day of the habit, or the day of its first check-off if earlier.
+    A decade of daily history fits in 457 bytes; streaks and counts are a few big integer operations.
+    """
+    periodicity: int
+    origin: Optional[date] = None
+    bits: int = 0
+
+    @classmethod
+    def from_blob(cls, periodicity: int, origin: Optional[date], blob: Optional[bytes]) -> "PeriodHistory":
+        return cls(periodicity, origin, int.from_bytes(blob or b"", "little"))
+
+    def to_blob(self) -> bytes:
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+
+    def index(self, day: date) -> int:
+        """
+        Return the period of day, negative before origin.
+        """
+        return (day - self.origin).days // streak_interval(self.periodicity)
+
+    def with_check_off(self, day: date) -> "PeriodHistory":
+        """
+        Return the history with the period of day checked off. A day before origin moves origin back.
+        """
+        if self.origin is None:
+            return self._replace(origin=day, bits=1)
+
+        index = self.index(day)
+        if index >= 0:
+            return self._replace(bits=self.bits | (1 << index))
+        origin = self.origin + timedelta(days=index * streak_interval(self.periodicity))
+        return self._replace(origin=origin, bits=(self.bits << -index) | 1)
+
+    def is_checked_off(self, day: date) -> bool:
+        if self.origin is None or day < self.origin:
+            return False
+        return bool(self.bits >> self.index(day) & 1)
+
+    def longest_streak(self) -> int:
+        """
+        Return the largest number of consecutive periods checked off.
+        """
+        return longest_run(self.bits)
+
+    def current_streak(self, today: date) -> int:
+        """
+        Return the number of consecutive periods checked off up to the period of today,
+        or up to the previous period while the one of today is not checked off yet.
+        """
+        if self.origin is None or today < self.origin:
+            return 0
+        index = self.index(today)
+        return run_ending_at(self.bits, index) or run_ending_at(self.bits, index - 1)
+
+    def count(self, since: date, until: date) -> int:
+        """
+        Return the number of checked off periods overlapping the days from since to until, excluded.
+        """
+        if self.origin is None or until <= since:
+            return 0
+        return count_range(self.bits, self.index(since), self.index(until - timedelta(days=1)) + 1)
+
+
+def history_states(rows: Sequence[Tuple[int, int, Optional[datetime], Optional[datetime]]]) -> Dict[int, dict]:
+    """
+    Return the history columns of HabitStreak per habit
+    from (habit_id, periodicity, creation_date, date_time) rows ordered by habit.
+    """
+    states = {}
+    for habit_id, habit_rows in groupby(rows, key=itemgetter(0)):
+        history = None
+        for _, periodicity, creation_date, date_time in habit_rows:
+            if history is None:
+                history = PeriodHistory(periodicity, creation_date.date() if creation_date else None)
+            if date_time is not None:
+                history = history.with_check_off(date_time.date())
+        states[habit_id] = {"history_origin": history.origin, "history": history.to_blob()}
+    return states
+
+
+def add_to_history(streak, periodicity: int, creation_date: Optional[datetime], check_off_date: datetime) -> None:
+    """
+    Check off the period of check_off_date in the history columns of a HabitStreak.
+    """
+    origin = streak.history_origin
+    if origin is None and creation_date is not None:
+        origin = creation_date.date()
+    history = PeriodHistory.from_blob(periodicity, origin, streak.history).with_check_off(check_off_date.date())
+    streak.history_origin = history.origin
+    streak.history = history.to_blob()
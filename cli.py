@@ -1,62 +1,240 @@
+import os
 from datetime import datetime
 
-import fire
-
+from config import load_config
 from constants import PERIODICITY_DAILY, PERIODICITY_WEEKLY
-from exceptions import MultipleCheckOffError
-from habit_tracker import HabitTracker
+from exceptions import DaemonError, MultipleCheckOffError
 
 
 class Cli:
 
-    def __init__(self):
-        self.habit_tracker = HabitTracker()
+    def __init__(self, config=None):
+        self._config_path = config
+        self._config = None
+        self._habit_tracker = None
+        self._client = None
+
+    def _settings(self):
+        if self._config is None:
+            self._config = load_config(self._config_path)
+        return self._config
+
+    def _tracker(self):
+        # Created on first use so SQLAlchemy is only imported, and the database only opened, when a command needs it.
+        # A method rather than a property, because Fire evaluates properties when it prints help.
+        if self._habit_tracker is None:
+            if self._settings()["shards"] > 1:
+                from sharding import ShardedHabitTracker
+                self._habit_tracker = ShardedHabitTracker(config=self._settings())
+            else:
+                from habit_tracker import HabitTracker
+                self._habit_tracker = HabitTracker(config=self._settings())
+        return self._habit_tracker
+
+    def _call(self, method, **params):
+        """
+        Run a daemon API method through the daemon when it is running, otherwise on a local tracker.
+        Both paths return the same JSON serializable results.
+        """
+        socket_path = self._settings()["daemon_socket_path"]
+        if self._client is None and os.path.exists(socket_path):
+            from client import HabitTrackerClient
+            try:
+                # Without a timeout, as imports and rebuilds run by the daemon can take longer than a query
+                self._client = HabitTrackerClient(socket_path, timeout=None)
+            except DaemonError:
+                pass
+        if self._client is not None:
+            return self._client.call(method, **params)
+
+        from server import dispatch
+        return dispatch(self._tracker(), method, params)
+
+    def serve(self):
+        from server import serve
+        socket_path = self._settings()["daemon_socket_path"]
+        print(f"Serving on {socket_path}. Press Ctrl+C to stop.")
+        serve(self._tracker(), socket_path)
 
     def create_habit(self, name, description, periodicity):
-        self.habit_tracker.add_habit(name=name, description=description, periodicity=periodicity)
-        return self.habit_tracker.get_habits()
+        self._call("add_habit", name=name, description=description, periodicity=periodicity)
+        return self._call("get_habit_rows")
 
-    def list_habits(self):
-        return self.habit_tracker.get_habits()
+    def list_habits(self, limit=None, after=None):
+        return self._call("get_habit_rows", after_id=after, limit=limit)
 
     def habit_details(self, habit_id):
-        return self.habit_tracker.get_habit(habit_id=habit_id)
-    
+        return self._call("get_habit", habit_id=habit_id)
+
     def delete_habit(self, habit_id):
-        self.habit_tracker.delete_habit(habit_id=habit_id)
+        self._call("delete_habit", habit_id=habit_id)
         print(f"Habit {habit_id} has been deleted successfully.")
 
+    def delete_habits(self, *habit_ids):
+        count = self._call("delete_habits", habit_ids=list(habit_ids))
+        print(f"{count} habits have been deleted successfully.")
+
+    def delete_habits_where(self, periodicity=None, created_before=None, name=None):
+        count = self._call(
+            "delete_habits_where",
+            periodicity=periodicity,
+            created_before=self._parse_date_param(created_before),
+            name=name,
+        )
+        print(f"{count} habits have been deleted successfully.")
+
     def delete_all_habits(self):
-        self.habit_tracker.delete_all_habits()
+        self._call("delete_all_habits")
         print("All habits have been deleted successfully.")
 
     def check_off_habit(self, habit_id):
         try:
-            self.habit_tracker.check_off_habit(habit_id=habit_id)
+            self._call("check_off_habit", habit_id=habit_id)
             print(f"Checked off for habit {habit_id}")
         except MultipleCheckOffError as e:
             print(e)
 
-    def get_all_check_offs_for_habit(self, habit_id):
-        return self.habit_tracker.get_all_check_offs_for_habit(habit_id=habit_id)
+    def get_all_check_offs_for_habit(self, habit_id, limit=None, after=None, since=None, until=None):
+        return self._call(
+            "get_check_off_rows",
+            habit_id=habit_id,
+            after_id=after,
+            limit=limit,
+            since=self._parse_date_param(since),
+            until=self._parse_date_param(until),
+        )
 
     def get_last_check_off_from_habit(self, habit_id):
-        check_off = self.habit_tracker.get_last_check_off_for_habit(habit_id=habit_id)
-        if check_off:
-            return "Last check off was " + str(check_off.date_time)
+        date_time = self._call("get_last_check_off_for_habit", habit_id=habit_id)
+        if date_time:
+            return "Last check off was " + str(datetime.fromisoformat(date_time))
         return "No check offs yet"
 
-    def get_all_check_offs(self):
-        return self.habit_tracker.get_all_check_offs()
+    def get_all_check_offs(self, limit=None, after=None, since=None, until=None):
+        return self._call(
+            "get_check_off_rows",
+            after_id=after,
+            limit=limit,
+            since=self._parse_date_param(since),
+            until=self._parse_date_param(until),
+        )
 
     def get_longest_check_off_streak_for_habit(self, habit_id):
-        return self.habit_tracker.get_longest_check_off_streak_for_habit(habit_id=habit_id)
+        return self._call("get_longest_check_off_streak_for_habit", habit_id=habit_id)
 
-    def get_longest_check_off_streak_of_all_habits(self):
-        longest_streak, habit_id = self.habit_tracker.get_longest_streak_of_all_habits()
+    def get_longest_check_off_streak_of_all_habits(self, workers=None):
+        longest_streak, habit_id = self._call("get_longest_streak_of_all_habits", workers=workers)
 
         print(f"The longest streak is {longest_streak} days for habit {habit_id}.")
 
+    def get_longest_check_off_streaks(self, workers=None):
+        return dict(self._call("get_longest_check_off_streaks", workers=workers))
+
+    def get_current_streak(self, habit_id):
+        return self._call("get_current_streak", habit_id=habit_id)
+
+    def dashboard(self, at_risk=False):
+        rows = self._call("get_dashboard", at_risk_only=at_risk)
+        print(f"{'id':>5} {'name':30} {'periodicity':11} {'current':>7} {'longest':>7} {'last check off':16}")
+        for habit_id, name, periodicity, current_streak, longest_streak, last_check_off, is_at_risk in rows:
+            periodicity_name = "daily" if periodicity == PERIODICITY_DAILY else "weekly"
+            last_check_off = datetime.fromisoformat(last_check_off).strftime("%Y-%m-%d %H:%M") if last_check_off else "never"
+            marker = "  at risk" if is_at_risk else ""
+            print(f"{habit_id:5} {name:30} {periodicity_name:11} {current_streak:7} {longest_streak:7} {last_check_off:16}{marker}")
+
+    def get_habits_at_risk(self):
+        self.dashboard(at_risk=True)
+
+    def check_off_counts(self, period="day", since=None, until=None, habit_id=None):
+        counts = self._call(
+            "get_check_off_counts",
+            period=period,
+            since=self._parse_date_param(since),
+            until=self._parse_date_param(until),
+            habit_id=habit_id,
+        )
+        for label, count in zip(counts["period"], counts["check_offs"]):
+            print(f"{label:10} {count:7}")
+
+    def completion_rates(self, since=None, until=None, habit_id=None):
+        rates = self._call(
+            "get_completion_rates",
+            since=self._parse_date_param(since),
+            until=self._parse_date_param(until),
+            habit_id=habit_id,
+        )
+        print(f"{'id':>5} {'name':30} {'check offs':>10} {'expected':>8} {'rate':>6}")
+        for habit_id, name, check_offs, expected, rate in zip(
+            rates["habit_id"], rates["name"], rates["check_offs"], rates["expected"], rates["completion_rate"],
+        ):
+            rate = f"{rate:6.0%}" if rate is not None else f"{'-':>6}"
+            print(f"{habit_id:5} {name:30} {check_offs:10} {expected:8} {rate}")
+
+        expected = sum(rates["expected"])
+        if expected:
+            print(f"Overall completion rate: {sum(rates['check_offs']) / expected:.0%}")
+
+    def period_streaks(self, since=None, until=None):
+        streaks = self._call("get_period_streaks")
+        checked_off = dict(self._call(
+            "get_checked_off_periods", since=self._parse_date_param(since), until=self._parse_date_param(until),
+        ))
+        print(f"{'id':>5} {'current':>7} {'longest':>7} {'in range':>8}")
+        for habit_id, current_streak, longest_streak in streaks:
+            print(f"{habit_id:5} {current_streak:7} {longest_streak:7} {checked_off.get(habit_id, 0):8}")
+
+    def stats(self, prometheus=False):
+        snapshot = self._call("get_stats")
+        if snapshot is None:
+            print("Instrumentation is off. Enable the instrumentation setting to collect statistics.")
+            return
+        if prometheus:
+            from instrumentation import to_prometheus
+            print(to_prometheus(snapshot), end="")
+            return
+
+        print(f"{'operation':42} {'calls':>7} {'errors':>7} {'mean ms':>10} {'statements':>11} {'max':>5} {'rows':>9}")
+        for name, operation in snapshot["operations"].items():
+            calls = operation["count"]
+            print(
+                f"{name:42} {calls:7} {operation['errors']:7} {operation['seconds'] / calls * 1000:10.3f} "
+                f"{operation['statements'] / calls:11.1f} {operation['max_statements']:5} {operation['rows'] / calls:9.1f}"
+            )
+        for cache, counters in snapshot["caches"].items():
+            print(f"cache {cache}: {counters['hits']} hits, {counters['misses']} misses")
+        print(f"{snapshot['statements']} SQL statements in total")
+
+    def export_data(self, kind, path, fmt=None):
+        if kind not in ("habits", "check_offs"):
+            raise ValueError(f"Invalid kind {kind}. Use habits or check_offs.")
+        # The daemon runs in another working directory
+        count = self._call(f"export_{kind}", path=os.path.abspath(path), fmt=fmt)
+        print(f"Exported {count} {kind} to {path}.")
+
+    def import_data(self, kind, path, fmt=None):
+        if kind == "habits":
+            count = self._call("import_habits", path=os.path.abspath(path), fmt=fmt)
+            print(f"Imported {count} habits from {path}.")
+        elif kind == "check_offs":
+            count, rejected = self._call("import_check_offs", path=os.path.abspath(path), fmt=fmt)
+            print(f"Imported {count} check_offs from {path}, {len(rejected)} rejected.")
+            for habit_id, check_off_date, reason in rejected:
+                print(f"Rejected check off of habit {habit_id} at {check_off_date}: {reason}")
+        else:
+            raise ValueError(f"Invalid kind {kind}. Use habits or check_offs.")
+
+    def rebuild_streak_cache(self, workers=None):
+        count = self._call("rebuild_streak_cache", workers=workers)
+        print(f"Streak cache rebuilt for {count} habits.")
+
+    def rebuild_rollups(self):
+        count = self._call("rebuild_rollups")
+        print(f"Rollups rebuilt: {count} habit months.")
+
+    def archive_check_offs(self, before):
+        count = self._call("archive_check_offs", before=self._parse_date_param(before))
+        print(f"Archived {count} check offs before {before}.")
+
     def generate_example_data(self, start_date, weeks=4):
         predefined_habits = [
             {"name": "Drink Water", "description": "Drink 2 liters of water", "periodicity": PERIODICITY_DAILY},
@@ -66,16 +244,31 @@ class Cli:
             {"name": "Grocery Shopping", "description": "Do grocery shopping", "periodicity": PERIODICITY_WEEKLY},
         ]
 
+        parsed_date = self._parse_date(start_date)
+
+        print(f"Generating data starting from {parsed_date} for {weeks} weeks...")
+
+        return self._call(
+            "generate_example_data", predefined_habits=predefined_habits, start_date=parsed_date.isoformat(), weeks=weeks,
+        )
+
+    @staticmethod
+    def _parse_date(value):
+        if value is None:
+            return None
         try:
             # check if date is valid
-            parsed_date = datetime.strptime(start_date, "%Y-%m-%d")
+            return datetime.strptime(str(value), "%Y-%m-%d")
         except ValueError:
-            raise ValueError(f"Invalid date {start_date}. Use format YYYY-MM-DD.")
+            raise ValueError(f"Invalid date {value}. Use format YYYY-MM-DD.")
 
-        print(f"Generating data starting from {parsed_date} for {weeks} weeks...")
-
-        return self.habit_tracker.generate_example_data(predefined_habits, parsed_date, weeks)
+    @staticmethod
+    def _parse_date_param(value):
+        parsed_date = Cli._parse_date(value)
+        return parsed_date.isoformat() if parsed_date else None
 
 
 if __name__ == "__main__":
+    import fire
+
     fire.Fire(Cli)
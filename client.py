@@ -0,0 +1,69 @@
+import json
+import os
+import socket
+from typing import Any, Optional
+
+from constants import DAEMON_SOCKET_PATH
+from exceptions import DaemonError, HabitNotFoundError, InvalidStartDateError, MultipleCheckOffError
+
+# Error types reported by the daemon that are raised as the same exception on the client
+ERRORS = {
+    error.__name__: error
+    for error in (HabitNotFoundError, InvalidStartDateError, MultipleCheckOffError, ValueError, TypeError, DaemonError)
+}
+
+
+class HabitTrackerClient:
+    """
+    Thin client for the habit tracker daemon. It only depends on the standard library, so it is cheap to import,
+    and keeps its connection open so automation can send many requests over it.
+    """
+
+    def __init__(self, socket_path: str = DAEMON_SOCKET_PATH, timeout: Optional[float] = 10.0):
+        self.socket_path = socket_path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(socket_path)
+        except OSError as e:
+            self._socket.close()
+            raise DaemonError(f"Cannot connect to the daemon on {socket_path}: {e}")
+        self._file = self._socket.makefile("rwb")
+
+    @staticmethod
+    def is_running(socket_path: str = DAEMON_SOCKET_PATH) -> bool:
+        if not os.path.exists(socket_path):
+            return False
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_path)
+            except OSError:
+                return False
+        return True
+
+    def call(self, method: str, **params) -> Any:
+        try:
+            self._file.write(json.dumps({"method": method, "params": params}).encode() + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        except OSError as e:
+            # A late response would be read as the answer to the next request, so the connection is not reused
+            self.close()
+            raise DaemonError(f"The daemon did not answer {method}: {e}")
+        if not line:
+            raise DaemonError("The daemon closed the connection.")
+
+        response = json.loads(line)
+        if "error" in response:
+            raise ERRORS.get(response["error"]["type"], DaemonError)(response["error"]["message"])
+        return response["result"]
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,88 @@
+import json
+import os
+from typing import Optional
+
+from constants import (
+    CONFIG_PATH,
+    DAEMON_SOCKET_PATH,
+    DATABASE_URL,
+    HABIT_CACHE_SIZE,
+    HABIT_CACHE_TTL_SECONDS,
+    POOL_MAX_OVERFLOW,
+    POOL_RECYCLE_SECONDS,
+    POOL_SIZE,
+    POOL_TIMEOUT_SECONDS,
+    SQLITE_PRAGMAS,
+    SUPPORTED_DATABASES,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_MAX_LATENCY_SECONDS,
+)
+
+CONFIG_PATH_ENV = "HABIT_TRACKER_CONFIG"
+ENV_PREFIX = "HABIT_TRACKER_"
+
+DEFAULT_CONFIG = {
+    "database_url": DATABASE_URL,
+    "pool_size": POOL_SIZE,
+    "max_overflow": POOL_MAX_OVERFLOW,
+    "pool_timeout": POOL_TIMEOUT_SECONDS,
+    "pool_recycle": POOL_RECYCLE_SECONDS,
+    "pool_pre_ping": False,
+    "sqlite_pragmas": SQLITE_PRAGMAS,
+    "daemon_socket_path": DAEMON_SOCKET_PATH,
+    "instrumentation": False,
+    "habit_cache_size": HABIT_CACHE_SIZE,
+    "habit_cache_ttl": HABIT_CACHE_TTL_SECONDS,
+    "write_behind_batch_size": WRITE_BEHIND_BATCH_SIZE,
+    "write_behind_max_latency": WRITE_BEHIND_MAX_LATENCY_SECONDS,
+    # Empty: next to the database file, see archive.resolve_archive_path
+    "archive_path": "",
+    # More than 1: habits are spread over that many databases, see sharding.ShardedHabitTracker
+    "shards": 1,
+}
+
+
+def load_config(path: Optional[str] = None, **overrides) -> dict:
+    """
+    Return the habit tracker settings. Each source overrides the previous one:
+    the defaults, a JSON config file (path, or $HABIT_TRACKER_CONFIG, or habit_tracker.json if it exists),
+    HABIT_TRACKER_<SETTING> environment variables, and finally the keyword arguments that are not None.
+    Unknown settings and databases other than SQLite and PostgreSQL raise a ValueError.
+    """
+    config = dict(DEFAULT_CONFIG)
+
+    path = path or os.environ.get(CONFIG_PATH_ENV)
+    if path or os.path.exists(CONFIG_PATH):
+        with open(path or CONFIG_PATH, encoding="utf-8") as file:
+            config.update(_check_keys(json.load(file)))
+
+    for key, default in DEFAULT_CONFIG.items():
+        value = os.environ.get(ENV_PREFIX + key.upper())
+        if value is not None:
+            config[key] = _parse_env_value(value, default)
+
+    config.update(_check_keys({key: value for key, value in overrides.items() if value is not None}))
+    _check_database_url(config["database_url"])
+    return config
+
+
+def _check_keys(settings: dict) -> dict:
+    unknown = set(settings) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}.")
+    return settings
+
+
+def _check_database_url(database_url: str) -> None:
+    # Parsed by hand rather than with SQLAlchemy's make_url, so loading the settings does not import SQLAlchemy
+    backend = database_url.partition(":")[0].partition("+")[0]
+    if backend not in SUPPORTED_DATABASES:
+        raise ValueError(f"Unsupported database {backend}. Use {' or '.join(SUPPORTED_DATABASES)}.")
+
+
+def _parse_env_value(value: str, default):
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes", "on")
+    if isinstance(default, dict):
+        return json.loads(value)
+    return type(default)(value)
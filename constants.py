@@ -1,4 +1,37 @@
 PERIODICITY_DAILY = 1
 PERIODICITY_WEEKLY = 2
 WEEKLY_CHECK_OFF_LIMIT_DAYS = 7
+DAILY_AT_RISK_DAYS = 1
+WEEKLY_AT_RISK_DAYS = 6
+PERIOD_DAY = "day"
+PERIOD_WEEK = "week"
+PERIOD_MONTH = "month"
+ANALYTICS_DEFAULT_DAYS = 30
 DATABASE_URL = "sqlite:///habit_tracker.db"
+# Backends of database URLs the SQL of the tracker is written for
+SUPPORTED_DATABASES = ("sqlite", "postgresql")
+SCHEMA_VERSION = 6
+BULK_CHECK_OFF_BATCH_SIZE = 1000
+BULK_QUERY_CHUNK_SIZE = 500
+STREAM_BATCH_SIZE = 1000
+HABIT_CACHE_SIZE = 4096
+HABIT_CACHE_TTL_SECONDS = 300
+WRITE_BEHIND_BATCH_SIZE = 500
+WRITE_BEHIND_MAX_LATENCY_SECONDS = 0.05
+SMALL_HISTORY_THRESHOLD = 256
+PARALLEL_SHARDS_PER_WORKER = 4
+DAEMON_SOCKET_PATH = "habit_tracker.sock"
+CONFIG_PATH = "habit_tracker.json"
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 10
+POOL_TIMEOUT_SECONDS = 30
+POOL_RECYCLE_SECONDS = -1
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,
+    "cache_size": -65536,
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+}
+LATENCY_BUCKETS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
@@ -0,0 +1,66 @@
+import csv
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Sequence, TextIO
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMATS = (FORMAT_CSV, FORMAT_JSONL)
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    """
+    Return the explicit format if given, otherwise guess it from the file extension.
+    """
+    if fmt is None:
+        fmt = FORMAT_JSONL if path.endswith((".jsonl", ".ndjson")) else FORMAT_CSV
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid format {fmt}. Use one of: {', '.join(FORMATS)}.")
+    return fmt
+
+
+def write_rows(file: TextIO, fields: Sequence[str], rows: Iterable[Sequence], fmt: str) -> int:
+    """
+    Write rows to a file one at a time, so memory use does not depend on the number of rows.
+    Datetimes are written in ISO format and None as an empty CSV value or JSON null.
+    Returns the number of rows written.
+    """
+    count = 0
+    if fmt == FORMAT_CSV:
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_serialize(value) for value in row])
+            count += 1
+    else:
+        for row in rows:
+            file.write(json.dumps({field: _serialize(value) for field, value in zip(fields, row)}))
+            file.write("\n")
+            count += 1
+    return count
+
+
+def read_rows(file: TextIO, fmt: str) -> Iterator[dict]:
+    """
+    Lazily read rows written by write_rows as dictionaries of strings (CSV) or JSON values (JSONL).
+    """
+    if fmt == FORMAT_CSV:
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_datetime(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def parse_optional(value) -> Optional[str]:
+    return value if value not in ("", None) else None
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
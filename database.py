@@ -0,0 +1,86 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+
+
+def create_database_engine(config: dict) -> Engine:
+    """
+    Create the engine for the configured database URL with the configured connection pool.
+    SQLite connections get the configured pragmas (WAL journal, busy timeout, ...) applied when they are opened,
+    so readers do not block the writer and concurrent writers wait instead of failing with "database is locked".
+    """
+    url = make_url(config["database_url"])
+    engine = create_engine(url, **_engine_options(url, config))
+    if url.get_backend_name() == "sqlite":
+        _apply_sqlite_pragmas(engine, config["sqlite_pragmas"])
+    return engine
+
+
+def create_async_database_engine(config: dict):
+    """
+    Create an asyncio engine for the configured database URL, with the same pool settings and SQLite pragmas
+    as create_database_engine. A plain sqlite URL is served by the aiosqlite driver.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    url = make_url(config["database_url"])
+    if url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+
+    options = _engine_options(url, config)
+    if "pool_size" in options:
+        # aiosqlite defaults to a pool that does not keep connections, which would ignore the pool settings
+        options["poolclass"] = AsyncAdaptedQueuePool
+
+    engine = create_async_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        # Pool events are emitted by the synchronous engine the asyncio engine proxies
+        _apply_sqlite_pragmas(engine.sync_engine, config["sqlite_pragmas"])
+    return engine
+
+
+def create_read_only_engine(config: dict) -> Engine:
+    """
+    Create an engine that only reads the configured database, for worker processes.
+    SQLite databases are opened in read-only mode, with the configured pragmas except the journal mode,
+    which needs write access to be set; other databases are opened as usual.
+    """
+    url = make_url(config["database_url"])
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, **_engine_options(url, config))
+    if is_in_memory_database(url):
+        raise ValueError("An in-memory database cannot be opened by another connection.")
+
+    url = url.set(database=f"file:{url.database}", query={**url.query, "mode": "ro", "uri": "true"})
+    engine = create_engine(url, **_engine_options(url, config))
+    _apply_sqlite_pragmas(engine, {
+        name: value for name, value in config["sqlite_pragmas"].items() if name != "journal_mode"
+    })
+    return engine
+
+
+def is_in_memory_database(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _engine_options(url: URL, config: dict) -> dict:
+    options = {"pool_pre_ping": config["pool_pre_ping"]}
+
+    # In-memory SQLite databases use a single connection pool that does not take pool sizes
+    if not is_in_memory_database(url):
+        options.update(
+            pool_size=config["pool_size"],
+            max_overflow=config["max_overflow"],
+            pool_timeout=config["pool_timeout"],
+            pool_recycle=config["pool_recycle"],
+        )
+    return options
+
+
+def _apply_sqlite_pragmas(engine: Engine, pragmas: dict) -> None:
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
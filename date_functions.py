@@ -0,0 +1,85 @@
+from sqlalchemy import Date, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# SQL date arithmetic differs between SQLite and PostgreSQL, so these functions are compiled for each dialect.
+# Their arguments are rendered in place and their format strings as literals, without bound parameters,
+# so the same expression in a SELECT and its GROUP BY compiles to the same SQL.
+
+
+class month_start(FunctionElement):
+    """
+    The first day of the month of a date, as a date.
+    """
+    type = Date()
+    name = "month_start"
+    inherit_cache = True
+
+
+@compiles(month_start)
+def _month_start(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)}, 'start of month')"
+
+
+@compiles(month_start, "postgresql")
+def _month_start_postgresql(element, compiler, **kw):
+    return f"CAST(date_trunc('month', {compiler.process(element.clauses, **kw)}) AS DATE)"
+
+
+class day_label(FunctionElement):
+    """
+    A date as a YYYY-MM-DD string.
+    """
+    type = String()
+    name = "day_label"
+    inherit_cache = True
+
+
+@compiles(day_label)
+def _day_label(element, compiler, **kw):
+    return f"strftime('%Y-%m-%d', {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(day_label, "postgresql")
+def _day_label_postgresql(element, compiler, **kw):
+    return f"to_char({compiler.process(element.clauses, **kw)}, 'YYYY-MM-DD')"
+
+
+class week_label(FunctionElement):
+    """
+    The Monday of the week of a date, as a YYYY-MM-DD string.
+    """
+    type = String()
+    name = "week_label"
+    inherit_cache = True
+
+
+@compiles(week_label)
+def _week_label(element, compiler, **kw):
+    # The next Sunday, or the day itself, 6 days back
+    return f"date({compiler.process(element.clauses, **kw)}, 'weekday 0', '-6 days')"
+
+
+@compiles(week_label, "postgresql")
+def _week_label_postgresql(element, compiler, **kw):
+    # PostgreSQL weeks start on Monday
+    return f"to_char(date_trunc('week', {compiler.process(element.clauses, **kw)}), 'YYYY-MM-DD')"
+
+
+class month_label(FunctionElement):
+    """
+    The month of a date, as a YYYY-MM string.
+    """
+    type = String()
+    name = "month_label"
+    inherit_cache = True
+
+
+@compiles(month_label)
+def _month_label(element, compiler, **kw):
+    return f"strftime('%Y-%m', {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(month_label, "postgresql")
+def _month_label_postgresql(element, compiler, **kw):
+    return f"to_char({compiler.process(element.clauses, **kw)}, 'YYYY-MM')"
@@ -16,3 +16,9 @@ class HabitNotFoundError(Exception):
     Exception raised for errors when a habit is not found.
     """
     pass
+
+class DaemonError(Exception):
+    """
+    Exception raised for errors when talking to the habit tracker daemon, or for unexpected errors reported by it.
+    """
+    pass
@@ -1,6 +1,6 @@
-from datetime import datetime
-from typing import Optional, List
-from sqlalchemy import String, Integer, TIMESTAMP, ForeignKey, BigInteger
+from datetime import date, datetime
+from typing import NamedTuple, Optional, List
+from sqlalchemy import String, Integer, TIMESTAMP, ForeignKey, BigInteger, Date, Index, LargeBinary
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -22,19 +22,121 @@ class Habit(Base):
         back_populates="habit",
         cascade="all, delete-orphan",
     )
+    streak: Mapped[Optional["HabitStreak"]] = relationship(
+        "HabitStreak",
+        back_populates="habit",
+        cascade="all, delete-orphan",
+        lazy="joined",
+    )
+    rollups: Mapped[List["CheckOffRollup"]] = relationship(
+        "CheckOffRollup",
+        back_populates="habit",
+        cascade="all, delete-orphan",
+    )
+    archived_check_offs: Mapped[List["ArchivedCheckOffs"]] = relationship(
+        "ArchivedCheckOffs",
+        back_populates="habit",
+        cascade="all, delete-orphan",
+    )
 
     def __repr__(self):
         return f"<Habit {self.id!r} - {self.name!r}>"
 
 
+class HabitMetadata(NamedTuple):
+    """
+    Immutable columns of a habit, as kept in the habit cache of HabitTracker.
+    """
+    id: int
+    name: str
+    periodicity: int
+    creation_date: datetime
+
+
+def _check_off_day(context) -> date:
+    date_time = context.get_current_parameters().get("date_time") or datetime.utcnow()
+    return date_time.date()
+
+
 class CheckOff(Base):
     __tablename__ = 'check_offs'
+    __table_args__ = (
+        Index("ix_check_offs_habit_id_date_time", "habit_id", "date_time"),
+        Index("ix_check_offs_date_time", "date_time"),
+        # A habit can be checked off at most once per day, so duplicate detection is an index probe
+        Index("ux_check_offs_habit_id_day", "habit_id", "day", unique=True),
+        # Ids of archived or deleted check-offs are not given out again, so pages after an id stay consistent
+        {"sqlite_autoincrement": True},
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     habit_id: Mapped[int] = mapped_column(ForeignKey("habits.id", ondelete="CASCADE"))
     date_time: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow)
+    day: Mapped[date] = mapped_column(Date, default=_check_off_day)
 
     habit: Mapped["Habit"] = relationship("Habit", back_populates="check_offs")
 
     def __repr__(self):
         return f"<CheckOff(id={self.id}, habit={self.habit_id} date_time={self.date_time})>"
+
+
+class HabitStreak(Base):
+    """
+    Materialized streak state of a habit, kept up to date on every check-off so streak reads are a primary key lookup.
+    """
+    __tablename__ = "habit_streaks"
+
+    habit_id: Mapped[int] = mapped_column(ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    current_streak: Mapped[int] = mapped_column(Integer, default=0)
+    current_streak_start: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP)
+    longest_streak: Mapped[int] = mapped_column(Integer, default=0)
+    last_check_off: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP)
+    # Checked off periods as a little-endian bitset, see bitmap.PeriodHistory
+    history_origin: Mapped[Optional[date]] = mapped_column(Date)
+    history: Mapped[Optional[bytes]] = mapped_column(LargeBinary)
+
+    habit: Mapped["Habit"] = relationship("Habit", back_populates="streak")
+
+    def __repr__(self):
+        return f"<HabitStreak(habit={self.habit_id}, current={self.current_streak}, longest={self.longest_streak})>"
+
+
+class CheckOffRollup(Base):
+    """
+    Number of check-offs and first and last check-off of a habit per month, kept up to date on every check-off
+    so analytics over whole months read one row per habit and month instead of every check-off.
+    """
+    __tablename__ = "check_off_rollups"
+
+    habit_id: Mapped[int] = mapped_column(ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    # First day of the month
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    check_offs: Mapped[int] = mapped_column(Integer, default=0)
+    first_check_off: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP)
+    last_check_off: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP)
+
+    habit: Mapped["Habit"] = relationship("Habit", back_populates="rollups")
+
+    def __repr__(self):
+        return f"<CheckOffRollup(habit={self.habit_id}, month={self.month}, check_offs={self.check_offs})>"
+
+
+class ArchivedCheckOffs(Base):
+    """
+    Offset index of the check-offs of a habit moved to a segment of the check-off archive, see archive.CheckOffArchive:
+    rows start to stop, excluded, of the columns of the segment. A deleted habit loses its index rows,
+    so its archived check-offs are no longer read, even by a new habit reusing its id.
+    """
+    __tablename__ = "archived_check_offs"
+
+    habit_id: Mapped[int] = mapped_column(ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    segment: Mapped[str] = mapped_column(String(64), primary_key=True)
+    start: Mapped[int] = mapped_column(Integer)
+    stop: Mapped[int] = mapped_column(Integer)
+    first_check_off: Mapped[datetime] = mapped_column(TIMESTAMP)
+    last_check_off: Mapped[datetime] = mapped_column(TIMESTAMP)
+
+    habit: Mapped["Habit"] = relationship("Habit", back_populates="archived_check_offs")
+
+    def __repr__(self):
+        return f"<ArchivedCheckOffs(habit={self.habit_id}, segment={self.segment!r}, check_offs={self.stop - self.start})>"
@@ -1,165 +1,1457 @@
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, func, literal
-from sqlalchemy.orm import sessionmaker
-import pandas as pd
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import heapq
+from itertools import groupby, islice
+from operator import itemgetter
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
 import logging
-from typing import Optional, List, Tuple, Type
+from typing import Dict, Iterable, Iterator, Optional, List, Tuple, Type
 
-from constants import DATABASE_URL, PERIODICITY_DAILY, PERIODICITY_WEEKLY, WEEKLY_CHECK_OFF_LIMIT_DAYS
+from analytics import analysis_range, archived_period_counts, expected_check_offs, period_bucket, split_by_month
+from archive import (
+    CheckOffArchive,
+    History,
+    archive_index_statement,
+    archived_days,
+    archived_rows,
+    last_check_off,
+    merge_archived,
+    merge_pages,
+    resolve_archive_path,
+    to_datetimes,
+    within,
+)
+from bitmap import PeriodHistory, add_to_history, history_states
+from cache import LRUCache
+from config import load_config
+from constants import (
+    BULK_CHECK_OFF_BATCH_SIZE,
+    BULK_QUERY_CHUNK_SIZE,
+    HABIT_CACHE_SIZE,
+    HABIT_CACHE_TTL_SECONDS,
+    PERIOD_DAY,
+    PERIOD_MONTH,
+    PERIODICITY_DAILY,
+    PERIODICITY_WEEKLY,
+    STREAM_BATCH_SIZE,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_MAX_LATENCY_SECONDS,
+)
+from data_io import detect_format, parse_datetime, parse_optional, read_rows, write_rows
+from database import create_database_engine, is_in_memory_database
+from date_functions import month_label
 from exceptions import HabitNotFoundError, InvalidStartDateError, MultipleCheckOffError
-from habit import Habit, CheckOff, Base
+from habit import ArchivedCheckOffs, Habit, CheckOff, CheckOffRollup, HabitMetadata, HabitStreak
+from instrumentation import Instrumentation, instrumented, record_cache, record_rows
+from migrations import upgrade_schema
+from parallel import map_habit_shards
+from rollups import add_to_rollups_statement, backfill_rollups_statement, rollup_rows
+from streaks import (
+    advance_streak,
+    is_streak_at_risk,
+    longest_streaks,
+    running_streak,
+    streak_interval,
+    streak_states,
+)
+from validation import (
+    DAILY_CHECK_OFF_LIMIT_MESSAGE,
+    WEEKLY_CHECK_OFF_LIMIT_MESSAGE,
+    daily_check_off_error,
+    habit_not_found_message,
+    weekly_check_off_error,
+)
+from write_behind import WriteBehindQueue
 
 # Configure logging
 logging.basicConfig(level=logging.CRITICAL)
 logger = logging.getLogger(__name__)
 
+HABIT_EXPORT_COLUMNS = (Habit.id, Habit.name, Habit.description, Habit.periodicity, Habit.creation_date)
+CHECK_OFF_EXPORT_COLUMNS = (CheckOff.habit_id, CheckOff.date_time)
+
 
 class HabitTracker:
-    def __init__(self, session: Optional[sessionmaker] = None):
-        if session:
-            self.session = session
+    def __init__(
+        self,
+        session: Optional[Session] = None,
+        database_url: Optional[str] = None,
+        config: Optional[dict] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        archive_path: Optional[str] = None,
+        shard: Optional[Tuple[int, int]] = None,
+    ):
+        """
+        Use the given session for every operation, or open a new session per operation on the configured database.
+        The database URL and pool settings come from config, or from load_config with database_url taking precedence.
+        Operations are recorded by the given instrumentation, or by a new one if the instrumentation setting is on.
+        Archived check-offs are read from archive_path, by default the configured archive of the database.
+        A tracker of shard (index, count) of a ShardedHabitTracker gives new habits the ids congruent to index + 1
+        modulo count.
+        """
+        self.session = session
+        self.instrumentation = instrumentation
+        self.shard = shard
+        self.archive = CheckOffArchive(archive_path) if archive_path else None
+        # Read-through cache of the immutable columns of habits, so check-offs do not load the habit row
+        self.habit_cache = LRUCache(HABIT_CACHE_SIZE, HABIT_CACHE_TTL_SECONDS)
+        if session is None:
+            self.config = config or load_config(database_url=database_url)
+            if self.instrumentation is None and self.config["instrumentation"]:
+                self.instrumentation = Instrumentation()
+            self.habit_cache = LRUCache(self.config["habit_cache_size"], self.config["habit_cache_ttl"])
+            if archive_path is None:
+                archive_path = resolve_archive_path(self.config)
+                self.archive = CheckOffArchive(archive_path) if archive_path else None
+            self.engine = create_database_engine(self.config)
+            upgrade_schema(self.engine, self.archive)
+            # Objects returned by an operation stay readable after its session is closed
+            self.session_factory = sessionmaker(bind=self.engine, expire_on_commit=False)
+            bind = self.engine
         else:
-            self.engine = create_engine(DATABASE_URL)
-            Base.metadata.create_all(self.engine)
-            Session = sessionmaker(bind=self.engine)
-            self.session = Session()
+            bind = session.get_bind()
+
+        if self.instrumentation is not None and isinstance(bind, Engine):
+            self.instrumentation.attach_engine(bind)
+
+    @contextmanager
+    def _session_scope(self) -> Iterator[Session]:
+        """
+        Provide the session of one operation. A session given to the constructor is shared by all operations;
+        otherwise each operation gets its own session, closed (and its transaction ended) when the operation returns,
+        so no connection or lock is held between operations.
+        """
+        if self.session is not None:
+            yield self.session
+            return
 
+        session = self.session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    @instrumented
     def add_habit(self, name: str, description: str, periodicity: int) -> Habit:
-        habit = Habit(name=name, description=description, periodicity=periodicity)
-        self.session.add(habit)
-        self.session.commit()
-        logger.info(f"Habit added: {habit}")
-        return habit
+        with self._session_scope() as session:
+            habit = Habit(name=name, description=description, periodicity=periodicity, streak=HabitStreak())
+            if self.shard is not None:
+                habit.id = self._next_habit_id()
+            session.add(habit)
+            session.commit()
+            self._cache_habit(habit)
+            logger.info(f"Habit added: {habit}")
+            return habit
 
-    def check_off_habit(self, habit_id: int, check_off_date: datetime = datetime.utcnow()) -> CheckOff:
+    @instrumented
+    def add_habits(self, habits: Iterable[dict], batch_size: int = BULK_CHECK_OFF_BATCH_SIZE) -> List[Habit]:
+        """
+        Add many habits, given as dicts of Habit columns (name, description, periodicity, ...), in a single transaction
+        with one multi-row INSERT per batch of batch_size habits. Returns the added habits in the given order.
+        """
+        with self._session_scope() as session:
+            added_habits = []
+            try:
+                statement = insert(Habit)
+                if self.shard is not None:
+                    statement = statement.values(id=self._next_habit_id())
+                for batch in self._batched(habits, batch_size):
+                    new_habits = list(session.scalars(
+                        statement.returning(Habit, sort_by_parameter_order=True),
+                        [dict(habit) for habit in batch],
+                    ))
+                    session.execute(insert(HabitStreak), [{"habit_id": habit.id} for habit in new_habits])
+                    added_habits.extend(new_habits)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+            for habit in added_habits:
+                self._cache_habit(habit)
+            logger.info(f"Habits added: {len(added_habits)}")
+            return added_habits
+
+    @instrumented
+    def check_off_habit(self, habit_id: int, check_off_date: Optional[datetime] = None) -> CheckOff:
+        # The default is resolved per call: a default argument would be frozen at import time,
+        # which matters for long-running processes such as the daemon
+        if check_off_date is None:
+            check_off_date = datetime.utcnow()
         date = check_off_date.date()
-        habit = self._get_habit(habit_id)
-        periodicity = habit.periodicity
 
-        if periodicity == PERIODICITY_DAILY:
-            return self._check_off_daily(habit_id, date, check_off_date)
-        elif periodicity == PERIODICITY_WEEKLY:
-            return self._check_off_weekly(habit_id, check_off_date)
+        with self._session_scope() as session:
+            # Every exit without a commit rolls back, so a shared session does not keep holding the write lock
+            try:
+                session.execute(self._lock_streak_statement(habit_id), execution_options={"synchronize_session": False})
+                habit, streak = self._get_habit_state(session, habit_id)
+                periodicity = habit.periodicity
+
+                if periodicity == PERIODICITY_DAILY:
+                    return self._check_off_daily(session, habit, streak, date, check_off_date)
+                elif periodicity == PERIODICITY_WEEKLY:
+                    return self._check_off_weekly(session, habit, streak, check_off_date)
+                session.rollback()
+            except BaseException:
+                session.rollback()
+                raise
+
+    @staticmethod
+    def _lock_streak_statement(habit_id: Optional[int] = None):
+        """
+        Return a no-op UPDATE of the streak row of a habit, or of every habit, run first in a check-off or streak cache
+        rebuild transaction so the streak row is read and written back under the write lock (SQLite) or row lock
+        (other databases) until the transaction ends. Concurrent check-offs of the habit wait for it instead of
+        overwriting each other's streak update.
+        """
+        statement = update(HabitStreak).values(habit_id=HabitStreak.habit_id)
+        if habit_id is not None:
+            statement = statement.where(HabitStreak.habit_id == habit_id)
+        return statement
 
-    def _get_habit(self, habit_id: int) -> Type[Habit]:
-        habit = self.session.get(Habit, habit_id)
+    def _get_habit(self, session: Session, habit_id: int) -> Type[Habit]:
+        habit = session.get(Habit, habit_id)
         if not habit:
-            raise HabitNotFoundError(f"Habit with id {habit_id} does not exist.")
+            raise HabitNotFoundError(habit_not_found_message(habit_id))
         return habit
 
-    def _check_off_daily(self, habit_id: int, date: datetime.date, check_off_date: datetime) -> CheckOff:
-        existing_check_off = (
-            self.session.query(CheckOff)
-            .filter_by(habit_id=habit_id)
-            .filter(func.date(CheckOff.date_time) == literal(date))
-            .first()
-        )
+    def _get_habit_state(self, session: Session, habit_id: int) -> Tuple[HabitMetadata, Optional[HabitStreak]]:
+        """
+        Return the metadata and the cached streak state of a habit.
+        Metadata found in the habit cache is not read again: only the streak row is, by primary key, with the creation
+        date of the habit. A habit deleted elsewhere can leave its id to a new habit, so the cached metadata is only used
+        if the creation dates match. Otherwise, or if the streak row is missing, the habit is loaded with its streak
+        and its metadata cached.
+        """
+        habit = self.habit_cache.get(habit_id)
+        record_cache("habit", habit is not None)
+        if habit is not None:
+            row = session.execute(
+                select(HabitStreak, Habit.creation_date)
+                .join(Habit, Habit.id == HabitStreak.habit_id)
+                .where(HabitStreak.habit_id == habit_id)
+            ).first()
+            if row is not None and row.creation_date == habit.creation_date:
+                return habit, row.HabitStreak
+
+        loaded_habit = self._get_habit(session, habit_id)
+        habit = self._cache_habit(loaded_habit)
+        return habit, loaded_habit.streak
+
+    def _next_habit_id(self):
+        """
+        Return the SQL expression of the next habit id of this shard, the largest id plus the shard count, evaluated by
+        the INSERT itself so concurrent writers cannot pick the same id.
+        """
+        index, count = self.shard
+        return select(func.coalesce(func.max(Habit.id) + count, index + 1)).scalar_subquery()
 
-        if existing_check_off:
-            raise MultipleCheckOffError("You can only check off once per day.")
+    def _cache_habit(self, habit: Habit) -> HabitMetadata:
+        metadata = HabitMetadata(habit.id, habit.name, habit.periodicity, habit.creation_date)
+        self.habit_cache.put(habit.id, metadata)
+        return metadata
+
+    def _check_off_daily(
+        self,
+        session: Session,
+        habit: HabitMetadata,
+        streak: Optional[HabitStreak],
+        date: datetime.date,
+        check_off_date: datetime,
+    ) -> CheckOff:
+        if streak is not None and (streak.last_check_off is None or check_off_date >= streak.last_check_off):
+            # Any check-off on the same day would be the last one, so the streak cache answers without a query
+            already_checked_off = streak.last_check_off is not None and streak.last_check_off.date() == date
+        else:
+            already_checked_off = self._is_checked_off(session, habit.id, date)
 
-        check_off = CheckOff(habit_id=habit_id, date_time=check_off_date)
-        self.session.add(check_off)
-        self.session.commit()
-        logger.info(f"Daily check-off added: {check_off}")
+        error = daily_check_off_error(already_checked_off)
+        if error:
+            raise MultipleCheckOffError(error)
+
+        return self._add_check_off(session, habit, streak, check_off_date, DAILY_CHECK_OFF_LIMIT_MESSAGE)
+
+    def _is_checked_off(self, session: Session, habit_id: int, day: date) -> bool:
+        """
+        Return whether a habit has a check-off on day, live or archived.
+        """
+        if session.query(CheckOff).filter_by(habit_id=habit_id).filter(CheckOff.day == day).first() is not None:
+            return True
+        day_start = datetime.combine(day, datetime.min.time())
+        histories = self._archived_histories(session, Habit.id == habit_id, day_start, day_start + timedelta(days=1))
+        return bool(archived_days(histories, [(habit_id, day)]))
+
+    def _check_off_weekly(
+        self,
+        session: Session,
+        habit: HabitMetadata,
+        streak: Optional[HabitStreak],
+        check_off_date: datetime,
+    ) -> CheckOff:
+        if streak is not None:
+            last_check_off = streak.last_check_off
+        else:
+            last_row = (
+                session.query(CheckOff.date_time)
+                .filter_by(habit_id=habit.id)
+                .order_by(CheckOff.date_time.desc())
+                .first()
+            )
+            last_check_off = last_row.date_time if last_row else None
+            archived_last_check_off = self._archived_last_check_offs(session, [habit.id]).get(habit.id)
+            if archived_last_check_off is not None and (last_check_off is None or archived_last_check_off > last_check_off):
+                last_check_off = archived_last_check_off
+
+        error = weekly_check_off_error(last_check_off, check_off_date.date())
+        if error:
+            raise MultipleCheckOffError(error)
+
+        return self._add_check_off(session, habit, streak, check_off_date, WEEKLY_CHECK_OFF_LIMIT_MESSAGE)
+
+    def _add_check_off(
+        self,
+        session: Session,
+        habit: HabitMetadata,
+        streak: Optional[HabitStreak],
+        check_off_date: datetime,
+        limit_message: str,
+    ) -> CheckOff:
+        check_off = CheckOff(habit_id=habit.id, date_time=check_off_date, day=check_off_date.date())
+        session.add(check_off)
+        # Updating the caches can autoflush the check-off, which is where a concurrent duplicate is detected.
+        # check_off_habit rolls back on every error.
+        try:
+            self._update_streak_cache(session, habit, streak, check_off_date)
+            self._add_to_rollups(session, [(habit.id, check_off_date)])
+            session.commit()
+        except IntegrityError:
+            raise MultipleCheckOffError(limit_message)
+        logger.info(f"Check-off added: {check_off}")
         return check_off
 
-    def _check_off_weekly(self, habit_id: int, check_off_date: datetime) -> CheckOff:
-        last_check_off = (
-            self.session.query(CheckOff.date_time)
-            .filter_by(habit_id=habit_id)
-            .order_by(CheckOff.date_time.desc())
-            .first()
+    def _update_streak_cache(
+        self,
+        session: Session,
+        habit: HabitMetadata,
+        streak: Optional[HabitStreak],
+        check_off_date: datetime,
+    ) -> None:
+        """
+        Advance the cached streak state and period history of a habit with a new check-off in O(1).
+        Falls back to a rebuild from the full history when the habit has no cached state yet
+        or when the check-off is a backfill older than the last check-off.
+        """
+        advanced = streak is not None and advance_streak(streak, check_off_date, habit.periodicity)
+        record_cache("streak", advanced)
+        if advanced:
+            add_to_history(streak, habit.periodicity, habit.creation_date, check_off_date)
+        else:
+            self._rebuild_streak_cache_for_habit(session, habit, streak)
+
+    def _rebuild_streak_cache_for_habit(self, session: Session, habit: HabitMetadata, streak: Optional[HabitStreak]) -> None:
+        check_offs = self._fetch_all(
+            session.query(CheckOff.date_time)
+            .filter_by(habit_id=habit.id)
+            .order_by(CheckOff.date_time.asc())
         )
 
-        if last_check_off:
-            days_since_last_check_off = (check_off_date.date() - last_check_off.date_time.date()).days
-            if days_since_last_check_off < WEEKLY_CHECK_OFF_LIMIT_DAYS:
-                raise MultipleCheckOffError("You can only check off once every 7 days.")
+        rows = [(habit.id, habit.periodicity, co.date_time) for co in check_offs] or [(habit.id, habit.periodicity, None)]
+        rows = merge_archived(rows, self._archived_histories(session, Habit.id == habit.id))
+        state = streak_states(rows)[habit.id]
+        state.update(history_states([(habit.id, habit.periodicity, habit.creation_date, row[2]) for row in rows])[habit.id])
 
-        check_off = CheckOff(habit_id=habit_id, date_time=check_off_date)
-        self.session.add(check_off)
-        self.session.commit()
-        logger.info(f"Weekly check-off added: {check_off}")
-        return check_off
+        if streak is None:
+            session.add(HabitStreak(habit_id=habit.id, **state))
+        else:
+            for column, value in state.items():
+                setattr(streak, column, value)
+
+    def _add_to_rollups(self, session: Session, check_offs: List[Tuple[int, datetime]]) -> None:
+        """
+        Add new (habit_id, date_time) check-offs to the monthly rollups, in the transaction that inserts them.
+        """
+        session.execute(add_to_rollups_statement(session.get_bind().dialect.name), rollup_rows(check_offs))
+
+    @instrumented
+    def rebuild_rollups(self) -> int:
+        """
+        Recompute the monthly check-off rollups of every habit from the check-offs, archived ones included,
+        which backfills rollups missing from imported data and drops rollups of months without check-offs.
+        Returns the number of rollups.
+        """
+        with self._session_scope() as session:
+            session.execute(delete(CheckOffRollup))
+            session.execute(backfill_rollups_statement())
+            # The archived check-offs still count in the rollups of their months
+            for habit_id, (_, date_times) in self._archived_histories(session).items():
+                self._add_to_rollups(session, [(habit_id, date_time) for date_time in to_datetimes(date_times)])
+            session.commit()
+            count = session.query(func.count()).select_from(CheckOffRollup).scalar()
+            logger.info(f"Rollups rebuilt: {count} habit months.")
+            return count
+
+    @instrumented
+    def archive_check_offs(self, before: datetime) -> int:
+        """
+        Move the check-offs older than before out of the check_offs table, into a new segment of the check-off archive.
+        The streak, listing and analytics methods keep reading them from the archive, and the streak cache and rollups,
+        which already count them, are left as they are. Segments only holding check-offs of deleted habits are removed.
+        Returns the number of archived check-offs.
+        """
+        if self.archive is None:
+            raise ValueError("No archive path is configured.")
+
+        with self._session_scope() as session:
+            try:
+                # Deleting first takes the write lock, so no other archive run writes a segment until this one commits
+                rows = self._fetch_all(session.execute(
+                    delete(CheckOff)
+                    .where(CheckOff.date_time < before)
+                    .returning(CheckOff.id, CheckOff.habit_id, CheckOff.date_time)
+                ))
+                if not rows:
+                    session.rollback()
+                    return 0
+                segment, index = self.archive.write_segment(rows)
+            except Exception:
+                session.rollback()
+                raise
+
+            try:
+                session.execute(insert(ArchivedCheckOffs), index)
+                # Still under the write lock, so a segment missing from the index is not one being written
+                self.archive.remove_segments(set(session.scalars(select(ArchivedCheckOffs.segment).distinct())))
+                session.commit()
+            except Exception:
+                session.rollback()
+                self.archive.remove_segment(segment)
+                raise
+            logger.info(f"Archived {len(rows)} check-offs before {before} in segment {segment}.")
+            return len(rows)
+
+    @instrumented
+    def rebuild_streak_cache(self, workers: Optional[int] = None) -> int:
+        """
+        Recompute the cached streak state of every habit from its full check-off history.
+        With workers, the states are computed by that many processes, see _map_shards, and written by this one.
+        Returns the number of habits whose cache was rebuilt.
+        """
+        if self._runs_in_parallel(workers):
+            with self._session_scope() as session:
+                # Taken before the workers read, so check-offs committed meanwhile wait for the rebuilt cache
+                # instead of being overwritten by states computed without them
+                session.execute(self._lock_streak_statement(), execution_options={"synchronize_session": False})
+                states = self._map_shards("_compute_cache_states", workers)
+                session.execute(delete(HabitStreak))
+                self._insert_cache_states(session, states)
+                session.commit()
+            count = len(states)
+        else:
+            with self._session_scope() as session:
+                count = self._refresh_streak_cache(session)
+                session.commit()
+        logger.info(f"Streak cache rebuilt for {count} habits.")
+        return count
+
+    def _refresh_streak_cache(self, session: Session, habit_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Recompute the cached streak state of the given habits, or of every habit, without committing.
+        """
+        if habit_ids is None:
+            chunks = [None]
+        else:
+            habit_ids = sorted(set(habit_ids))
+            chunks = [habit_ids[i:i + BULK_QUERY_CHUNK_SIZE] for i in range(0, len(habit_ids), BULK_QUERY_CHUNK_SIZE)]
+
+        count = 0
+        for chunk in chunks:
+            statement = delete(HabitStreak)
+            criterion = None
+            if chunk is not None:
+                criterion = Habit.id.in_(chunk)
+                statement = statement.where(HabitStreak.habit_id.in_(chunk))
+
+            states = self._cache_states(session, criterion)
+            session.execute(statement)
+            self._insert_cache_states(session, states)
+            count += len(states)
+
+        session.expire_all()
+        return count
+
+    def _cache_states(self, session: Session, criterion=None) -> Dict[int, dict]:
+        """
+        Compute the HabitStreak column values, period history included, of the habits matching criterion.
+        """
+        query = (
+            session.query(Habit.id, Habit.periodicity, Habit.creation_date, CheckOff.date_time)
+            .outerjoin(CheckOff, CheckOff.habit_id == Habit.id)
+        )
+        if criterion is not None:
+            query = query.filter(criterion)
+
+        rows = self._fetch_all(query.order_by(Habit.id, CheckOff.date_time))
+        rows = merge_archived(rows, self._archived_histories(session, criterion))
+        states = streak_states([(habit_id, periodicity, date_time) for habit_id, periodicity, _, date_time in rows])
+        for habit_id, history in history_states(rows).items():
+            states[habit_id].update(history)
+        return states
+
+    def _compute_cache_states(self, session: Session, first_id: Optional[int], last_id: Optional[int]) -> Dict[int, dict]:
+        return self._cache_states(session, self._shard_criterion(first_id, last_id))
+
+    @staticmethod
+    def _insert_cache_states(session: Session, states: Dict[int, dict]) -> None:
+        habit_ids = list(states)
+        for start in range(0, len(habit_ids), BULK_CHECK_OFF_BATCH_SIZE):
+            session.execute(insert(HabitStreak), [
+                {"habit_id": habit_id, **states[habit_id]} for habit_id in habit_ids[start:start + BULK_CHECK_OFF_BATCH_SIZE]
+            ])
+
+    @instrumented
+    def bulk_check_off(
+        self,
+        records: Iterable[Tuple[int, datetime]],
+        batch_size: int = BULK_CHECK_OFF_BATCH_SIZE,
+    ) -> Tuple[int, List[Tuple[int, datetime, str]]]:
+        """
+        Check off many habits at once from (habit_id, check_off_date) records, in a single transaction.
+        Records are validated in order with the same rules as check_off_habit, against the last check-off of each habit
+        kept in memory, and inserted in batches of batch_size rows.
+        Returns the number of inserted check-offs and the rejected records with the reason they were rejected.
+        """
+        with self._session_scope() as session:
+            periodicities: Dict[int, Optional[int]] = {}
+            last_check_offs: Dict[int, Optional[datetime]] = {}
+            # Check-offs inserted per habit in order, and the habits that got one older than their last check-off
+            appended: Dict[int, List[datetime]] = {}
+            backfilled_habit_ids = set()
+            inserted = 0
+            rejected = []
+
+            try:
+                for batch in self._batched(records, batch_size):
+                    self._load_check_off_state(session, [habit_id for habit_id, _ in batch], periodicities, last_check_offs)
+                    existing_days = self._get_existing_check_off_days(session, batch, periodicities, last_check_offs)
+                    batch_days = set()
+                    rows = []
+
+                    for habit_id, check_off_date in batch:
+                        periodicity = periodicities[habit_id]
+                        last_check_off = last_check_offs[habit_id]
+                        day = check_off_date.date()
+
+                        if periodicity is None:
+                            rejected.append((habit_id, check_off_date, habit_not_found_message(habit_id)))
+                            continue
+
+                        if periodicity == PERIODICITY_DAILY:
+                            error = daily_check_off_error((habit_id, day) in batch_days or (habit_id, day) in existing_days)
+                        else:
+                            error = weekly_check_off_error(last_check_off, day)
+                        if error:
+                            rejected.append((habit_id, check_off_date, error))
+                            continue
+
+                        batch_days.add((habit_id, day))
+                        rows.append({"habit_id": habit_id, "date_time": check_off_date, "day": day})
+                        appended.setdefault(habit_id, []).append(check_off_date)
+                        if last_check_off is None or check_off_date > last_check_off:
+                            last_check_offs[habit_id] = check_off_date
+                        else:
+                            backfilled_habit_ids.add(habit_id)
+
+                    if rows:
+                        session.execute(insert(CheckOff), rows)
+                        self._add_to_rollups(session, [(row["habit_id"], row["date_time"]) for row in rows])
+                        inserted += len(rows)
+
+                self._advance_streak_caches(session, appended, backfilled_habit_ids, periodicities)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+            logger.info(f"Bulk check-off added {inserted} check-offs, rejected {len(rejected)}.")
+            return inserted, rejected
+
+    def write_behind(self, batch_size: Optional[int] = None, max_latency: Optional[float] = None) -> WriteBehindQueue:
+        """
+        Return a queue that validates check-offs in memory and writes them in group commits of up to batch_size
+        check-offs, at most max_latency seconds after they were queued. Both default to the write_behind settings.
+        Use it as a context manager, or call close, so the last check-offs are written.
+        """
+        if batch_size is None:
+            batch_size = self.config["write_behind_batch_size"] if self.session is None else WRITE_BEHIND_BATCH_SIZE
+        if max_latency is None:
+            max_latency = self.config["write_behind_max_latency"] if self.session is None else WRITE_BEHIND_MAX_LATENCY_SECONDS
+        return WriteBehindQueue(self, batch_size, max_latency)
+
+    def _advance_streak_caches(
+        self,
+        session: Session,
+        appended: Dict[int, List[datetime]],
+        backfilled_habit_ids: set,
+        periodicities: Dict[int, Optional[int]],
+    ) -> None:
+        """
+        Update the cached streaks of habits that got new check-offs, without committing.
+        Streaks of habits whose new check-offs all follow their last one are advanced in O(1) per check-off;
+        those of habits with backfills or without a cached streak are recomputed from their full history.
+        """
+        refreshed_habit_ids = set(backfilled_habit_ids)
+        habit_ids = sorted(appended.keys() - backfilled_habit_ids)
+        for start in range(0, len(habit_ids), BULK_QUERY_CHUNK_SIZE):
+            chunk = habit_ids[start:start + BULK_QUERY_CHUNK_SIZE]
+            streaks = {streak.habit_id: (streak, creation_date) for streak, creation_date in self._fetch_all(
+                session.query(HabitStreak, Habit.creation_date)
+                .join(Habit, Habit.id == HabitStreak.habit_id)
+                .filter(HabitStreak.habit_id.in_(chunk))
+            )}
+            for habit_id in chunk:
+                if habit_id not in streaks:
+                    refreshed_habit_ids.add(habit_id)
+                    continue
+                streak, creation_date = streaks[habit_id]
+                for check_off_date in appended[habit_id]:
+                    advance_streak(streak, check_off_date, periodicities[habit_id])
+                    add_to_history(streak, periodicities[habit_id], creation_date, check_off_date)
+
+        if refreshed_habit_ids:
+            # The refresh expires every object of the session, so the advanced streaks are written first
+            session.flush()
+            self._refresh_streak_cache(session, refreshed_habit_ids)
+
+    @staticmethod
+    def _batched(records: Iterable[Tuple[int, datetime]], batch_size: int) -> Iterator[List[Tuple[int, datetime]]]:
+        iterator = iter(records)
+        while batch := list(islice(iterator, batch_size)):
+            yield batch
+
+    def _load_check_off_state(
+        self,
+        session: Session,
+        habit_ids: List[int],
+        periodicities: Dict[int, Optional[int]],
+        last_check_offs: Dict[int, Optional[datetime]],
+    ) -> None:
+        """
+        Load the periodicity and last check-off of the habits not seen yet by a bulk check-off.
+        Unknown habits get a periodicity of None.
+        """
+        new_habit_ids = list({habit_id for habit_id in habit_ids if habit_id not in periodicities})
+        if not new_habit_ids:
+            return
+
+        periodicities.update(dict.fromkeys(new_habit_ids))
+        last_check_offs.update(dict.fromkeys(new_habit_ids))
+        periodicities.update(
+            self._fetch_all(session.query(Habit.id, Habit.periodicity).filter(Habit.id.in_(new_habit_ids)))
+        )
+        last_check_offs.update(self._fetch_all(
+            session.query(CheckOff.habit_id, func.max(CheckOff.date_time))
+            .filter(CheckOff.habit_id.in_(new_habit_ids))
+            .group_by(CheckOff.habit_id)
+        ))
+        for habit_id, archived_last_check_off in self._archived_last_check_offs(session, new_habit_ids).items():
+            if last_check_offs[habit_id] is None or archived_last_check_off > last_check_offs[habit_id]:
+                last_check_offs[habit_id] = archived_last_check_off
+
+    def _archived_last_check_offs(self, session: Session, habit_ids: List[int]) -> Dict[int, datetime]:
+        """
+        Return the last archived check-off of the given habits that have archived check-offs, from the archive index.
+        """
+        if self.archive is None or not self.archive.exists():
+            return {}
+        return dict(self._fetch_all(
+            session.query(ArchivedCheckOffs.habit_id, func.max(ArchivedCheckOffs.last_check_off))
+            .filter(ArchivedCheckOffs.habit_id.in_(habit_ids))
+            .group_by(ArchivedCheckOffs.habit_id)
+        ))
+
+    def _get_existing_check_off_days(
+        self,
+        session: Session,
+        batch: List[Tuple[int, datetime]],
+        periodicities: Dict[int, Optional[int]],
+        last_check_offs: Dict[int, Optional[datetime]],
+    ) -> set:
+        """
+        Return the (habit_id, day) pairs of a batch of daily check-offs that are already stored.
+        Only days up to the last known check-off of a habit can be stored already, so appends need no lookup.
+        """
+        candidates = {
+            (habit_id, check_off_date.date())
+            for habit_id, check_off_date in batch
+            if periodicities[habit_id] == PERIODICITY_DAILY
+            and last_check_offs[habit_id] is not None
+            and check_off_date.date() <= last_check_offs[habit_id].date()
+        }
+        if not candidates:
+            return set()
+
+        habit_ids = {habit_id for habit_id, _ in candidates}
+        stored = self._fetch_all(
+            session.query(CheckOff.habit_id, CheckOff.day)
+            .filter(CheckOff.habit_id.in_(habit_ids))
+            .filter(CheckOff.day.in_({day for _, day in candidates}))
+        )
+        archived = archived_days(self._archived_histories(session, Habit.id.in_(habit_ids)), candidates)
+        return candidates & ({(habit_id, day) for habit_id, day in stored} | archived)
+
+    def iter_habit_rows(self) -> Iterator[Tuple]:
+        """
+        Stream (id, name, description, periodicity, creation_date) rows of all habits, ordered by id,
+        fetching STREAM_BATCH_SIZE rows at a time.
+        """
+        with self._session_scope() as session:
+            statement = (
+                select(*HABIT_EXPORT_COLUMNS)
+                .order_by(Habit.id)
+                .execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            yield from session.execute(statement)
+
+    def iter_check_off_rows(self) -> Iterator[Tuple]:
+        """
+        Stream (habit_id, date_time) rows of all check-offs, archived ones included, ordered by habit and date,
+        fetching STREAM_BATCH_SIZE rows at a time.
+        """
+        with self._session_scope() as session:
+            statement = (
+                select(*CHECK_OFF_EXPORT_COLUMNS)
+                .order_by(CheckOff.habit_id, CheckOff.date_time)
+                .execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            rows = session.execute(statement)
+            if self.archive is None or not self.archive.exists():
+                yield from rows
+                return
+            yield from heapq.merge(map(tuple, rows), self._iter_archived_rows(session))
+
+    def _iter_archived_rows(self, session: Session) -> Iterator[Tuple[int, datetime]]:
+        """
+        Stream (habit_id, date_time) rows of the archived check-offs, ordered by habit and date, a habit at a time.
+        """
+        index_rows = self._fetch_all(session.execute(archive_index_statement()))
+        for habit_id, habit_index_rows in groupby(index_rows, key=itemgetter(0)):
+            _, date_times = self.archive.histories(habit_index_rows)[habit_id]
+            for date_time in to_datetimes(date_times):
+                yield habit_id, date_time
 
-    def get_habits(self) -> list[Type[Habit]]:
-        return self.session.query(Habit).all()
+    @instrumented
+    def export_habits(self, path: str, fmt: Optional[str] = None) -> int:
+        """
+        Write all habits to a CSV or JSONL file. Returns the number of exported habits.
+        """
+        fmt = detect_format(path, fmt)
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            count = write_rows(file, [column.key for column in HABIT_EXPORT_COLUMNS], self.iter_habit_rows(), fmt)
+        logger.info(f"Exported {count} habits to {path}.")
+        return count
 
+    @instrumented
+    def export_check_offs(self, path: str, fmt: Optional[str] = None) -> int:
+        """
+        Write all check-offs to a CSV or JSONL file. Returns the number of exported check-offs.
+        """
+        fmt = detect_format(path, fmt)
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            count = write_rows(file, [column.key for column in CHECK_OFF_EXPORT_COLUMNS], self.iter_check_off_rows(), fmt)
+        logger.info(f"Exported {count} check-offs to {path}.")
+        return count
+
+    @instrumented
+    def import_habits(self, path: str, fmt: Optional[str] = None, batch_size: int = BULK_CHECK_OFF_BATCH_SIZE) -> int:
+        """
+        Read habits written by export_habits and insert them in batches, keeping their ids
+        so check-offs exported with them can be imported afterwards. Returns the number of imported habits.
+        """
+        fmt = detect_format(path, fmt)
+        with open(path, newline="", encoding="utf-8") as file:
+            count = self._insert_habit_rows(map(self._parse_habit_row, read_rows(file, fmt)), batch_size)
+        logger.info(f"Imported {count} habits from {path}.")
+        return count
+
+    @staticmethod
+    def _parse_habit_row(row: dict) -> dict:
+        return {
+            "id": int(row["id"]),
+            "name": row["name"],
+            "description": parse_optional(row["description"]),
+            "periodicity": int(row["periodicity"]),
+            "creation_date": parse_datetime(row["creation_date"]),
+        }
+
+    def _insert_habit_rows(self, habits: Iterable[dict], batch_size: int) -> int:
+        """
+        Insert habits given as dicts of Habit columns, ids included, in batches in a single transaction.
+        """
+        with self._session_scope() as session:
+            count = 0
+            try:
+                for batch in self._batched(habits, batch_size):
+                    session.execute(insert(Habit), batch)
+                    session.execute(insert(HabitStreak), [{"habit_id": habit["id"]} for habit in batch])
+                    count += len(batch)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            return count
+
+    @instrumented
+    def import_check_offs(
+        self,
+        path: str,
+        fmt: Optional[str] = None,
+        batch_size: int = BULK_CHECK_OFF_BATCH_SIZE,
+    ) -> Tuple[int, List[Tuple[int, datetime, str]]]:
+        """
+        Read check-offs written by export_check_offs and add them with bulk_check_off, reading batch_size rows at a time.
+        Returns the number of imported check-offs and the rejected ones.
+        """
+        fmt = detect_format(path, fmt)
+        with open(path, newline="", encoding="utf-8") as file:
+            records = ((int(row["habit_id"]), parse_datetime(row["date_time"])) for row in read_rows(file, fmt))
+            inserted, rejected = self.bulk_check_off(records, batch_size=batch_size)
+        logger.info(f"Imported {inserted} check-offs from {path}.")
+        return inserted, rejected
+
+    @instrumented
+    def get_habits(self, after_id: Optional[int] = None, limit: Optional[int] = None) -> list[Type[Habit]]:
+        with self._session_scope() as session:
+            return self._fetch_all(self._paginate(session.query(Habit), Habit.id, after_id, limit))
+
+    @instrumented
+    def get_habit_rows(self, after_id: Optional[int] = None, limit: Optional[int] = None) -> List[Tuple]:
+        """
+        Return (id, name, description, periodicity, creation_date) rows of habits without loading ORM objects.
+        Pass the last id of a page as after_id to get the next page.
+        """
+        with self._session_scope() as session:
+            query = session.query(*HABIT_EXPORT_COLUMNS)
+            return self._fetch_all(self._paginate(query, Habit.id, after_id, limit))
+
+    @instrumented
     def get_habit(self, habit_id: int) -> Type[Habit]:
-        habit: Type[Habit] = self._get_habit(habit_id)
-        return habit
+        with self._session_scope() as session:
+            habit: Type[Habit] = self._get_habit(session, habit_id)
+            return habit
     
+    @instrumented
     def delete_habit(self, habit_id: int) -> None:
-        habit = self._get_habit(habit_id)
-        self.session.delete(habit)
-        self.session.commit()
-        logger.info(f"Habit deleted: {habit}")
+        with self._session_scope() as session:
+            deleted = self._delete_habits(session, Habit.id == habit_id)
+            self.habit_cache.invalidate(habit_id)
+            if not deleted:
+                session.rollback()
+                raise HabitNotFoundError(habit_not_found_message(habit_id))
+            session.commit()
+            logger.info(f"Habit deleted: {habit_id}")
+
+    @instrumented
+    def delete_habits(self, habit_ids: Iterable[int]) -> int:
+        """
+        Delete the habits with the given ids and their check-offs in a single transaction.
+        Returns the number of deleted habits; ids of habits that do not exist are ignored.
+        """
+        habit_ids = sorted(set(habit_ids))
+        with self._session_scope() as session:
+            count = 0
+            for start in range(0, len(habit_ids), BULK_QUERY_CHUNK_SIZE):
+                count += self._delete_habits(session, Habit.id.in_(habit_ids[start:start + BULK_QUERY_CHUNK_SIZE]))
+            session.commit()
+            for habit_id in habit_ids:
+                self.habit_cache.invalidate(habit_id)
+            logger.info(f"Habits deleted: {count}")
+            return count
 
+    @instrumented
+    def delete_habits_where(
+        self,
+        periodicity: Optional[int] = None,
+        created_before: Optional[datetime] = None,
+        name: Optional[str] = None,
+    ) -> int:
+        """
+        Delete the habits matching all the given filters, and their check-offs. Returns the number of deleted habits.
+        At least one filter is required; use delete_all_habits to delete every habit.
+        """
+        criteria = []
+        if periodicity is not None:
+            criteria.append(Habit.periodicity == periodicity)
+        if created_before is not None:
+            criteria.append(Habit.creation_date < created_before)
+        if name is not None:
+            criteria.append(Habit.name == name)
+        if not criteria:
+            raise ValueError("No filter given. Use delete_all_habits to delete every habit.")
+
+        with self._session_scope() as session:
+            count = self._delete_habits(session, and_(*criteria))
+            session.commit()
+            self.habit_cache.clear()
+            logger.info(f"Habits deleted: {count}")
+            return count
+
+    @instrumented
     def delete_all_habits(self) -> None:
-        habits = self.session.query(Habit).all()
-        for habit in habits:
-            self.session.delete(habit)
-        self.session.commit()
-        logger.info("All habits deleted.")
+        with self._session_scope() as session:
+            self._delete_habits(session)
+            session.commit()
+            self.habit_cache.clear()
+            logger.info("All habits deleted.")
+
+    def _delete_habits(self, session: Session, criterion=None) -> int:
+        """
+        Delete the habits matching criterion, or every habit, with their check-offs, streak cache and rollups,
+        without committing. Returns the number of deleted habits.
+        """
+        for statement in self._delete_habits_statements(criterion):
+            result = session.execute(statement, execution_options={"synchronize_session": False})
+        return result.rowcount
+
+    @staticmethod
+    def _delete_habits_statements(criterion=None) -> list:
+        """
+        Return one set-based DELETE per table, the habits last, instead of loading the habits and their check-offs
+        for the ORM cascade. The dependent rows are deleted explicitly, so sessions on connections without
+        SQLite's foreign_keys pragma do not leave them behind.
+        """
+        statements = []
+        for model in (CheckOff, HabitStreak, CheckOffRollup, ArchivedCheckOffs):
+            statement = delete(model)
+            if criterion is not None:
+                statement = statement.where(model.habit_id.in_(select(Habit.id).where(criterion)))
+            statements.append(statement)
 
+        statement = delete(Habit)
+        if criterion is not None:
+            statement = statement.where(criterion)
+        statements.append(statement)
+        return statements
+
+    @instrumented
     def get_last_check_off_for_habit(self, habit_id: int) -> Optional[CheckOff]:
-        return (
-            self.session.query(CheckOff)
-            .filter_by(habit_id=habit_id)
-            .order_by(CheckOff.date_time.desc())
-            .first()
-        )
+        with self._session_scope() as session:
+            check_off = (
+                session.query(CheckOff)
+                .filter_by(habit_id=habit_id)
+                .order_by(CheckOff.date_time.desc())
+                .first()
+            )
+            history = self._archived_histories(session, Habit.id == habit_id).get(habit_id)
+            if history is not None:
+                check_off_id, date_time = last_check_off(history)
+                if check_off is None or date_time > check_off.date_time:
+                    check_off = CheckOff(id=check_off_id, habit_id=habit_id, date_time=date_time, day=date_time.date())
+            return check_off
     
-    def get_all_check_offs_for_habit(self, habit_id: int) -> list[Type[CheckOff]]:
-        return self.session.query(CheckOff).filter_by(habit_id=habit_id).all()
+    @instrumented
+    def get_all_check_offs_for_habit(
+        self,
+        habit_id: int,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> list[Type[CheckOff]]:
+        with self._session_scope() as session:
+            query = session.query(CheckOff).filter_by(habit_id=habit_id)
+            live = self._fetch_all(self._filter_check_offs(query, after_id, limit, since, until))
+            histories = self._archived_histories(session, Habit.id == habit_id, since, until)
+            return self._merge_archived_check_offs(live, histories, after_id, limit, since, until)
 
-    def get_all_check_offs(self) -> list[Type[CheckOff]]:
-        return self.session.query(CheckOff).all()
+    @instrumented
+    def get_all_check_offs(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> list[Type[CheckOff]]:
+        with self._session_scope() as session:
+            query = session.query(CheckOff)
+            live = self._fetch_all(self._filter_check_offs(query, after_id, limit, since, until))
+            histories = self._archived_histories(session, None, since, until)
+            return self._merge_archived_check_offs(live, histories, after_id, limit, since, until)
 
+    @staticmethod
+    def _merge_archived_check_offs(live: list, histories: Dict[int, History], after_id, limit, since, until) -> list:
+        """
+        Merge a page of live CheckOff objects with the archived check-offs of histories on the same page,
+        as CheckOff objects that are not attached to any session.
+        """
+        rows = HabitTracker._merge_archived_rows(
+            [(check_off.id, check_off) for check_off in live], histories, after_id, limit, since, until,
+        )
+        return [
+            row[1] if isinstance(row[1], CheckOff)
+            else CheckOff(id=row[0], habit_id=row[1], date_time=row[2], day=row[2].date())
+            for row in rows
+        ]
+
+    @staticmethod
+    def _merge_archived_rows(live: list, histories: Dict[int, History], after_id, limit, since, until) -> list:
+        """
+        Merge a page of live rows starting with the check-off id
+        with the (id, habit_id, date_time) rows of the archived check-offs of histories on the same page.
+        """
+        if not histories:
+            return live
+        archived = archived_rows(histories, after_id, limit, since, until)
+        return merge_pages(live, archived, limit, after_id is not None or limit is not None)
+
+    @instrumented
+    def get_check_off_rows(
+        self,
+        habit_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Tuple]:
+        """
+        Return (id, habit_id, date_time) rows of check-offs, optionally of a single habit and within [since, until),
+        without loading ORM objects. Pass the last id of a page as after_id to get the next page.
+        """
+        with self._session_scope() as session:
+            query = session.query(CheckOff.id, CheckOff.habit_id, CheckOff.date_time)
+            if habit_id is not None:
+                query = query.filter_by(habit_id=habit_id)
+            live = self._fetch_all(self._filter_check_offs(query, after_id, limit, since, until))
+            histories = self._archived_histories(session, None if habit_id is None else Habit.id == habit_id, since, until)
+            return self._merge_archived_rows(live, histories, after_id, limit, since, until)
+
+    def _archived_histories(
+        self,
+        session: Session,
+        criterion=None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Dict[int, History]:
+        """
+        Return the archived (ids, date_times) of the habits matching criterion, or of every habit,
+        from segments with check-offs in [since, until). Without an archive directory nothing was archived,
+        so the archive index is not even read.
+        """
+        if self.archive is None or not self.archive.exists():
+            return {}
+        return self.archive.histories(self._fetch_all(session.execute(archive_index_statement(criterion, since, until))))
+
+    @staticmethod
+    def _fetch_all(query) -> list:
+        """
+        Return all rows of a query, counting them for the instrumentation.
+        """
+        rows = query.all()
+        record_rows(len(rows))
+        return rows
+
+    @staticmethod
+    def _filter_check_offs(query, after_id, limit, since, until):
+        if since is not None:
+            query = query.filter(CheckOff.date_time >= since)
+        if until is not None:
+            query = query.filter(CheckOff.date_time < until)
+        return HabitTracker._paginate(query, CheckOff.id, after_id, limit)
+
+    @staticmethod
+    def _paginate(query, key, after_id: Optional[int], limit: Optional[int]):
+        """
+        Apply keyset pagination on an id column, so fetching a page does not depend on how many rows precede it.
+        """
+        if after_id is None and limit is None:
+            return query
+        query = query.order_by(key)
+        if after_id is not None:
+            query = query.filter(key > after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @instrumented
     def get_longest_check_off_streak_for_habit(self, habit_id: int) -> int:
-        habit = self._get_habit(habit_id)
-        periodicity = habit.periodicity
-        interval = 1 if periodicity == PERIODICITY_DAILY else 7
+        with self._session_scope() as session:
+            habit, streak = self._get_habit_state(session, habit_id)
+            record_cache("streak", streak is not None)
+            if streak is not None:
+                return streak.longest_streak
 
-        check_offs = (
-            self.session.query(CheckOff.date_time)
-            .filter_by(habit_id=habit_id)
-            .order_by(CheckOff.date_time.asc())
-            .all()
-        )
+            check_offs = self._fetch_all(
+                session.query(CheckOff.date_time)
+                .filter_by(habit_id=habit_id)
+                .order_by(CheckOff.date_time.asc())
+            )
+
+            rows = [(habit_id, habit.periodicity, co.date_time) for co in check_offs] or [(habit_id, habit.periodicity, None)]
+            rows = merge_archived(rows, self._archived_histories(session, Habit.id == habit_id))
+            return longest_streaks(rows).get(habit_id, 0)
+
+    @instrumented
+    def get_longest_check_off_streaks(self, workers: Optional[int] = None) -> Dict[int, int]:
+        """
+        Return the longest check-off streak of every habit, keyed by habit id.
+        All check-offs are fetched in a single ordered scan and the streaks are computed in one vectorized pass.
+        With workers, the habits are split by id range across that many processes, see _map_shards.
+        Habits without check-offs have a streak of 0.
+        """
+        if self._runs_in_parallel(workers):
+            return self._map_shards("_compute_longest_streaks", workers)
+        with self._session_scope() as session:
+            return self._compute_longest_streaks(session, None, None)
 
-        if not check_offs:
-            return 0
+    def _compute_longest_streaks(self, session: Session, first_id: Optional[int], last_id: Optional[int]) -> Dict[int, int]:
+        query = (
+            session.query(Habit.id, Habit.periodicity, CheckOff.date_time)
+            .outerjoin(CheckOff, CheckOff.habit_id == Habit.id)
+        )
+        criterion = self._shard_criterion(first_id, last_id)
+        if criterion is not None:
+            query = query.filter(criterion)
+        rows = self._fetch_all(query.order_by(Habit.id, CheckOff.date_time))
+        return longest_streaks(merge_archived(rows, self._archived_histories(session, criterion)))
 
-        data_frame = pd.DataFrame([pd.Timestamp(co.date_time) for co in check_offs], columns=["date"])
-        data_frame = data_frame.drop_duplicates()
-        data_frame["gap"] = (data_frame["date"] - data_frame["date"].shift()).dt.days
-        data_frame["streak"] = (data_frame["gap"] != interval).cumsum()
-        data_frame["streak_length"] = (
-            data_frame.groupby("streak")["date"].transform(lambda x: (x.max() - x.min()).days + 1)
+    def _runs_in_parallel(self, workers: Optional[int]) -> bool:
+        """
+        Return whether work can be split across workers processes: they open the database on their own,
+        which a shared session or an in-memory database does not allow.
+        """
+        return (
+            workers is not None
+            and workers > 1
+            and self.session is None
+            and not is_in_memory_database(make_url(self.config["database_url"]))
         )
 
-        return data_frame["streak_length"].max()
+    def _map_shards(self, task: str, workers: int) -> dict:
+        """
+        Run the tracker method named task, which takes a session and the first and last habit id of a shard,
+        over every habit split in shards of about the same number of habits, in workers processes
+        that each open a read-only connection. Returns the merged results, ordered by shard.
+        """
+        with self._session_scope() as session:
+            habit_ids = [habit_id for habit_id, in self._fetch_all(session.query(Habit.id).order_by(Habit.id))]
+        return map_habit_shards(self.config, task, habit_ids, workers)
 
-    def get_longest_streak_of_all_habits(self) -> Tuple[int, Optional[int]]:
-        habit_ids = [habit.id for habit in self.get_habits()]
+    @staticmethod
+    def _shard_criterion(first_id: Optional[int], last_id: Optional[int]):
+        if first_id is None:
+            return None
+        return Habit.id.between(first_id, last_id)
 
+    @instrumented
+    def get_longest_streak_of_all_habits(self, workers: Optional[int] = None) -> Tuple[int, Optional[int]]:
         longest_streak = 0
         habit_with_longest_streak = None
 
-        habit_id: int
-
-        for habit_id in habit_ids:
-            streak = self.get_longest_check_off_streak_for_habit(habit_id)
+        for habit_id, streak in self.get_longest_check_off_streaks(workers).items():
             if streak > longest_streak:
                 longest_streak = streak
                 habit_with_longest_streak = habit_id
 
         return longest_streak, habit_with_longest_streak
 
+    @instrumented
+    def get_current_streak(self, habit_id: int, now: Optional[datetime] = None) -> int:
+        """
+        Return the streak of a habit still running at now (the current UTC time by default), 0 if it is broken.
+        """
+        now = now or datetime.utcnow()
+        with self._session_scope() as session:
+            habit, streak = self._get_habit_state(session, habit_id)
+            record_cache("streak", streak is not None)
+            if streak is not None:
+                return running_streak(streak.current_streak, streak.last_check_off, habit.periodicity, now)
+
+            state = self._compute_streak_states(session, [habit_id])[habit_id]
+            return running_streak(state["current_streak"], state["last_check_off"], habit.periodicity, now)
+
+    @instrumented
+    def get_dashboard(self, now: Optional[datetime] = None) -> List[Tuple]:
+        """
+        Return (id, name, periodicity, current_streak, longest_streak, last_check_off, at_risk) rows of all habits,
+        ordered by id. current_streak is the streak still running at now (the current UTC time by default),
+        and at_risk tells whether it breaks unless the habit is checked off soon.
+        The rows are read from the streak cache in a single query, without scanning any check-off history.
+        """
+        now = now or datetime.utcnow()
+        with self._session_scope() as session:
+            rows = self._fetch_all(
+                session.query(
+                    Habit.id,
+                    Habit.name,
+                    Habit.periodicity,
+                    HabitStreak.habit_id,
+                    HabitStreak.current_streak,
+                    HabitStreak.longest_streak,
+                    HabitStreak.last_check_off,
+                )
+                .outerjoin(HabitStreak, HabitStreak.habit_id == Habit.id)
+                .order_by(Habit.id)
+            )
+
+            # Habits without cached state, such as habits of databases written by older versions, are computed
+            missing = [habit_id for habit_id, _, _, cached, *_ in rows if cached is None]
+            states = self._compute_streak_states(session, missing) if missing else {}
+
+            dashboard = []
+            for habit_id, name, periodicity, cached, current_streak, longest_streak, last_check_off in rows:
+                record_cache("streak", cached is not None)
+                if cached is None:
+                    state = states[habit_id]
+                    current_streak, longest_streak, last_check_off = (
+                        state["current_streak"], state["longest_streak"], state["last_check_off"],
+                    )
+                dashboard.append((
+                    habit_id,
+                    name,
+                    periodicity,
+                    running_streak(current_streak, last_check_off, periodicity, now),
+                    longest_streak,
+                    last_check_off,
+                    is_streak_at_risk(current_streak, last_check_off, periodicity, now),
+                ))
+            return dashboard
+
+    def get_habits_at_risk(self, now: Optional[datetime] = None) -> List[Tuple]:
+        """
+        Return the dashboard rows of the habits whose running streak breaks unless they are checked off soon:
+        daily habits not checked off today and weekly habits last checked off 6 or more days ago.
+        """
+        return [row for row in self.get_dashboard(now) if row[-1]]
+
+    def _compute_streak_states(self, session: Session, habit_ids: List[int]) -> Dict[int, dict]:
+        """
+        Compute the HabitStreak column values of the given habits from their check-off history, without storing them.
+        """
+        states = {}
+        for start in range(0, len(habit_ids), BULK_QUERY_CHUNK_SIZE):
+            criterion = Habit.id.in_(habit_ids[start:start + BULK_QUERY_CHUNK_SIZE])
+            rows = self._fetch_all(
+                session.query(Habit.id, Habit.periodicity, CheckOff.date_time)
+                .outerjoin(CheckOff, CheckOff.habit_id == Habit.id)
+                .filter(criterion)
+                .order_by(Habit.id, CheckOff.date_time)
+            )
+            states.update(streak_states(merge_archived(rows, self._archived_histories(session, criterion))))
+        return states
+
+    @instrumented
+    def get_period_history(self, habit_id: int) -> PeriodHistory:
+        """
+        Return the checked off days or weeks of a habit as a bitset, read from the streak cache.
+        """
+        with self._session_scope() as session:
+            histories = self._load_period_histories(session, [habit_id])
+            if habit_id not in histories:
+                raise HabitNotFoundError(habit_not_found_message(habit_id))
+            return histories[habit_id]
+
+    @instrumented
+    def get_period_streaks(self, now: Optional[datetime] = None) -> Dict[int, Tuple[int, int]]:
+        """
+        Return the (current, longest) streak of every habit counted in consecutive checked off periods,
+        days or weeks since the habit was created, computed from the period histories with bit operations.
+        The current streak still runs while the period of now (the current UTC time by default) is not checked off.
+        """
+        today = (now or datetime.utcnow()).date()
+        with self._session_scope() as session:
+            histories = self._load_period_histories(session)
+        return {
+            habit_id: (history.current_streak(today), history.longest_streak())
+            for habit_id, history in histories.items()
+        }
+
+    @instrumented
+    def get_checked_off_periods(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        habit_id: Optional[int] = None,
+    ) -> Dict[int, int]:
+        """
+        Return the number of checked off days or weeks of every habit, or of a single habit, overlapping the days of
+        [since, until), the last 30 days by default, computed from the period histories with bit operations.
+        """
+        since, until = analysis_range(since, until)
+        first_day = since.date()
+        end_day = (until - timedelta(microseconds=1)).date() + timedelta(days=1)
+        with self._session_scope() as session:
+            histories = self._load_period_histories(session, None if habit_id is None else [habit_id])
+        return {row_habit_id: history.count(first_day, end_day) for row_habit_id, history in histories.items()}
+
+    def _load_period_histories(self, session: Session, habit_ids: Optional[List[int]] = None) -> Dict[int, PeriodHistory]:
+        """
+        Return the period history of the given habits, or of every habit, from the streak cache.
+        Histories of habits without cached streak state are computed from their check-offs, without storing them.
+        """
+        query = (
+            session.query(Habit.id, Habit.periodicity, HabitStreak.habit_id, HabitStreak.history_origin, HabitStreak.history)
+            .outerjoin(HabitStreak, HabitStreak.habit_id == Habit.id)
+        )
+        if habit_ids is not None:
+            query = query.filter(Habit.id.in_(habit_ids))
+
+        histories = {}
+        periodicities = {}
+        for habit_id, periodicity, cached, origin, history in self._fetch_all(query.order_by(Habit.id)):
+            if cached is None:
+                periodicities[habit_id] = periodicity
+            else:
+                histories[habit_id] = PeriodHistory.from_blob(periodicity, origin, history)
+        record_cache("streak", not periodicities)
+
+        missing = sorted(periodicities)
+        for start in range(0, len(missing), BULK_QUERY_CHUNK_SIZE):
+            criterion = Habit.id.in_(missing[start:start + BULK_QUERY_CHUNK_SIZE])
+            rows = self._fetch_all(
+                session.query(Habit.id, Habit.periodicity, Habit.creation_date, CheckOff.date_time)
+                .outerjoin(CheckOff, CheckOff.habit_id == Habit.id)
+                .filter(criterion)
+                .order_by(Habit.id, CheckOff.date_time)
+            )
+            states = history_states(merge_archived(rows, self._archived_histories(session, criterion)))
+            for habit_id, state in states.items():
+                histories[habit_id] = PeriodHistory.from_blob(periodicities[habit_id], state["history_origin"], state["history"])
+        return dict(sorted(histories.items()))
+
+    @instrumented
+    def get_check_off_counts(
+        self,
+        period: str = PERIOD_DAY,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        habit_id: Optional[int] = None,
+    ) -> Dict[str, list]:
+        """
+        Return the number of check-offs per day, week (labelled by its Monday) or month within [since, until),
+        the last 30 days by default, optionally of a single habit, as {"period": [...], "check_offs": [...]}
+        ordered by period. Periods without check-offs are left out.
+        The check-offs are counted by the database, which only reads the range through the date_time indexes.
+        Monthly counts of whole months are read from the monthly rollups instead.
+        """
+        since, until = analysis_range(since, until)
+        bucket = period_bucket(period)
+        months, partial_ranges = split_by_month(since, until) if period == PERIOD_MONTH else (None, [(since, until)])
+
+        counts: Dict[str, int] = {}
+        with self._session_scope() as session:
+            if partial_ranges:
+                query = session.query(bucket, func.count(CheckOff.id)).filter(self._within(partial_ranges))
+                if habit_id is not None:
+                    query = query.filter(CheckOff.habit_id == habit_id)
+                counts.update(self._fetch_all(query.group_by(bucket)))
+                for date_times in self._archived_within(session, partial_ranges, habit_id).values():
+                    for label, count in archived_period_counts(date_times, period).items():
+                        counts[label] = counts.get(label, 0) + count
+
+            if months is not None:
+                month = month_label(CheckOffRollup.month)
+                query = (
+                    session.query(month, func.sum(CheckOffRollup.check_offs))
+                    .filter(CheckOffRollup.month >= months[0], CheckOffRollup.month < months[1])
+                )
+                if habit_id is not None:
+                    query = query.filter(CheckOffRollup.habit_id == habit_id)
+                counts.update(self._fetch_all(query.group_by(month)))
+
+        labels = sorted(counts)
+        return {"period": labels, "check_offs": [counts[label] for label in labels]}
+
+    @instrumented
+    def get_completion_rates(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        habit_id: Optional[int] = None,
+    ) -> Dict[str, list]:
+        """
+        Return the adherence of every habit, or of a single habit, within [since, until), the last 30 days by default,
+        as columns habit_id, name, periodicity, check_offs, expected and completion_rate.
+        expected counts the days (daily habits) or started weeks (weekly habits) of the range since the habit was
+        created or first checked off; completion_rate is check_offs / expected, None when nothing was expected.
+        Whole months are read from the monthly rollups and only the rest of the range from the check-offs.
+        """
+        since, until = analysis_range(since, until)
+        last_day = (until - timedelta(microseconds=1)).date()
+        months, partial_ranges = split_by_month(since, until)
+
+        # (check-offs, first day checked off) per habit
+        counts: Dict[int, Tuple[int, date]] = {}
+
+        def add_counts(rows):
+            for row_habit_id, check_offs, first_day in rows:
+                previous_check_offs, previous_first_day = counts.get(row_habit_id, (0, first_day))
+                counts[row_habit_id] = (previous_check_offs + check_offs, min(previous_first_day, first_day))
+
+        with self._session_scope() as session:
+            if partial_ranges:
+                query = (
+                    session.query(CheckOff.habit_id, func.count(CheckOff.id), func.min(CheckOff.day))
+                    .filter(self._within(partial_ranges))
+                )
+                if habit_id is not None:
+                    query = query.filter(CheckOff.habit_id == habit_id)
+                add_counts(self._fetch_all(query.group_by(CheckOff.habit_id)))
+                add_counts(
+                    (row_habit_id, len(date_times), to_datetimes(date_times[:1])[0].date())
+                    for row_habit_id, date_times in self._archived_within(session, partial_ranges, habit_id).items()
+                )
+
+            if months is not None:
+                query = (
+                    session.query(
+                        CheckOffRollup.habit_id,
+                        func.sum(CheckOffRollup.check_offs),
+                        func.min(CheckOffRollup.first_check_off),
+                    )
+                    .filter(CheckOffRollup.month >= months[0], CheckOffRollup.month < months[1])
+                )
+                if habit_id is not None:
+                    query = query.filter(CheckOffRollup.habit_id == habit_id)
+                add_counts(
+                    (row_habit_id, check_offs, first_check_off.date())
+                    for row_habit_id, check_offs, first_check_off in self._fetch_all(query.group_by(CheckOffRollup.habit_id))
+                )
+
+            query = session.query(Habit.id, Habit.name, Habit.periodicity, Habit.creation_date)
+            if habit_id is not None:
+                query = query.filter(Habit.id == habit_id)
+            habits = self._fetch_all(query.order_by(Habit.id))
+
+        columns = {column: [] for column in ("habit_id", "name", "periodicity", "check_offs", "expected", "completion_rate")}
+        for row_habit_id, name, periodicity, creation_date in habits:
+            check_offs, first_day = counts.get(row_habit_id, (0, None))
+            # Check-offs from before the habit was created, such as generated or imported history, count from the first one
+            start_day = min(creation_date.date(), first_day) if first_day else creation_date.date()
+            expected = expected_check_offs(periodicity, max(since.date(), start_day), last_day)
+
+            columns["habit_id"].append(row_habit_id)
+            columns["name"].append(name)
+            columns["periodicity"].append(periodicity)
+            columns["check_offs"].append(check_offs)
+            columns["expected"].append(expected)
+            columns["completion_rate"].append(check_offs / expected if expected else None)
+        return columns
+
+    def _archived_within(self, session: Session, ranges: List[Tuple[datetime, datetime]], habit_id: Optional[int]) -> Dict[int, object]:
+        """
+        Return the archived date_times within the ranges of every habit, or of a single habit, that has some.
+        """
+        criterion = None if habit_id is None else Habit.id == habit_id
+        return within(self._archived_histories(session, criterion, ranges[0][0], ranges[-1][1]), ranges)
+
+    @staticmethod
+    def _within(ranges: List[Tuple[datetime, datetime]]):
+        return or_(*(and_(CheckOff.date_time >= since, CheckOff.date_time < until) for since, until in ranges))
+
+    @instrumented
     def generate_example_data(self, predefined_habits: List[dict], start_date: datetime, weeks: int = 4) -> List[Habit]:
-        added_habits = []
         total_days = weeks * 7
 
         # start_date should be at least n weeks before the current date
@@ -167,26 +1459,13 @@ class HabitTracker:
         if start_date > datetime.utcnow() - timedelta(weeks=weeks):
             raise InvalidStartDateError(f"Start date should be in the past by at least {weeks} weeks.")        
 
-        for predefined_habit in predefined_habits:
-            habit = self.add_habit(
-                name=predefined_habit["name"],
-                description=predefined_habit["description"],
-                periodicity=predefined_habit["periodicity"],
-            )
-            added_habits.append(habit)
-
-        for habit in added_habits:
-            periodicity = 1 if habit.periodicity == PERIODICITY_DAILY else 7
-            current_date = start_date
+        added_habits = self.add_habits(predefined_habits)
 
-            while current_date < start_date + timedelta(days=total_days):
-                try:
-                    self.session.begin_nested()
-                    self.check_off_habit(habit.id, current_date)
-                    self.session.commit()
-                except ValueError:
-                    self.session.rollback()
-
-                current_date += timedelta(days=periodicity)
+        records = (
+            (habit.id, start_date + timedelta(days=offset))
+            for habit in added_habits
+            for offset in range(0, total_days, streak_interval(habit.periodicity))
+        )
+        self.bulk_check_off(records)
 
         return added_habits
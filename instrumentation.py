@@ -0,0 +1,191 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from constants import LATENCY_BUCKETS_SECONDS
+
+# Statistics of the operations running in the current thread or task, outermost first
+_active_operations: ContextVar[Tuple["OperationStats", ...]] = ContextVar("active_operations", default=())
+
+
+class OperationStats:
+    """
+    Counters of one running operation.
+    """
+    __slots__ = ("instrumentation", "statements", "rows")
+
+    def __init__(self, instrumentation: "Instrumentation"):
+        self.instrumentation = instrumentation
+        self.statements = 0
+        self.rows = 0
+
+
+class Instrumentation:
+    """
+    Collect per-operation latency histograms, SQL statement and fetched row counts, and cache hits and misses.
+    Operations are timed with operation(); statements are counted by listening to the engines given to attach_engine,
+    and rows and cache lookups are reported by the code that fetches them with record_rows and record_cache.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_SECONDS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations: Dict[str, dict] = {}
+            self._caches: Dict[str, Dict[str, int]] = {}
+            self._statements = 0
+
+    def attach_engine(self, engine: Engine) -> None:
+        """
+        Count the SQL statements executed on engine, overall and per running operation.
+        """
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany) -> None:
+        for operation in _active_operations.get():
+            operation.statements += 1
+        with self._lock:
+            self._statements += 1
+
+    @contextmanager
+    def operation(self, name: str) -> Iterator[OperationStats]:
+        """
+        Time the enclosed block as one call of the operation name and collect its statement and row counts.
+        Operations can be nested: statements and rows of an inner operation count for the outer operations too.
+        """
+        stats = OperationStats(self)
+        token = _active_operations.set(_active_operations.get() + (stats,))
+        failed = False
+        start = time.perf_counter()
+        try:
+            yield stats
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _active_operations.reset(token)
+            self._record_operation(name, elapsed, stats, failed)
+
+    def _record_operation(self, name: str, elapsed: float, stats: OperationStats, failed: bool) -> None:
+        with self._lock:
+            operation = self._operations.get(name)
+            if operation is None:
+                operation = self._operations[name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "seconds": 0.0,
+                    "bucket_counts": [0] * (len(self.buckets) + 1),
+                    "statements": 0,
+                    "max_statements": 0,
+                    "rows": 0,
+                }
+            operation["count"] += 1
+            operation["errors"] += failed
+            operation["seconds"] += elapsed
+            operation["bucket_counts"][bisect_left(self.buckets, elapsed)] += 1
+            operation["statements"] += stats.statements
+            operation["max_statements"] = max(operation["max_statements"], stats.statements)
+            operation["rows"] += stats.rows
+
+    def _record_cache(self, cache: str, hit: bool) -> None:
+        with self._lock:
+            counters = self._caches.setdefault(cache, {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Return a JSON serializable copy of the collected statistics.
+        Histogram buckets are cumulative (upper bound, calls) pairs; the last upper bound is "+Inf".
+        """
+        with self._lock:
+            operations = {}
+            for name, operation in sorted(self._operations.items()):
+                cumulative = 0
+                buckets = []
+                for upper_bound, count in zip(self.buckets + ("+Inf",), operation["bucket_counts"]):
+                    cumulative += count
+                    buckets.append([upper_bound, cumulative])
+                operations[name] = {
+                    key: value for key, value in operation.items() if key != "bucket_counts"
+                } | {"buckets": buckets}
+            return {
+                "operations": operations,
+                "caches": {name: dict(counters) for name, counters in sorted(self._caches.items())},
+                "statements": self._statements,
+            }
+
+
+def instrumented(method):
+    """
+    Record every call of a tracker method as an operation of the tracker's instrumentation, if it has one.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.instrumentation is None:
+            return method(self, *args, **kwargs)
+        with self.instrumentation.operation(name):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def record_rows(count: int) -> None:
+    """
+    Count rows fetched from the database for the running operations. Does nothing outside an operation.
+    """
+    for operation in _active_operations.get():
+        operation.rows += count
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """
+    Count a hit or miss of the named cache. Does nothing outside an operation.
+    """
+    operations = _active_operations.get()
+    if operations:
+        operations[-1].instrumentation._record_cache(cache, hit)
+
+
+def to_prometheus(snapshot: dict, prefix: str = "habit_tracker") -> str:
+    """
+    Format a snapshot in the Prometheus text exposition format.
+    """
+    lines = [
+        f"# TYPE {prefix}_operation_duration_seconds histogram",
+    ]
+    for name, operation in snapshot["operations"].items():
+        for upper_bound, count in operation["buckets"]:
+            lines.append(f'{prefix}_operation_duration_seconds_bucket{{operation="{name}",le="{upper_bound}"}} {count}')
+        lines.append(f'{prefix}_operation_duration_seconds_sum{{operation="{name}"}} {operation["seconds"]}')
+        lines.append(f'{prefix}_operation_duration_seconds_count{{operation="{name}"}} {operation["count"]}')
+
+    for metric, key in (("operation_errors", "errors"), ("operation_statements", "statements"), ("operation_rows", "rows")):
+        lines.append(f"# TYPE {prefix}_{metric}_total counter")
+        for name, operation in snapshot["operations"].items():
+            lines.append(f'{prefix}_{metric}_total{{operation="{name}"}} {operation[key]}')
+
+    lines.append(f"# TYPE {prefix}_operation_max_statements gauge")
+    for name, operation in snapshot["operations"].items():
+        lines.append(f'{prefix}_operation_max_statements{{operation="{name}"}} {operation["max_statements"]}')
+
+    for metric in ("hits", "misses"):
+        lines.append(f"# TYPE {prefix}_cache_{metric}_total counter")
+        for cache, counters in snapshot["caches"].items():
+            lines.append(f'{prefix}_cache_{metric}_total{{cache="{cache}"}} {counters[metric]}')
+
+    lines.append(f"# TYPE {prefix}_statements_total counter")
+    lines.append(f"{prefix}_statements_total {snapshot['statements']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,123 @@
+from typing import Optional
+
+from sqlalchemy import MetaData, bindparam, inspect, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+from archive import CheckOffArchive
+
+from bitmap import history_states
+from constants import SCHEMA_VERSION
+from habit import Base, CheckOff, CheckOffRollup, Habit, HabitStreak
+from rollups import backfill_rollups_statement
+
+
+def upgrade_schema(engine: Engine, archive: Optional[CheckOffArchive] = None) -> None:
+    """
+    Create missing tables and bring an existing database up to the current schema version.
+    The version is stored in SQLite's user_version pragma, so an up to date database is left untouched.
+    The check-off archive of the database, if any, tells which check-off ids were given out before archiving.
+    """
+    with engine.begin() as connection:
+        upgrade_schema_on_connection(connection, archive)
+
+
+def upgrade_schema_on_connection(connection: Connection, archive: Optional[CheckOffArchive] = None) -> None:
+    """
+    Same as upgrade_schema, on an open connection. Async engines run it with AsyncConnection.run_sync.
+    """
+    if connection.dialect.name != "sqlite":
+        Base.metadata.create_all(connection)
+        return
+
+    version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    if version >= SCHEMA_VERSION:
+        return
+
+    inspector = inspect(connection)
+    has_check_offs = inspector.has_table(CheckOff.__tablename__)
+    if has_check_offs:
+        columns = {column["name"] for column in inspector.get_columns(CheckOff.__tablename__)}
+        if "day" not in columns:
+            _add_check_off_day(connection)
+        if "AUTOINCREMENT" not in _table_sql(connection, CheckOff.__tablename__).upper():
+            _add_check_off_autoincrement(connection, archive)
+    # Version 3: monthly check-off rollups, computed once from the existing check-offs
+    backfill_rollups = has_check_offs and not inspector.has_table(CheckOffRollup.__tablename__)
+    if inspector.has_table(HabitStreak.__tablename__):
+        columns = {column["name"] for column in inspector.get_columns(HabitStreak.__tablename__)}
+        if "history" not in columns:
+            _add_streak_histories(connection)
+
+    # Version 5: the offset index of the check-off archive, a new table created by create_all
+    Base.metadata.create_all(connection)
+    # create_all skips existing tables, so indexes added to them in later versions are created here
+    for index in CheckOff.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    if backfill_rollups:
+        connection.execute(backfill_rollups_statement())
+    connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _add_check_off_day(connection) -> None:
+    """
+    Version 1: store the day of each check-off so it can back the unique (habit_id, day) index.
+    Duplicate check-offs on the same day, which older versions could store under concurrent writes, are dropped.
+    """
+    connection.exec_driver_sql("ALTER TABLE check_offs ADD COLUMN day DATE")
+    connection.exec_driver_sql("UPDATE check_offs SET day = date(date_time)")
+    connection.exec_driver_sql(
+        "DELETE FROM check_offs WHERE id NOT IN (SELECT MIN(id) FROM check_offs GROUP BY habit_id, day)"
+    )
+
+
+def _add_streak_histories(connection) -> None:
+    """
+    Version 4: store the checked off periods of each habit as a bitset next to its cached streak.
+    """
+    connection.exec_driver_sql("ALTER TABLE habit_streaks ADD COLUMN history_origin DATE")
+    connection.exec_driver_sql("ALTER TABLE habit_streaks ADD COLUMN history BLOB")
+    rows = connection.execute(
+        select(Habit.id, Habit.periodicity, Habit.creation_date, CheckOff.date_time)
+        .join(HabitStreak, HabitStreak.habit_id == Habit.id)
+        .outerjoin(CheckOff, CheckOff.habit_id == Habit.id)
+        .order_by(Habit.id, CheckOff.date_time)
+    ).all()
+    states = history_states(rows)
+    if states:
+        connection.execute(
+            update(HabitStreak.__table__).where(HabitStreak.__table__.c.habit_id == bindparam("key")),
+            [{"key": habit_id, **state} for habit_id, state in states.items()],
+        )
+
+
+def _table_sql(connection, table: str) -> str:
+    return connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).scalar()
+
+
+def _add_check_off_autoincrement(connection, archive: Optional[CheckOffArchive]) -> None:
+    """
+    Version 6: rebuild the check_offs table with AUTOINCREMENT ids, so ids of archived or deleted check-offs are not
+    reused. SQLite cannot add it in place. The id sequence starts after the largest live or archived id.
+    The indexes, dropped with the old table, are created again by upgrade_schema_on_connection.
+    """
+    metadata = MetaData()
+    # The habits table is copied too, so the foreign key of the new table resolves
+    Habit.__table__.to_metadata(metadata)
+    table = CheckOff.__table__.to_metadata(metadata, name=f"{CheckOff.__tablename__}_new")
+    columns = ", ".join(column.name for column in table.columns)
+
+    connection.execute(CreateTable(table))
+    connection.exec_driver_sql(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {CheckOff.__tablename__}")
+    # Nothing references check_offs, so dropping it with the foreign_keys pragma on deletes nothing else
+    connection.exec_driver_sql(f"DROP TABLE {CheckOff.__tablename__}")
+    connection.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {CheckOff.__tablename__}")
+
+    archived_id = archive.max_id() if archive is not None else None
+    if archived_id is not None:
+        parameters = {"name": CheckOff.__tablename__, "seq": archived_id}
+        updated = connection.exec_driver_sql(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, :seq) WHERE name = :name", parameters
+        ).rowcount
+        if not updated:
+            connection.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)", parameters)
@@ -0,0 +1,60 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from constants import PARALLEL_SHARDS_PER_WORKER
+
+# Tracker of the worker process, on a read-only session, set by _init_worker
+_worker_tracker = None
+
+
+def habit_id_shards(habit_ids: Sequence[int], shards: int) -> List[Tuple[int, int]]:
+    """
+    Split ordered habit ids into at most shards (first_id, last_id) ranges of about the same number of habits.
+    """
+    if not habit_ids:
+        return []
+    size = -(-len(habit_ids) // max(shards, 1))
+    return [
+        (habit_ids[start], habit_ids[min(start + size, len(habit_ids)) - 1])
+        for start in range(0, len(habit_ids), size)
+    ]
+
+
+def map_habit_shards(config: dict, task: str, habit_ids: Sequence[int], workers: int) -> dict:
+    """
+    Run the HabitTracker method named task over shards of habit_ids in a pool of workers processes
+    and merge the dictionaries it returns. Every worker opens the configured database read-only once.
+    The habits are split in PARALLEL_SHARDS_PER_WORKER shards per worker, so a shard of long histories
+    does not leave the other workers idle.
+    """
+    shards = habit_id_shards(habit_ids, workers * PARALLEL_SHARDS_PER_WORKER)
+    if not shards:
+        return {}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards)), initializer=_init_worker, initargs=(config,)) as executor:
+        for result in executor.map(_run_task, [task] * len(shards), *zip(*shards)):
+            results.update(result)
+    return results
+
+
+def _init_worker(config: dict) -> None:
+    global _worker_tracker
+    # Imported here, the habit tracker module imports this one
+    from sqlalchemy.orm import sessionmaker
+
+    from archive import resolve_archive_path
+    from database import create_read_only_engine
+    from habit_tracker import HabitTracker
+
+    session = sessionmaker(bind=create_read_only_engine(config))()
+    _worker_tracker = HabitTracker(session, archive_path=resolve_archive_path(config))
+
+
+def _run_task(task: str, first_id: Optional[int], last_id: Optional[int]) -> dict:
+    session = _worker_tracker.session
+    try:
+        return getattr(_worker_tracker, task)(session, first_id, last_id)
+    finally:
+        # End the read transaction, so the worker does not pin an old snapshot of the database
+        session.rollback()
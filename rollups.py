@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from date_functions import month_start
+from habit import CheckOff, CheckOffRollup
+
+
+def rollup_rows(check_offs: Iterable[Tuple[int, datetime]]) -> List[dict]:
+    """
+    Aggregate (habit_id, date_time) check-offs into CheckOffRollup rows, one per habit and month.
+    """
+    rollups: Dict[Tuple[int, object], dict] = {}
+    for habit_id, date_time in check_offs:
+        month = date_time.date().replace(day=1)
+        rollup = rollups.get((habit_id, month))
+        if rollup is None:
+            rollups[habit_id, month] = {
+                "habit_id": habit_id,
+                "month": month,
+                "check_offs": 1,
+                "first_check_off": date_time,
+                "last_check_off": date_time,
+            }
+        else:
+            rollup["check_offs"] += 1
+            rollup["first_check_off"] = min(rollup["first_check_off"], date_time)
+            rollup["last_check_off"] = max(rollup["last_check_off"], date_time)
+    return list(rollups.values())
+
+
+def add_to_rollups_statement(dialect_name: str):
+    """
+    Return an upsert adding CheckOffRollup rows of new check-offs to the stored rollups of their months,
+    for the database dialect named dialect_name, PostgreSQL or otherwise SQLite.
+    """
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(CheckOffRollup)
+        least, greatest = func.least, func.greatest
+    else:
+        statement = sqlite.insert(CheckOffRollup)
+        # SQLite's min and max of two arguments are scalar functions
+        least, greatest = func.min, func.max
+    return statement.on_conflict_do_update(
+        index_elements=[CheckOffRollup.habit_id, CheckOffRollup.month],
+        set_={
+            "check_offs": CheckOffRollup.check_offs + statement.excluded.check_offs,
+            "first_check_off": least(CheckOffRollup.first_check_off, statement.excluded.first_check_off),
+            "last_check_off": greatest(CheckOffRollup.last_check_off, statement.excluded.last_check_off),
+        },
+    )
+
+
+def backfill_rollups_statement(habit_ids: Optional[List[int]] = None):
+    """
+    Return an INSERT ... SELECT computing the rollups of the given habits, or of every habit, from their check-offs.
+    """
+    month = month_start(CheckOff.day)
+    query = (
+        select(
+            CheckOff.habit_id,
+            month,
+            func.count(CheckOff.id),
+            func.min(CheckOff.date_time),
+            func.max(CheckOff.date_time),
+        )
+        .group_by(CheckOff.habit_id, month)
+    )
+    if habit_ids is not None:
+        query = query.where(CheckOff.habit_id.in_(habit_ids))
+    return insert(CheckOffRollup).from_select(
+        ["habit_id", "month", "check_offs", "first_check_off", "last_check_off"],
+        query,
+    )
@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from constants import DAEMON_SOCKET_PATH
+from exceptions import DaemonError, HabitNotFoundError, InvalidStartDateError, MultipleCheckOffError
+
+logger = logging.getLogger(__name__)
+
+# Errors reported to clients with their type, so the client can raise the same exception
+EXPECTED_ERRORS = (HabitNotFoundError, InvalidStartDateError, MultipleCheckOffError, ValueError, TypeError)
+
+
+def _datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _check_off_habit(tracker, habit_id: int, check_off_date: Optional[str] = None) -> dict:
+    check_off = tracker.check_off_habit(habit_id, _datetime(check_off_date))
+    return {"id": check_off.id, "habit_id": check_off.habit_id, "date_time": _isoformat(check_off.date_time)}
+
+
+def _habit_summary(habit) -> dict:
+    return {"id": habit.id, "name": habit.name, "periodicity": habit.periodicity}
+
+
+def _add_habit(tracker, name: str, description: Optional[str], periodicity: int) -> dict:
+    return _habit_summary(tracker.add_habit(name=name, description=description, periodicity=periodicity))
+
+
+def _get_habit(tracker, habit_id: int) -> dict:
+    habit = tracker.get_habit(habit_id)
+    return {
+        "id": habit.id,
+        "name": habit.name,
+        "description": habit.description,
+        "periodicity": habit.periodicity,
+        "creation_date": _isoformat(habit.creation_date),
+    }
+
+
+def _get_habit_rows(tracker, after_id: Optional[int] = None, limit: Optional[int] = None) -> list:
+    return [
+        [habit_id, name, description, periodicity, _isoformat(creation_date)]
+        for habit_id, name, description, periodicity, creation_date in tracker.get_habit_rows(after_id, limit)
+    ]
+
+
+def _get_check_off_rows(tracker, habit_id=None, after_id=None, limit=None, since=None, until=None) -> list:
+    rows = tracker.get_check_off_rows(habit_id, after_id, limit, _datetime(since), _datetime(until))
+    return [[check_off_id, row_habit_id, _isoformat(date_time)] for check_off_id, row_habit_id, date_time in rows]
+
+
+def _get_last_check_off_for_habit(tracker, habit_id: int) -> Optional[str]:
+    check_off = tracker.get_last_check_off_for_habit(habit_id)
+    return _isoformat(check_off.date_time) if check_off else None
+
+
+def _get_longest_check_off_streaks(tracker, workers: Optional[int] = None) -> list:
+    return [[habit_id, streak] for habit_id, streak in tracker.get_longest_check_off_streaks(workers).items()]
+
+
+def _get_dashboard(tracker, now: Optional[str] = None, at_risk_only: bool = False) -> list:
+    rows = tracker.get_habits_at_risk(_datetime(now)) if at_risk_only else tracker.get_dashboard(_datetime(now))
+    return [
+        [habit_id, name, periodicity, current_streak, longest_streak, _isoformat(last_check_off), at_risk]
+        for habit_id, name, periodicity, current_streak, longest_streak, last_check_off, at_risk in rows
+    ]
+
+
+def _get_check_off_counts(tracker, period: str = "day", since=None, until=None, habit_id=None) -> dict:
+    return tracker.get_check_off_counts(period, _datetime(since), _datetime(until), habit_id)
+
+
+def _get_completion_rates(tracker, since=None, until=None, habit_id=None) -> dict:
+    return tracker.get_completion_rates(_datetime(since), _datetime(until), habit_id)
+
+
+def _get_period_streaks(tracker, now: Optional[str] = None) -> list:
+    return [[habit_id, current, longest] for habit_id, (current, longest) in tracker.get_period_streaks(_datetime(now)).items()]
+
+
+def _get_checked_off_periods(tracker, since=None, until=None, habit_id=None) -> list:
+    return [list(item) for item in tracker.get_checked_off_periods(_datetime(since), _datetime(until), habit_id).items()]
+
+
+def _delete_habits_where(tracker, periodicity=None, created_before=None, name=None) -> int:
+    return tracker.delete_habits_where(periodicity=periodicity, created_before=_datetime(created_before), name=name)
+
+
+def _import_check_offs(tracker, path: str, fmt: Optional[str] = None) -> list:
+    count, rejected = tracker.import_check_offs(path, fmt)
+    return [count, [[habit_id, _isoformat(date_time), reason] for habit_id, date_time, reason in rejected]]
+
+
+def _generate_example_data(tracker, predefined_habits: list, start_date: str, weeks: int = 4) -> list:
+    return [_habit_summary(habit) for habit in tracker.generate_example_data(predefined_habits, _datetime(start_date), weeks)]
+
+
+def _get_stats(tracker) -> Optional[dict]:
+    return tracker.instrumentation.snapshot() if tracker.instrumentation is not None else None
+
+
+METHODS: Dict[str, Callable[..., Any]] = {
+    "add_habit": _add_habit,
+    "check_off_habit": _check_off_habit,
+    "get_habit": _get_habit,
+    "get_habit_rows": _get_habit_rows,
+    "get_check_off_rows": _get_check_off_rows,
+    "get_last_check_off_for_habit": _get_last_check_off_for_habit,
+    "get_longest_check_off_streak_for_habit": lambda tracker, habit_id: tracker.get_longest_check_off_streak_for_habit(habit_id),
+    "get_longest_check_off_streaks": _get_longest_check_off_streaks,
+    "get_longest_streak_of_all_habits": lambda tracker, workers=None: list(tracker.get_longest_streak_of_all_habits(workers)),
+    "get_current_streak": lambda tracker, habit_id, now=None: tracker.get_current_streak(habit_id, _datetime(now)),
+    "get_dashboard": _get_dashboard,
+    "get_check_off_counts": _get_check_off_counts,
+    "get_completion_rates": _get_completion_rates,
+    "get_period_streaks": _get_period_streaks,
+    "get_checked_off_periods": _get_checked_off_periods,
+    "get_stats": _get_stats,
+    "delete_habit": lambda tracker, habit_id: tracker.delete_habit(habit_id),
+    "delete_habits": lambda tracker, habit_ids: tracker.delete_habits(habit_ids),
+    "delete_habits_where": _delete_habits_where,
+    "delete_all_habits": lambda tracker: tracker.delete_all_habits(),
+    # Paths are opened by the daemon, so clients send absolute paths
+    "export_habits": lambda tracker, path, fmt=None: tracker.export_habits(path, fmt),
+    "export_check_offs": lambda tracker, path, fmt=None: tracker.export_check_offs(path, fmt),
+    "import_habits": lambda tracker, path, fmt=None: tracker.import_habits(path, fmt),
+    "import_check_offs": _import_check_offs,
+    "rebuild_streak_cache": lambda tracker, workers=None: tracker.rebuild_streak_cache(workers),
+    "rebuild_rollups": lambda tracker: tracker.rebuild_rollups(),
+    "archive_check_offs": lambda tracker, before: tracker.archive_check_offs(_datetime(before)),
+    "generate_example_data": _generate_example_data,
+}
+
+
+def dispatch(tracker, method: str, params: Optional[dict] = None) -> Any:
+    """
+    Run a method of the daemon API on a tracker and return its JSON serializable result.
+    Used by the daemon for socket requests and by the CLI when no daemon is running, so both return the same shapes.
+    """
+    if method not in METHODS:
+        raise DaemonError(f"Unknown method {method}.")
+    return METHODS[method](tracker, **(params or {}))
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle newline delimited JSON requests {"method": ..., "params": {...}} on a connection until the client closes it.
+    Each request is answered with {"result": ...} or {"error": {"type": ..., "message": ...}}.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.handle_request_line(line)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class HabitTrackerServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serve the daemon API over a Unix domain socket, keeping one HabitTracker and its database engine alive.
+    Each connection is served by its own thread, so a client keeping its connection open does not block the others,
+    and requests run one at a time under a lock, so the tracker, and a session it shares, is never used concurrently.
+    """
+
+    # Connections left open by clients do not keep the daemon from exiting
+    daemon_threads = True
+
+    def __init__(self, tracker, socket_path: str = DAEMON_SOCKET_PATH):
+        self.tracker = tracker
+        self.socket_path = socket_path
+        self._lock = threading.Lock()
+        _remove_stale_socket(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+
+    def handle_request_line(self, line: bytes) -> dict:
+        with self._lock:
+            try:
+                request = json.loads(line)
+                return {"result": dispatch(self.tracker, request["method"], request.get("params"))}
+            except EXPECTED_ERRORS + (DaemonError,) as e:
+                return {"error": {"type": type(e).__name__, "message": str(e)}}
+            except Exception as e:
+                logger.exception("Request failed")
+                return {"error": {"type": DaemonError.__name__, "message": f"{type(e).__name__}: {e}"}}
+            finally:
+                # A tracker sharing one session needs its transaction ended, so the next request sees writes
+                # made by other processes. Trackers with a session per operation already end it.
+                if self.tracker.session is not None:
+                    self.tracker.session.close()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)
+            return
+    raise DaemonError(f"A daemon is already listening on {socket_path}.")
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(tracker, socket_path: str = DAEMON_SOCKET_PATH) -> None:
+    """
+    Run the daemon until it is interrupted or terminated, then remove its socket.
+    """
+    signal.signal(signal.SIGTERM, _stop)
+    with HabitTrackerServer(tracker, socket_path) as server:
+        logger.info(f"Listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
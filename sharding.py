@@ -0,0 +1,408 @@
+import heapq
+import logging
+import os
+import random
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import count
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.engine import make_url
+
+from analytics import analysis_range
+from bitmap import PeriodHistory
+from config import load_config
+from constants import BULK_CHECK_OFF_BATCH_SIZE, PERIOD_DAY
+from data_io import detect_format, read_rows
+from database import is_in_memory_database
+from habit import CheckOff, Habit
+from habit_tracker import HabitTracker
+from instrumentation import Instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+def shard_config(config: dict, index: int) -> dict:
+    """
+    Return the settings of shard index: the database file of the configured URL with a -shard<index> suffix,
+    and a subdirectory of the configured archive directory, if any. In-memory databases are per engine already.
+    """
+    url = make_url(config["database_url"])
+    if not is_in_memory_database(url):
+        root, extension = os.path.splitext(url.database)
+        url = url.set(database=f"{root}-shard{index}{extension}")
+
+    archive_path = config["archive_path"]
+    if archive_path:
+        archive_path = os.path.join(archive_path, f"shard{index}")
+    return dict(config, database_url=url.render_as_string(hide_password=False), archive_path=archive_path, shards=1)
+
+
+class ShardedHabitTracker:
+    """
+    HabitTracker over several databases, the shards, so writers of habits in different shards do not contend
+    on one SQLite lock. Shard i stores the habits whose id is congruent to i + 1 modulo the number of shards,
+    which it allocates itself, so an operation on a habit or its check-offs goes to a single shard without a lookup.
+    New habits go to the shard of shard_key, such as the user they belong to, or to the shards in turn.
+    Operations over all habits run on every shard concurrently, in a thread per shard, and their results are merged.
+
+    Check-off ids are only unique within a shard: they are returned as (id - 1) * shards + index + 1,
+    which is unique and congruent to index + 1 like the ids of the habits of the shard.
+    """
+
+    def __init__(
+        self,
+        config: Optional[dict] = None,
+        database_url: Optional[str] = None,
+        instrumentation: Optional[Instrumentation] = None,
+    ):
+        """
+        Open the configured number of shards, see shard_config. Operations of every shard are recorded
+        by the given instrumentation, or by a new one if the instrumentation setting is on.
+        """
+        # Every operation opens its own sessions, as with a HabitTracker without a session
+        self.session = None
+        self.config = config or load_config(database_url=database_url)
+        if self.config["shards"] < 1:
+            raise ValueError(f"Invalid number of shards {self.config['shards']}. Use 1 or more.")
+        if instrumentation is None and self.config["instrumentation"]:
+            instrumentation = Instrumentation()
+        self.instrumentation = instrumentation
+
+        shards = self.config["shards"]
+        self.shards = [
+            HabitTracker(config=shard_config(self.config, index), instrumentation=instrumentation, shard=(index, shards))
+            for index in range(shards)
+        ]
+        # An in-memory SQLite database is only visible to the thread that opened it, so its shards run in turn
+        self._executor = None
+        if not is_in_memory_database(make_url(self.config["database_url"])):
+            self._executor = ThreadPoolExecutor(max_workers=shards, thread_name_prefix="shard")
+        # Processes adding a few habits each, such as CLI commands, would all start at the first shard
+        self._next_shard = count(random.randrange(shards))
+
+    def close(self) -> None:
+        """
+        Stop the fan-out threads and close the pooled connections of every shard.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+        for shard in self.shards:
+            shard.engine.dispose()
+
+    def shard_index(self, habit_id: int) -> int:
+        return (habit_id - 1) % len(self.shards)
+
+    def shard_for(self, habit_id: int) -> HabitTracker:
+        """
+        Return the tracker of the shard storing a habit.
+        """
+        return self.shards[self.shard_index(habit_id)]
+
+    def _place(self, shard_key: Optional[Hashable]) -> int:
+        """
+        Return the shard of a new habit: the shard of shard_key, by a hash that is stable across processes,
+        or the next shard in turn, starting at a random shard.
+        """
+        if shard_key is None:
+            return next(self._next_shard) % len(self.shards)
+        return zlib.crc32(str(shard_key).encode()) % len(self.shards)
+
+    def _fan_out(self, call: Callable[[int, HabitTracker], object]) -> list:
+        """
+        Run call(index, shard) on every shard concurrently. Returns the results in shard order.
+        """
+        if self._executor is None:
+            return [call(index, shard) for index, shard in enumerate(self.shards)]
+        futures = [self._executor.submit(call, index, shard) for index, shard in enumerate(self.shards)]
+        return [future.result() for future in futures]
+
+    def _partitions(self, items: Iterable, habit_id: Callable, batch_size: int) -> Iterator[List[list]]:
+        """
+        Read items in chunks of batch_size items per shard, and yield each chunk split by the shard of habit_id(item),
+        so streams such as file imports are not loaded in memory at once.
+        """
+        for chunk in HabitTracker._batched(items, batch_size * len(self.shards)):
+            parts = [[] for _ in self.shards]
+            for item in chunk:
+                parts[self.shard_index(habit_id(item))].append(item)
+            yield parts
+
+    def _check_off_id(self, index: int, check_off_id: Optional[int]) -> Optional[int]:
+        if check_off_id is None:
+            return None
+        return (check_off_id - 1) * len(self.shards) + index + 1
+
+    def _local_check_off_id(self, index: int, check_off_id: Optional[int]) -> Optional[int]:
+        """
+        Return the largest id of shard index whose check-off id is at most check_off_id, to paginate after it.
+        """
+        if check_off_id is None:
+            return None
+        return (check_off_id - index - 1) // len(self.shards) + 1
+
+    def _with_check_off_id(self, index: int, check_off: Optional[CheckOff]) -> Optional[CheckOff]:
+        if check_off is None:
+            return None
+        return CheckOff(
+            id=self._check_off_id(index, check_off.id),
+            habit_id=check_off.habit_id,
+            date_time=check_off.date_time,
+            day=check_off.day,
+        )
+
+    @staticmethod
+    def _merge_pages(pages: List[list], key: Callable, limit: Optional[int]) -> list:
+        """
+        Merge pages of the shards, each ordered by key, into one page of up to limit items.
+        """
+        return list(heapq.merge(*pages, key=key))[:limit]
+
+    def add_habit(self, name: str, description: str, periodicity: int, shard_key: Optional[Hashable] = None) -> Habit:
+        return self.shards[self._place(shard_key)].add_habit(name, description, periodicity)
+
+    def add_habits(
+        self,
+        habits: Iterable[dict],
+        batch_size: int = BULK_CHECK_OFF_BATCH_SIZE,
+        shard_key: Optional[Hashable] = None,
+    ) -> List[Habit]:
+        """
+        Add many habits, all to the shard of shard_key or to the shards in turn, in one transaction per shard.
+        Returns the added habits in the given order.
+        """
+        parts = [[] for _ in self.shards]
+        for position, habit in enumerate(habits):
+            parts[self._place(shard_key)].append((position, habit))
+
+        def add(index: int, shard: HabitTracker) -> List[Habit]:
+            return shard.add_habits([habit for _, habit in parts[index]], batch_size) if parts[index] else []
+
+        ordered = {}
+        for part, added in zip(parts, self._fan_out(add)):
+            for (position, _), habit in zip(part, added):
+                ordered[position] = habit
+        return [ordered[position] for position in sorted(ordered)]
+
+    def check_off_habit(self, habit_id: int, check_off_date: Optional[datetime] = None) -> CheckOff:
+        index = self.shard_index(habit_id)
+        return self._with_check_off_id(index, self.shards[index].check_off_habit(habit_id, check_off_date))
+
+    def bulk_check_off(
+        self,
+        records: Iterable[Tuple[int, datetime]],
+        batch_size: int = BULK_CHECK_OFF_BATCH_SIZE,
+    ) -> Tuple[int, List[Tuple[int, datetime, str]]]:
+        """
+        Check off many habits at once. Records are read batch_size per shard at a time, and each chunk is written
+        in one transaction per shard, the shards concurrently.
+        Returns the number of inserted check-offs and the rejected records, grouped by shard within each chunk.
+        """
+        inserted, rejected = 0, []
+        for parts in self._partitions(records, lambda record: record[0], batch_size):
+            results = self._fan_out(lambda index, shard: shard.bulk_check_off(parts[index], batch_size) if parts[index] else (0, []))
+            inserted += sum(count for count, _ in results)
+            rejected.extend(record for _, records_of_shard in results for record in records_of_shard)
+        return inserted, rejected
+
+    def get_habit(self, habit_id: int) -> Habit:
+        return self.shard_for(habit_id).get_habit(habit_id)
+
+    def get_habits(self, after_id: Optional[int] = None, limit: Optional[int] = None) -> List[Habit]:
+        pages = self._fan_out(lambda index, shard: sorted(shard.get_habits(after_id, limit), key=lambda habit: habit.id))
+        return self._merge_pages(pages, lambda habit: habit.id, limit)
+
+    def get_habit_rows(self, after_id: Optional[int] = None, limit: Optional[int] = None) -> List[Tuple]:
+        pages = self._fan_out(lambda index, shard: sorted(shard.get_habit_rows(after_id, limit)))
+        return self._merge_pages(pages, lambda row: row[0], limit)
+
+    def delete_habit(self, habit_id: int) -> None:
+        self.shard_for(habit_id).delete_habit(habit_id)
+
+    def delete_habits(self, habit_ids: Iterable[int]) -> int:
+        count = 0
+        for parts in self._partitions(habit_ids, lambda habit_id: habit_id, BULK_CHECK_OFF_BATCH_SIZE):
+            count += sum(self._fan_out(lambda index, shard: shard.delete_habits(parts[index]) if parts[index] else 0))
+        return count
+
+    def delete_habits_where(
+        self,
+        periodicity: Optional[int] = None,
+        created_before: Optional[datetime] = None,
+        name: Optional[str] = None,
+    ) -> int:
+        if periodicity is None and created_before is None and name is None:
+            raise ValueError("No filter given. Use delete_all_habits to delete every habit.")
+        return sum(self._fan_out(lambda index, shard: shard.delete_habits_where(periodicity, created_before, name)))
+
+    def delete_all_habits(self) -> None:
+        self._fan_out(lambda index, shard: shard.delete_all_habits())
+
+    def get_last_check_off_for_habit(self, habit_id: int) -> Optional[CheckOff]:
+        index = self.shard_index(habit_id)
+        return self._with_check_off_id(index, self.shards[index].get_last_check_off_for_habit(habit_id))
+
+    def get_all_check_offs_for_habit(
+        self,
+        habit_id: int,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[CheckOff]:
+        index = self.shard_index(habit_id)
+        check_offs = self.shards[index].get_all_check_offs_for_habit(
+            habit_id, self._local_check_off_id(index, after_id), limit, since, until,
+        )
+        return [self._with_check_off_id(index, check_off) for check_off in check_offs]
+
+    def get_all_check_offs(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[CheckOff]:
+        pages = self._fan_out(lambda index, shard: sorted(
+            (
+                self._with_check_off_id(index, check_off)
+                for check_off in shard.get_all_check_offs(self._local_check_off_id(index, after_id), limit, since, until)
+            ),
+            key=lambda check_off: check_off.id,
+        ))
+        return self._merge_pages(pages, lambda check_off: check_off.id, limit)
+
+    def get_check_off_rows(
+        self,
+        habit_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Tuple]:
+        """
+        Return (id, habit_id, date_time) rows of check-offs like HabitTracker.get_check_off_rows,
+        from the shard of habit_id or from every shard.
+        """
+        def rows_of(index: int, shard: HabitTracker) -> List[Tuple]:
+            if habit_id is not None and index != self.shard_index(habit_id):
+                return []
+            rows = shard.get_check_off_rows(habit_id, self._local_check_off_id(index, after_id), limit, since, until)
+            return sorted((self._check_off_id(index, row[0]),) + tuple(row[1:]) for row in rows)
+
+        return self._merge_pages(self._fan_out(rows_of), lambda row: row[0], limit)
+
+    def iter_habit_rows(self) -> Iterator[Tuple]:
+        return heapq.merge(*(shard.iter_habit_rows() for shard in self.shards), key=lambda row: row[0])
+
+    def iter_check_off_rows(self) -> Iterator[Tuple]:
+        return heapq.merge(*(shard.iter_check_off_rows() for shard in self.shards), key=lambda row: (row[0], row[1]))
+
+    # Written against the methods above, which route or fan out
+    export_habits = HabitTracker.export_habits
+    export_check_offs = HabitTracker.export_check_offs
+    import_check_offs = HabitTracker.import_check_offs
+    generate_example_data = HabitTracker.generate_example_data
+
+    def import_habits(self, path: str, fmt: Optional[str] = None, batch_size: int = BULK_CHECK_OFF_BATCH_SIZE) -> int:
+        """
+        Read habits written by export_habits and insert each in the shard of its id. The file is read batch_size
+        habits per shard at a time, and each chunk is inserted in one transaction per shard.
+        """
+        fmt = detect_format(path, fmt)
+        count = 0
+        with open(path, newline="", encoding="utf-8") as file:
+            habits = map(HabitTracker._parse_habit_row, read_rows(file, fmt))
+            for parts in self._partitions(habits, lambda habit: habit["id"], batch_size):
+                count += sum(self._fan_out(lambda index, shard: shard._insert_habit_rows(parts[index], batch_size) if parts[index] else 0))
+        logger.info(f"Imported {count} habits from {path}.")
+        return count
+
+    def get_longest_check_off_streak_for_habit(self, habit_id: int) -> int:
+        return self.shard_for(habit_id).get_longest_check_off_streak_for_habit(habit_id)
+
+    def get_longest_check_off_streaks(self, workers: Optional[int] = None) -> Dict[int, int]:
+        """
+        Return the longest check-off streak of every habit, keyed by habit id, computed by every shard concurrently.
+        With workers, each shard also splits its habits across that many processes.
+        """
+        return self._merge_by_habit(self._fan_out(lambda index, shard: shard.get_longest_check_off_streaks(workers)))
+
+    get_longest_streak_of_all_habits = HabitTracker.get_longest_streak_of_all_habits
+
+    def get_current_streak(self, habit_id: int, now: Optional[datetime] = None) -> int:
+        return self.shard_for(habit_id).get_current_streak(habit_id, now)
+
+    def get_dashboard(self, now: Optional[datetime] = None) -> List[Tuple]:
+        now = now or datetime.utcnow()
+        return self._merge_pages(self._fan_out(lambda index, shard: shard.get_dashboard(now)), lambda row: row[0], None)
+
+    get_habits_at_risk = HabitTracker.get_habits_at_risk
+
+    def get_period_history(self, habit_id: int) -> PeriodHistory:
+        return self.shard_for(habit_id).get_period_history(habit_id)
+
+    def get_period_streaks(self, now: Optional[datetime] = None) -> Dict[int, Tuple[int, int]]:
+        now = now or datetime.utcnow()
+        return self._merge_by_habit(self._fan_out(lambda index, shard: shard.get_period_streaks(now)))
+
+    def get_checked_off_periods(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        habit_id: Optional[int] = None,
+    ) -> Dict[int, int]:
+        since, until = analysis_range(since, until)
+        if habit_id is not None:
+            return self.shard_for(habit_id).get_checked_off_periods(since, until, habit_id)
+        return self._merge_by_habit(self._fan_out(lambda index, shard: shard.get_checked_off_periods(since, until)))
+
+    def get_check_off_counts(
+        self,
+        period: str = PERIOD_DAY,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        habit_id: Optional[int] = None,
+    ) -> Dict[str, list]:
+        since, until = analysis_range(since, until)
+        if habit_id is not None:
+            return self.shard_for(habit_id).get_check_off_counts(period, since, until, habit_id)
+
+        counts: Dict[str, int] = {}
+        for result in self._fan_out(lambda index, shard: shard.get_check_off_counts(period, since, until)):
+            for label, check_offs in zip(result["period"], result["check_offs"]):
+                counts[label] = counts.get(label, 0) + check_offs
+        labels = sorted(counts)
+        return {"period": labels, "check_offs": [counts[label] for label in labels]}
+
+    def get_completion_rates(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        habit_id: Optional[int] = None,
+    ) -> Dict[str, list]:
+        since, until = analysis_range(since, until)
+        if habit_id is not None:
+            return self.shard_for(habit_id).get_completion_rates(since, until, habit_id)
+
+        results = self._fan_out(lambda index, shard: shard.get_completion_rates(since, until))
+        columns = list(results[0])
+        rows = self._merge_pages([list(zip(*result.values())) for result in results], lambda row: row[0], None)
+        return {column: [row[position] for row in rows] for position, column in enumerate(columns)}
+
+    def rebuild_streak_cache(self, workers: Optional[int] = None) -> int:
+        return sum(self._fan_out(lambda index, shard: shard.rebuild_streak_cache(workers)))
+
+    def rebuild_rollups(self) -> int:
+        return sum(self._fan_out(lambda index, shard: shard.rebuild_rollups()))
+
+    def archive_check_offs(self, before: datetime) -> int:
+        return sum(self._fan_out(lambda index, shard: shard.archive_check_offs(before)))
+
+    @staticmethod
+    def _merge_by_habit(results: List[dict]) -> dict:
+        merged = {}
+        for result in results:
+            merged.update(result)
+        return dict(sorted(merged.items()))
@@ -0,0 +1,172 @@
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Optional, Sequence, Tuple
+
+from constants import DAILY_AT_RISK_DAYS, PERIODICITY_DAILY, SMALL_HISTORY_THRESHOLD, WEEKLY_AT_RISK_DAYS
+
+MICROSECONDS_PER_DAY = 24 * 60 * 60 * 1_000_000
+
+# (longest streak, current streak start, last check-off, current streak) of a habit
+StreakSummary = Tuple[int, datetime, datetime, int]
+
+
+def streak_interval(periodicity: int) -> int:
+    """
+    Return the number of days between two check-offs of the same streak.
+    """
+    return 1 if periodicity == PERIODICITY_DAILY else 7
+
+
+def running_streak(current_streak: int, last_check_off: Optional[datetime], periodicity: int, now: datetime) -> int:
+    """
+    Return the streak still running at now: the streak ending at the last check-off,
+    or 0 once a check-off made now could no longer continue it.
+    """
+    if last_check_off is None or (now - last_check_off).days > streak_interval(periodicity):
+        return 0
+    return current_streak
+
+
+def is_streak_at_risk(current_streak: int, last_check_off: Optional[datetime], periodicity: int, now: datetime) -> bool:
+    """
+    Return whether a running streak breaks unless the habit is checked off soon:
+    a daily habit not checked off today, or a weekly habit last checked off 6 or more days ago.
+    """
+    if not running_streak(current_streak, last_check_off, periodicity, now):
+        return False
+    at_risk_days = DAILY_AT_RISK_DAYS if periodicity == PERIODICITY_DAILY else WEEKLY_AT_RISK_DAYS
+    return (now.date() - last_check_off.date()).days >= at_risk_days
+
+
+def summarize_streaks(rows: Sequence[Tuple[int, int, Optional[datetime]]]) -> Dict[int, Optional[StreakSummary]]:
+    """
+    Summarize the streaks of every habit from (habit_id, periodicity, date_time) rows ordered by habit and date.
+    A streak is a run of check-offs exactly one interval apart, and its length is the number of days
+    from its first to its last check-off, inclusive. Identical check-off times are counted once.
+    Rows with an empty date_time only register the habit, whose summary is None.
+
+    Short inputs are scanned in pure Python; long ones with a vectorized NumPy kernel, which gives identical results.
+    """
+    if len(rows) < SMALL_HISTORY_THRESHOLD:
+        return _summarize_python(rows)
+    return _summarize_numpy(rows)
+
+
+def longest_streaks(rows: Sequence[Tuple[int, int, Optional[datetime]]]) -> Dict[int, int]:
+    """
+    Return the longest streak per habit, 0 for habits without check-offs.
+    """
+    return {
+        habit_id: summary[0] if summary else 0
+        for habit_id, summary in summarize_streaks(rows).items()
+    }
+
+
+def streak_states(rows: Sequence[Tuple[int, int, Optional[datetime]]]) -> Dict[int, dict]:
+    """
+    Return the HabitStreak column values per habit.
+    """
+    states = {}
+    for habit_id, summary in summarize_streaks(rows).items():
+        longest_streak, current_streak_start, last_check_off, current_streak = summary or (0, None, None, 0)
+        states[habit_id] = {
+            "current_streak": current_streak,
+            "current_streak_start": current_streak_start,
+            "longest_streak": longest_streak,
+            "last_check_off": last_check_off,
+        }
+    return states
+
+
+def advance_streak(streak, check_off_date: datetime, periodicity: int) -> bool:
+    """
+    Advance a HabitStreak with a check-off made after all the others, in O(1).
+    Returns False, leaving the streak untouched, when the check-off is older than the last one:
+    the streak then has to be recomputed from the full history.
+    """
+    if streak.last_check_off is not None and check_off_date < streak.last_check_off:
+        return False
+
+    if streak.last_check_off is None:
+        streak.current_streak_start = check_off_date
+    elif check_off_date == streak.last_check_off:
+        return True
+    elif (check_off_date - streak.last_check_off).days != streak_interval(periodicity):
+        streak.current_streak_start = check_off_date
+
+    streak.current_streak = (check_off_date - streak.current_streak_start).days + 1
+    streak.longest_streak = max(streak.longest_streak or 0, streak.current_streak)
+    streak.last_check_off = check_off_date
+    return True
+
+
+def _summarize_python(rows: Sequence[Tuple[int, int, Optional[datetime]]]) -> Dict[int, Optional[StreakSummary]]:
+    summaries = {}
+
+    for habit_id, habit_rows in groupby(rows, key=itemgetter(0)):
+        summary = None
+        first = previous = None
+
+        for _, periodicity, date_time in habit_rows:
+            if date_time is None or date_time == previous:
+                continue
+            if previous is None or (date_time - previous).days != streak_interval(periodicity):
+                first = date_time
+            previous = date_time
+
+            length = (date_time - first).days + 1
+            summary = (max(summary[0], length) if summary else length, first, date_time, length)
+
+        summaries[habit_id] = summary
+
+    return summaries
+
+
+def _summarize_numpy(rows: Sequence[Tuple[int, int, Optional[datetime]]]) -> Dict[int, Optional[StreakSummary]]:
+    # Imported here so short histories and CLI startup do not pay for importing NumPy
+    import numpy as np
+
+    summaries: Dict[int, Optional[StreakSummary]] = {habit_id: None for habit_id, _, _ in rows}
+
+    checked_off = [row for row in rows if row[2] is not None]
+    if not checked_off:
+        return summaries
+
+    habit_ids, periodicities, date_times = zip(*checked_off)
+    habit_ids = np.fromiter(habit_ids, dtype=np.int64, count=len(checked_off))
+    intervals = np.where(np.fromiter(periodicities, dtype=np.int64, count=len(checked_off)) == PERIODICITY_DAILY, 1, 7)
+    values = np.array(date_times, dtype="datetime64[us]").astype(np.int64)
+
+    new_habit = np.empty(len(values), dtype=bool)
+    new_habit[0] = True
+    np.not_equal(habit_ids[1:], habit_ids[:-1], out=new_habit[1:])
+
+    # Drop identical check-off times of the same habit
+    keep = new_habit.copy()
+    keep[1:] |= values[1:] != values[:-1]
+    habit_ids, intervals, values, new_habit = habit_ids[keep], intervals[keep], values[keep], new_habit[keep]
+
+    gaps = np.zeros(len(values), dtype=np.int64)
+    gaps[1:] = np.diff(values) // MICROSECONDS_PER_DAY
+    starts = np.flatnonzero(new_habit | (gaps != intervals))
+    ends = np.append(starts[1:] - 1, len(values) - 1)
+    lengths = (values[ends] - values[starts]) // MICROSECONDS_PER_DAY + 1
+
+    span_habit_ids = habit_ids[starts]
+    first_spans = np.flatnonzero(np.append(True, span_habit_ids[1:] != span_habit_ids[:-1]))
+    last_spans = np.append(first_spans[1:] - 1, len(starts) - 1)
+    longest = np.maximum.reduceat(lengths, first_spans)
+
+    current_starts = values[starts[last_spans]].astype("datetime64[us]").astype(datetime)
+    current_ends = values[ends[last_spans]].astype("datetime64[us]").astype(datetime)
+
+    for index, habit_id in enumerate(span_habit_ids[first_spans].tolist()):
+        summaries[habit_id] = (
+            int(longest[index]),
+            current_starts[index],
+            current_ends[index],
+            int(lengths[last_spans[index]]),
+        )
+
+    return summaries
@@ -0,0 +1,11 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from habit import Base
+
+
+def create_sqlite_session(url: str = "sqlite://"):
+    """Create a session bound to a SQLite database, in memory by default, with the full schema."""
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
@@ -0,0 +1,150 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from analytics import analysis_range, expected_check_offs, period_bucket, split_by_month
+from habit import CheckOffRollup, Habit
+from habit_tracker import HabitTracker
+from rollups import add_to_rollups_statement, backfill_rollups_statement
+from tests import create_sqlite_session
+
+
+@pytest.fixture
+def habit_tracker():
+    habit_tracker = HabitTracker(create_sqlite_session())
+    daily = habit_tracker.add_habit(name="Drink water", description=None, periodicity=1)
+    weekly = habit_tracker.add_habit(name="Groceries", description=None, periodicity=2)
+    # Monday 2024-01-01 to Sunday 2024-01-21, skipping 2024-01-10
+    for offset in range(21):
+        if offset != 9:
+            habit_tracker.check_off_habit(daily.id, datetime(2024, 1, 1, 8) + timedelta(days=offset))
+    for offset in (0, 7, 21):
+        habit_tracker.check_off_habit(weekly.id, datetime(2024, 1, 1, 9) + timedelta(days=offset))
+    return habit_tracker
+
+
+class TestAnalytics:
+    def test_expected_check_offs(self):
+        """Test if daily habits are expected every day and weekly habits every started week."""
+        assert expected_check_offs(1, date(2024, 1, 1), date(2024, 1, 10)) == 10
+        assert expected_check_offs(2, date(2024, 1, 1), date(2024, 1, 14)) == 2
+        assert expected_check_offs(2, date(2024, 1, 1), date(2024, 1, 15)) == 3
+        assert expected_check_offs(1, date(2024, 1, 10), date(2024, 1, 1)) == 0
+
+    def test_analysis_range(self):
+        """Test if the range defaults to the last 30 days including today and must not be empty."""
+        assert analysis_range(None, None, now=datetime(2024, 1, 31, 15)) == (datetime(2024, 1, 2), datetime(2024, 2, 1))
+
+        with pytest.raises(ValueError):
+            analysis_range(datetime(2024, 1, 2), datetime(2024, 1, 1))
+
+    def test_split_by_month(self):
+        """Test if a range is split into its whole months and the parts of months around them."""
+        assert split_by_month(datetime(2024, 1, 1), datetime(2024, 3, 1)) == ((date(2024, 1, 1), date(2024, 3, 1)), [])
+        assert split_by_month(datetime(2024, 12, 5, 3), datetime(2025, 2, 10)) == (
+            (date(2025, 1, 1), date(2025, 2, 1)),
+            [(datetime(2024, 12, 5, 3), datetime(2025, 1, 1)), (datetime(2025, 2, 1), datetime(2025, 2, 10))],
+        )
+        assert split_by_month(datetime(2024, 1, 5), datetime(2024, 2, 10)) == (
+            None, [(datetime(2024, 1, 5), datetime(2024, 2, 10))],
+        )
+
+    def test_period_buckets_for_postgresql(self):
+        """Test if check-offs are labelled by period with PostgreSQL's date functions on PostgreSQL."""
+        def compiled(period):
+            return str(period_bucket(period).compile(dialect=postgresql.dialect()))
+
+        assert compiled("day") == "to_char(check_offs.day, 'YYYY-MM-DD')"
+        assert compiled("week") == "to_char(date_trunc('week', check_offs.day), 'YYYY-MM-DD')"
+        assert compiled("month") == "to_char(check_offs.day, 'YYYY-MM')"
+
+    def test_get_check_off_counts(self, habit_tracker):
+        """Test if check-offs are counted per day, week and month within the range only."""
+        since, until = datetime(2024, 1, 6), datetime(2024, 1, 16)
+
+        days = habit_tracker.get_check_off_counts("day", since, until)
+        weeks = habit_tracker.get_check_off_counts("week", since, until)
+        months = habit_tracker.get_check_off_counts("month", datetime(2024, 1, 1), datetime(2024, 3, 1), habit_id=2)
+
+        assert days["period"][:3] == ["2024-01-06", "2024-01-07", "2024-01-08"]
+        assert days["check_offs"][:3] == [1, 1, 2]
+        assert "2024-01-10" not in days["period"]
+        assert weeks == {"period": ["2024-01-01", "2024-01-08", "2024-01-15"], "check_offs": [2, 7, 1]}
+        assert months == {"period": ["2024-01"], "check_offs": [3]}
+
+        with pytest.raises(ValueError):
+            habit_tracker.get_check_off_counts("year")
+
+    def test_get_completion_rates(self, habit_tracker):
+        """Test if the adherence of every habit is the share of expected check-offs made within the range."""
+        rates = habit_tracker.get_completion_rates(datetime(2024, 1, 1), datetime(2024, 1, 21))
+
+        assert rates == {
+            "habit_id": [1, 2],
+            "name": ["Drink water", "Groceries"],
+            "periodicity": [1, 2],
+            "check_offs": [19, 2],
+            "expected": [20, 3],
+            "completion_rate": [0.95, 2 / 3],
+        }
+
+    def test_get_completion_rates_from_creation(self, habit_tracker):
+        """Test if the periods before a habit was created and first checked off are not expected."""
+        session = habit_tracker.session
+        session.add(Habit(name="New", description=None, periodicity=1, creation_date=datetime(2024, 1, 18, 12)))
+        session.commit()
+
+        rates = habit_tracker.get_completion_rates(datetime(2024, 1, 1), datetime(2024, 1, 21), habit_id=3)
+
+        assert rates["check_offs"] == [0]
+        assert rates["expected"] == [3]
+        assert rates["completion_rate"] == [0.0]
+
+    def test_rollups_maintained_on_check_off(self, habit_tracker):
+        """Test if check-offs, one by one and in bulk, keep the monthly rollups equal to a rebuild from scratch."""
+        habit_tracker.bulk_check_off([(1, datetime(2024, 2, 3, 7)), (2, datetime(2024, 2, 20, 7)), (1, datetime(2024, 1, 31, 22))])
+        session = habit_tracker.session
+
+        def rollups():
+            return [
+                (rollup.habit_id, rollup.month, rollup.check_offs, rollup.first_check_off, rollup.last_check_off)
+                for rollup in session.query(CheckOffRollup).order_by(CheckOffRollup.habit_id, CheckOffRollup.month)
+            ]
+
+        maintained = rollups()
+        assert habit_tracker.rebuild_rollups() == 4
+        session.expire_all()
+
+        assert maintained == rollups()
+        assert maintained[0] == (1, date(2024, 1, 1), 21, datetime(2024, 1, 1, 8), datetime(2024, 1, 31, 22))
+
+    def test_rollup_statements_for_postgresql(self):
+        """Test if the rollup statements use PostgreSQL's upsert and date functions on PostgreSQL."""
+        upsert = str(add_to_rollups_statement("postgresql").compile(dialect=postgresql.dialect()))
+        backfill = str(backfill_rollups_statement().compile(dialect=postgresql.dialect()))
+
+        assert "ON CONFLICT (habit_id, month) DO UPDATE" in upsert
+        assert "least(check_off_rollups.first_check_off, excluded.first_check_off)" in upsert
+        assert "greatest(check_off_rollups.last_check_off, excluded.last_check_off)" in upsert
+        assert backfill.count("CAST(date_trunc('month', check_offs.day) AS DATE)") == 2
+
+    def test_whole_months_read_from_rollups(self, habit_tracker):
+        """Test if counts of whole months come from the rollups and the rest of the range from the check-offs."""
+        session = habit_tracker.session
+        session.get(CheckOffRollup, (1, date(2024, 1, 1))).check_offs = 100
+        session.commit()
+
+        whole_month = habit_tracker.get_check_off_counts("month", datetime(2024, 1, 1), datetime(2024, 2, 1), habit_id=1)
+        partial_month = habit_tracker.get_check_off_counts("month", datetime(2024, 1, 2), datetime(2024, 2, 1), habit_id=1)
+        rates = habit_tracker.get_completion_rates(datetime(2024, 1, 1), datetime(2024, 2, 1), habit_id=1)
+
+        assert whole_month == {"period": ["2024-01"], "check_offs": [100]}
+        assert partial_month == {"period": ["2024-01"], "check_offs": [19]}
+        assert rates["check_offs"] == [100]
+
+    def test_delete_habit_deletes_rollups(self, habit_tracker):
+        """Test if the rollups of a habit are deleted with it."""
+        habit_tracker.delete_habit(1)
+
+        assert [rollup.habit_id for rollup in habit_tracker.session.query(CheckOffRollup)] == [2]
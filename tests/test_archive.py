@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from archive import CheckOffArchive, archived_rows, merge_archived, resolve_archive_path
+from config import load_config
+from exceptions import MultipleCheckOffError
+from habit import ArchivedCheckOffs, CheckOff
+from habit_tracker import HabitTracker
+from tests import create_sqlite_session
+
+
+def create_tracker(tmp_path) -> HabitTracker:
+    return HabitTracker(create_sqlite_session(), archive_path=str(tmp_path / "archive"))
+
+
+class TestCheckOffArchive:
+    def test_segment_columns(self, tmp_path):
+        """Test if a segment stores check-offs sorted by habit and date, indexed by habit."""
+        archive = CheckOffArchive(str(tmp_path))
+        segment, index = archive.write_segment([
+            (3, 2, datetime(2024, 1, 2)),
+            (1, 1, datetime(2024, 1, 1)),
+            (2, 2, datetime(2024, 1, 1)),
+        ])
+
+        assert [(row["habit_id"], row["start"], row["stop"]) for row in index] == [(1, 0, 1), (2, 1, 3)]
+        assert index[1]["first_check_off"] == datetime(2024, 1, 1)
+        assert index[1]["last_check_off"] == datetime(2024, 1, 2)
+
+        histories = archive.histories([(row["habit_id"], segment, row["start"], row["stop"]) for row in index])
+        ids, date_times = histories[2]
+        assert isinstance(ids.base, np.memmap)
+        assert ids.tolist() == [2, 3]
+        assert date_times.astype(datetime).tolist() == [datetime(2024, 1, 1), datetime(2024, 1, 2)]
+
+    def test_merge_archived(self, tmp_path):
+        """Test if archived check-offs are merged in date order into the rows of their habit."""
+        archive = CheckOffArchive(str(tmp_path))
+        segment, index = archive.write_segment([(1, 1, datetime(2024, 1, 1)), (2, 1, datetime(2024, 1, 3))])
+        histories = archive.histories([(1, segment, 0, 2)])
+
+        rows = [(1, 1, datetime(2024, 1, 2)), (1, 1, datetime(2024, 1, 4)), (2, 2, None)]
+        assert merge_archived(rows, histories) == [
+            (1, 1, datetime(2024, 1, 1)),
+            (1, 1, datetime(2024, 1, 2)),
+            (1, 1, datetime(2024, 1, 3)),
+            (1, 1, datetime(2024, 1, 4)),
+            (2, 2, None),
+        ]
+        assert archived_rows(histories, after_id=1, limit=5) == [(2, 1, datetime(2024, 1, 3))]
+
+    def test_resolve_archive_path(self):
+        """Test if the archive is next to the database file unless configured."""
+        assert resolve_archive_path(load_config(database_url="sqlite:///data/habits.db")) == "data/habits.db.archive"
+        assert resolve_archive_path(load_config(database_url="sqlite://")) is None
+
+
+class TestArchivedCheckOffs:
+    def test_archive_keeps_streaks_and_listings(self, tmp_path):
+        """Test if streak and listing methods return the same results after old check-offs are archived."""
+        habit_tracker = create_tracker(tmp_path)
+        habit = habit_tracker.add_habit("Read", "Read a book", 1)
+        for day in (1, 2, 3, 5, 6, 7, 8):
+            habit_tracker.check_off_habit(habit.id, datetime(2024, 1, day, 8))
+
+        expected_rows = habit_tracker.get_check_off_rows()
+        expected_page = habit_tracker.get_check_off_rows(habit.id, after_id=2, limit=3)
+        expected_counts = habit_tracker.get_check_off_counts("week", datetime(2024, 1, 1), datetime(2024, 2, 1))
+
+        assert habit_tracker.archive_check_offs(datetime(2024, 1, 6)) == 4
+        assert habit_tracker.session.query(CheckOff).count() == 3
+
+        assert sorted(habit_tracker.get_check_off_rows()) == sorted(expected_rows)
+        assert habit_tracker.get_check_off_rows(habit.id, after_id=2, limit=3) == expected_page
+        assert habit_tracker.get_check_off_counts("week", datetime(2024, 1, 1), datetime(2024, 2, 1)) == expected_counts
+        assert habit_tracker.get_last_check_off_for_habit(habit.id).date_time == datetime(2024, 1, 8, 8)
+        assert habit_tracker.rebuild_streak_cache() == 1
+        assert habit_tracker.get_longest_check_off_streaks() == {habit.id: 4}
+        assert habit_tracker.get_longest_check_off_streak_for_habit(habit.id) == 4
+
+    def test_check_off_ids_are_not_reused_after_archiving(self, tmp_path):
+        """Test if check-offs added after every check-off was archived get new ids, so pages cover both once."""
+        habit_tracker = create_tracker(tmp_path)
+        habit = habit_tracker.add_habit("Read", "Read a book", 1)
+        for day in (1, 2, 3):
+            habit_tracker.check_off_habit(habit.id, datetime(2024, 1, day, 8))
+        assert habit_tracker.archive_check_offs(datetime(2024, 1, 4)) == 3
+
+        for day in (4, 5):
+            habit_tracker.check_off_habit(habit.id, datetime(2024, 1, day, 8))
+
+        pages, after_id = [], None
+        while True:
+            page = habit_tracker.get_check_off_rows(habit.id, after_id=after_id, limit=2)
+            if not page:
+                break
+            pages.extend(page)
+            after_id = page[-1][0]
+        assert [row[0] for row in pages] == [1, 2, 3, 4, 5]
+        assert [row[2].day for row in pages] == [1, 2, 3, 4, 5]
+
+    def test_archived_day_cannot_be_checked_off_again(self, tmp_path):
+        """Test if a backfill on a day with an archived check-off is rejected."""
+        habit_tracker = create_tracker(tmp_path)
+        habit = habit_tracker.add_habit("Read", "Read a book", 1)
+        habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1, 8))
+        habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 5, 8))
+        habit_tracker.archive_check_offs(datetime(2024, 1, 2))
+
+        with pytest.raises(MultipleCheckOffError):
+            habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1, 20))
+        inserted, rejected = habit_tracker.bulk_check_off([(habit.id, datetime(2024, 1, 1, 21))])
+        assert inserted == 0 and len(rejected) == 1
+
+        habit_tracker.check_off_habit(habit.id, datetime(2023, 12, 31, 8))
+        assert habit_tracker.get_longest_check_off_streak_for_habit(habit.id) == 2
+
+    def test_deleted_habit_drops_archived_check_offs(self, tmp_path):
+        """Test if deleting a habit removes its archive index, and an emptied segment is removed by the next run."""
+        habit_tracker = create_tracker(tmp_path)
+        habit = habit_tracker.add_habit("Read", "Read a book", 1)
+        other = habit_tracker.add_habit("Run", "Run 5 km", 1)
+        habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1, 8))
+        habit_tracker.archive_check_offs(datetime(2024, 1, 2))
+
+        habit_tracker.delete_habit(habit.id)
+        assert habit_tracker.session.query(ArchivedCheckOffs).count() == 0
+        assert habit_tracker.get_check_off_rows() == []
+
+        habit_tracker.check_off_habit(other.id, datetime(2024, 1, 1, 8) + timedelta(days=1))
+        habit_tracker.archive_check_offs(datetime(2024, 1, 3))
+        assert len(list((tmp_path / "archive").iterdir())) == 1
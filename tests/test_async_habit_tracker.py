@@ -0,0 +1,149 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from async_habit_tracker import AsyncHabitTracker
+from exceptions import HabitNotFoundError, MultipleCheckOffError
+from habit_tracker import HabitTracker
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestAsyncHabitTracker:
+    def test_add_and_check_off_habit(self, tmp_path):
+        """Test if habits are added and checked off, with the daily and weekly limits of the sync tracker."""
+        async def scenario():
+            tracker = AsyncHabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}")
+            await tracker.create_schema()
+
+            daily = await tracker.add_habit(name="Drink water", description=None, periodicity=1)
+            weekly = await tracker.add_habit(name="Groceries", description=None, periodicity=2)
+            start = datetime(2024, 1, 1, 8)
+
+            for offset in range(3):
+                await tracker.check_off_habit(daily.id, start + timedelta(days=offset))
+            await tracker.check_off_habit(weekly.id, start)
+
+            with pytest.raises(MultipleCheckOffError, match="once per day"):
+                await tracker.check_off_habit(daily.id, start + timedelta(days=2, hours=5))
+            with pytest.raises(MultipleCheckOffError, match="once every 7 days"):
+                await tracker.check_off_habit(weekly.id, start + timedelta(days=6))
+            with pytest.raises(HabitNotFoundError):
+                await tracker.check_off_habit(999, start)
+
+            last_check_off = await tracker.get_last_check_off_for_habit(daily.id)
+            page = await tracker.get_all_check_offs_for_habit(daily.id, limit=2)
+            habits = await tracker.get_habits()
+            streaks = await tracker.get_longest_check_off_streaks()
+            longest = await tracker.get_longest_streak_of_all_habits()
+            await tracker.dispose()
+            return last_check_off, page, habits, streaks, longest
+
+        last_check_off, page, habits, streaks, longest = run(scenario())
+
+        assert last_check_off.date_time == datetime(2024, 1, 3, 8)
+        assert len(page) == 2
+        assert [habit.name for habit in habits] == ["Drink water", "Groceries"]
+        assert streaks == {1: 3, 2: 1}
+        assert longest == (3, 1)
+
+    def test_concurrent_check_offs(self, tmp_path):
+        """Test if concurrent check-offs of the same day are accepted once and keep the streak cache consistent."""
+        database_url = f"sqlite:///{tmp_path / 'habits.db'}"
+
+        async def scenario():
+            tracker = AsyncHabitTracker(database_url=database_url)
+            await tracker.create_schema()
+            habits = [await tracker.add_habit(name=f"Habit {i}", description=None, periodicity=1) for i in range(5)]
+
+            results = await asyncio.gather(*(
+                tracker.check_off_habit(habit.id, datetime(2024, 1, 1, hour))
+                for habit in habits
+                for hour in (8, 9)
+            ), return_exceptions=True)
+            await tracker.dispose()
+            return habits, results
+
+        habits, results = run(scenario())
+
+        assert sum(isinstance(result, MultipleCheckOffError) for result in results) == 5
+        habit_tracker = HabitTracker(database_url=database_url)
+        for habit in habits:
+            assert len(habit_tracker.get_all_check_offs_for_habit(habit.id)) == 1
+            assert habit_tracker.get_habit(habit.id).streak.longest_streak == 1
+
+    def test_concurrent_check_offs_keep_streak_cache(self, tmp_path):
+        """Test if concurrent check-offs of one habit on different days all reach its cached streak."""
+        async def scenario():
+            tracker = AsyncHabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}")
+            await tracker.create_schema()
+            habit = await tracker.add_habit(name="Drink water", description=None, periodicity=1)
+
+            await asyncio.gather(*(tracker.check_off_habit(habit.id, datetime(2024, 1, day, 8)) for day in range(1, 11)))
+            cached = await tracker.get_longest_check_off_streak_for_habit(habit.id)
+            await tracker.dispose()
+            return habit, cached
+
+        habit, cached = run(scenario())
+
+        assert cached == 10
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}")
+        assert habit_tracker.get_longest_check_off_streaks() == {habit.id: 10}
+        assert habit_tracker.get_dashboard(datetime(2024, 1, 10, 20))[0][4] == 10
+
+    def test_backfill_and_delete(self, tmp_path):
+        """Test if a backfilled check-off rebuilds the streak cache and if a habit is deleted with its check-offs."""
+        async def scenario():
+            tracker = AsyncHabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}")
+            await tracker.create_schema()
+            habit = await tracker.add_habit(name="Read", description=None, periodicity=1)
+
+            await tracker.check_off_habit(habit.id, datetime(2024, 1, 3))
+            await tracker.check_off_habit(habit.id, datetime(2024, 1, 1))
+            await tracker.check_off_habit(habit.id, datetime(2024, 1, 2))
+            longest = await tracker.get_longest_check_off_streak_for_habit(habit.id)
+
+            await tracker.delete_habit(habit.id)
+            with pytest.raises(HabitNotFoundError):
+                await tracker.get_habit(habit.id)
+            remaining = await tracker.get_all_check_offs_for_habit(habit.id)
+            await tracker.dispose()
+            return longest, remaining
+
+        longest, remaining = run(scenario())
+
+        assert longest == 3
+        assert remaining == []
+
+    def test_rejected_check_off_releases_write_lock(self, tmp_path):
+        """Test if check-offs that end without a commit roll back, so a shared session does not keep the write lock."""
+        path = tmp_path / "habits.db"
+
+        async def scenario():
+            tracker = AsyncHabitTracker(database_url=f"sqlite:///{path}")
+            await tracker.create_schema()
+            habit = await tracker.add_habit(name="Read", description=None, periodicity=1)
+            monthly = await tracker.add_habit(name="Rent", description=None, periodicity=3)
+
+            async with tracker.session_factory() as session:
+                shared = AsyncHabitTracker(session=session)
+                await shared.check_off_habit(habit.id, datetime(2024, 1, 1, 8))
+                failures = [
+                    (habit.id, datetime(2024, 1, 1, 20), MultipleCheckOffError),
+                    (999, datetime(2024, 1, 1), HabitNotFoundError),
+                    (monthly.id, datetime(2024, 1, 1), ValueError),
+                ]
+                for habit_id, check_off_date, error in failures:
+                    with pytest.raises(error):
+                        await shared.check_off_habit(habit_id, check_off_date)
+                    connection = sqlite3.connect(path, timeout=0.1)
+                    connection.execute("UPDATE habits SET description = 'Written' WHERE id = ?", (habit.id,))
+                    connection.commit()
+                    connection.close()
+            await tracker.dispose()
+
+        run(scenario())
@@ -0,0 +1,49 @@
+import json
+import os
+
+from benchmarks.synthetic_data import generate_synthetic_data
+from habit_tracker import HabitTracker
+from tests import create_sqlite_session
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+
+class TestSyntheticData:
+    def test_generate_synthetic_data(self):
+        """Test if the synthetic data is reproducible and passes the check-off rules of bulk_check_off."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+        habit_ids, count = generate_synthetic_data(habit_tracker, habits=20, days=60, weekly_ratio=0.5, seed=1)
+        rows = habit_tracker.get_check_off_rows()
+
+        validating_tracker = HabitTracker(create_sqlite_session())
+        generate_synthetic_data(validating_tracker, habits=20, days=0, weekly_ratio=0.5, seed=1)
+        inserted, rejected = validating_tracker.bulk_check_off((habit_id, date_time) for _, habit_id, date_time in rows)
+
+        assert len(habit_ids) == 20
+        assert count == len(rows) > 0
+        assert inserted == count
+        assert rejected == []
+        assert validating_tracker.get_longest_check_off_streaks() == habit_tracker.get_longest_check_off_streaks()
+        assert {habit.periodicity for habit in habit_tracker.get_habits()} == {1, 2}
+
+
+class TestHotPathBaseline:
+    def test_baseline_covers_every_case(self, monkeypatch):
+        """Test if the committed baseline has a result for every benchmark case and the parameters to regenerate its data."""
+        monkeypatch.syspath_prepend(BENCHMARKS_DIR)
+        import bench_hot_paths
+
+        with open(os.path.join(BENCHMARKS_DIR, "baseline.json")) as file:
+            baseline = json.load(file)
+
+        assert set(baseline["results"]) == set(bench_hot_paths.benchmark_cases(None, [1], 1))
+        assert all(name in baseline["parameters"] for name in bench_hot_paths.DATA_PARAMETERS)
+
+    def test_compare(self, monkeypatch):
+        """Test if only cases slower than their baseline by more than the tolerance are reported."""
+        monkeypatch.syspath_prepend(BENCHMARKS_DIR)
+        import bench_hot_paths
+
+        baseline = {"fast": {"seconds": 1.0}, "slow": {"seconds": 1.0}}
+        results = {"fast": {"seconds": 1.2}, "slow": {"seconds": 1.3}, "new": {"seconds": 5.0}}
+        assert bench_hot_paths.compare(results, baseline, 0.25) == [("slow", 1.3, 1.0)]
@@ -0,0 +1,76 @@
+from datetime import date, datetime
+
+from bitmap import PeriodHistory, count_range, history_states, longest_run, run_ending_at
+
+
+class TestBitOperations:
+    def test_longest_run(self):
+        """Test if the longest run of set bits is found."""
+        assert longest_run(0) == 0
+        assert longest_run(0b1) == 1
+        assert longest_run(0b1011101111) == 4
+        assert longest_run((1 << 3650) - 1) == 3650
+
+    def test_run_ending_at(self):
+        """Test if the run of set bits ending at a bit is counted."""
+        assert run_ending_at(0b1110110, 2) == 2
+        assert run_ending_at(0b1110110, 6) == 3
+        assert run_ending_at(0b1110110, 3) == 0
+        assert run_ending_at(0b111, 2) == 3
+        assert run_ending_at(0b111, -1) == 0
+
+    def test_count_range(self):
+        """Test if the set bits of a range are counted."""
+        assert count_range(0b1110110, 0, 7) == 5
+        assert count_range(0b1110110, 2, 5) == 2
+        assert count_range(0b1110110, -3, 2) == 1
+        assert count_range(0b1110110, 5, 5) == 0
+
+
+class TestPeriodHistory:
+    def test_daily_history(self):
+        """Test if daily check-offs are stored as one bit per day since the origin."""
+        history = PeriodHistory(1, date(2024, 1, 1))
+        for day in (1, 2, 3, 5, 6):
+            history = history.with_check_off(date(2024, 1, day))
+
+        assert history.bits == 0b110111
+        assert history.longest_streak() == 3
+        assert history.current_streak(date(2024, 1, 6)) == 2
+        # The streak still runs on the day after the last check-off, and is broken the day after that
+        assert history.current_streak(date(2024, 1, 7)) == 2
+        assert history.current_streak(date(2024, 1, 8)) == 0
+        assert history.count(date(2024, 1, 2), date(2024, 1, 6)) == 3
+        assert history.is_checked_off(date(2024, 1, 5))
+        assert not history.is_checked_off(date(2024, 1, 4))
+
+    def test_weekly_history_before_origin(self):
+        """Test if a check-off before the origin moves the origin back by whole weeks."""
+        history = PeriodHistory(2, date(2024, 1, 10)).with_check_off(date(2024, 1, 12))
+        history = history.with_check_off(date(2024, 1, 1))
+
+        assert history.origin == date(2023, 12, 27)
+        assert history.bits == 0b101
+        assert history.longest_streak() == 1
+
+    def test_blob_round_trip(self):
+        """Test if a decade of daily history is stored in a few hundred bytes."""
+        history = PeriodHistory(1, date(2014, 1, 1), (1 << 3650) - 1)
+        blob = history.to_blob()
+
+        assert len(blob) == 457
+        assert PeriodHistory.from_blob(1, date(2014, 1, 1), blob) == history
+        assert PeriodHistory.from_blob(1, None, None) == PeriodHistory(1)
+
+    def test_history_states(self):
+        """Test if the history columns are computed from check-off rows, from the creation day of each habit."""
+        rows = [
+            (1, 1, datetime(2024, 1, 1, 8), datetime(2024, 1, 2, 8)),
+            (1, 1, datetime(2024, 1, 1, 8), datetime(2024, 1, 3, 8)),
+            (2, 2, datetime(2024, 1, 1, 8), None),
+        ]
+
+        assert history_states(rows) == {
+            1: {"history_origin": date(2024, 1, 1), "history": bytes([0b110])},
+            2: {"history_origin": date(2024, 1, 1), "history": b""},
+        }
@@ -0,0 +1,48 @@
+from cache import LRUCache
+
+
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        """Test if adding an entry to a full cache evicts the least recently read or added entry."""
+        cache = LRUCache(maxsize=2)
+        cache.put(1, "a")
+        cache.put(2, "b")
+        assert cache.get(1) == "a"
+
+        cache.put(3, "c")
+
+        assert cache.get(2) is None
+        assert cache.get(1) == "a"
+        assert cache.get(3) == "c"
+        assert len(cache) == 2
+
+    def test_expires_entries(self):
+        """Test if entries older than the ttl are dropped when they are read."""
+        now = [0.0]
+        cache = LRUCache(maxsize=10, ttl=5, clock=lambda: now[0])
+        cache.put(1, "a")
+
+        now[0] = 4.9
+        assert cache.get(1) == "a"
+        now[0] = 5.0
+        assert cache.get(1, "missing") == "missing"
+        assert len(cache) == 0
+
+    def test_counts_hits_and_misses(self):
+        """Test if hits and misses of get are counted."""
+        cache = LRUCache(maxsize=10)
+        cache.put(1, "a")
+        cache.get(1)
+        cache.get(2)
+        cache.invalidate(1)
+        cache.get(1)
+
+        assert cache.stats() == {"hits": 1, "misses": 2, "size": 0, "maxsize": 10}
+
+    def test_disabled(self):
+        """Test if a cache with a maxsize of 0 keeps no entries."""
+        cache = LRUCache(maxsize=0)
+        cache.put(1, "a")
+
+        assert cache.get(1) is None
+        assert len(cache) == 0
@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+import threading
+from unittest.mock import MagicMock
+
+import cli
+from cli import Cli
+from database import create_database_engine
+from habit_tracker import HabitTracker
+from server import HabitTrackerServer
+
+
+class TestCli:
+    def test_import_does_not_load_heavy_modules(self):
+        """Test if importing the CLI defers importing Fire, SQLAlchemy and NumPy to when they are needed."""
+        code = "import sys, cli; print(','.join(m for m in ('fire', 'sqlalchemy', 'numpy', 'pandas') if m in sys.modules))"
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(cli.__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        assert result.stdout.strip() == ""
+
+    def test_habit_tracker_created_on_first_use(self, tmp_path, monkeypatch):
+        """Test if the habit tracker, and with it the database engine, is created once, by the first command."""
+        monkeypatch.setenv("HABIT_TRACKER_DATABASE_URL", f"sqlite:///{tmp_path / 'habits.db'}")
+        monkeypatch.setenv("HABIT_TRACKER_DAEMON_SOCKET_PATH", str(tmp_path / "habits.sock"))
+        monkeypatch.chdir(tmp_path)
+        habit_tracker_class = MagicMock(wraps=HabitTracker)
+        create_engine = MagicMock(wraps=create_database_engine)
+        monkeypatch.setattr("habit_tracker.HabitTracker", habit_tracker_class)
+        monkeypatch.setattr("habit_tracker.create_database_engine", create_engine)
+
+        command_line = Cli()
+        assert habit_tracker_class.call_count == 0
+        assert create_engine.call_count == 0
+
+        command_line.create_habit("Drink water", "Drink 2 liters of water", 1)
+        assert command_line.list_habits()[0][1] == "Drink water"
+        assert habit_tracker_class.call_count == 1
+        assert create_engine.call_count == 1
+
+    def test_habit_details(self, tmp_path):
+        """Test if habit_details prints the habit read from a database file, through Fire as on the command line."""
+        env = dict(
+            os.environ,
+            HABIT_TRACKER_DATABASE_URL=f"sqlite:///{tmp_path / 'habits.db'}",
+            HABIT_TRACKER_DAEMON_SOCKET_PATH=str(tmp_path / "habits.sock"),
+        )
+        script = os.path.join(os.path.dirname(os.path.abspath(cli.__file__)), "cli.py")
+
+        def run(*args):
+            return subprocess.run([sys.executable, script, *args], cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+
+        run("create_habit", "Drink water", "Drink 2 liters of water", "1")
+        result = run("habit_details", "1")
+
+        lines = [line.split(maxsplit=1) for line in result.stdout.splitlines()]
+        assert {key: value for key, value in lines if key != "creation_date:"} == {
+            "id:": "1", "name:": "Drink water", "description:": "Drink 2 liters of water", "periodicity:": "1",
+        }
+
+    def test_writes_go_through_the_daemon(self, tmp_path, monkeypatch, capsys):
+        """Test if commands that write run on the daemon when it is running, without opening the database themselves."""
+        socket_path = str(tmp_path / "habits.sock")
+        monkeypatch.setenv("HABIT_TRACKER_DATABASE_URL", f"sqlite:///{tmp_path / 'local.db'}")
+        monkeypatch.setenv("HABIT_TRACKER_DAEMON_SOCKET_PATH", socket_path)
+        monkeypatch.chdir(tmp_path)
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}", archive_path=str(tmp_path / "archive"))
+
+        server = HabitTrackerServer(habit_tracker, socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        command_line = Cli()
+        try:
+            assert len(command_line.generate_example_data("2024-01-01", weeks=2)) == 5
+            command_line.export_data("habits", "habits.csv")
+            command_line.export_data("check_offs", "check_offs.csv")
+            command_line.archive_check_offs("2024-01-08")
+            command_line.delete_habits_where(periodicity=2)
+            command_line.delete_habit(1)
+            command_line.delete_habits(2, 3)
+            command_line.delete_all_habits()
+            assert habit_tracker.get_habits() == []
+
+            command_line.import_data("habits", "habits.csv")
+            command_line.import_data("check_offs", "check_offs.csv")
+            command_line.rebuild_streak_cache()
+            command_line.rebuild_rollups()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        output = capsys.readouterr().out
+        assert "Archived 29 check offs before 2024-01-08." in output
+        assert "Imported 58 check_offs from check_offs.csv, 0 rejected." in output
+        assert len(habit_tracker.get_habits()) == 5
+        assert len(habit_tracker.get_check_off_rows()) == 58
+        assert command_line._habit_tracker is None
+        assert not (tmp_path / "local.db").exists()
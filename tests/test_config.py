@@ -0,0 +1,60 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from config import DEFAULT_CONFIG, load_config
+from database import create_database_engine
+from habit_tracker import HabitTracker
+
+
+class TestConfig:
+    def test_load_config_precedence(self, tmp_path, monkeypatch):
+        """Test if keyword arguments override environment variables, which override the config file."""
+        config_path = tmp_path / "habit_tracker.json"
+        config_path.write_text(json.dumps({"database_url": "sqlite:///file.db", "pool_size": 2, "pool_timeout": 3}))
+        monkeypatch.setenv("HABIT_TRACKER_POOL_SIZE", "7")
+        monkeypatch.setenv("HABIT_TRACKER_POOL_PRE_PING", "true")
+
+        config = load_config(str(config_path), database_url="sqlite:///argument.db")
+
+        assert config["database_url"] == "sqlite:///argument.db"
+        assert config["pool_size"] == 7
+        assert config["pool_timeout"] == 3
+        assert config["pool_pre_ping"] is True
+        assert config["max_overflow"] == DEFAULT_CONFIG["max_overflow"]
+
+    def test_load_config_unknown_setting(self, tmp_path):
+        """Test if a ValueError is raised for a setting that does not exist."""
+        config_path = tmp_path / "habit_tracker.json"
+        config_path.write_text(json.dumps({"database": "habits.db"}))
+
+        with pytest.raises(ValueError):
+            load_config(str(config_path))
+
+    def test_load_config_unsupported_database(self):
+        """Test if a ValueError is raised for a database the SQL of the tracker is not written for."""
+        assert load_config(database_url="postgresql+psycopg2://localhost/habits")["database_url"].startswith("postgresql")
+        with pytest.raises(ValueError, match="Unsupported database mysql"):
+            load_config(database_url="mysql+pymysql://localhost/habits")
+
+    def test_sqlite_pragmas_applied(self, tmp_path):
+        """Test if the configured pragmas are applied to new SQLite connections."""
+        engine = create_database_engine(load_config(database_url=f"sqlite:///{tmp_path / 'habits.db'}"))
+
+        with engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+            assert connection.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+
+    def test_session_per_operation(self, tmp_path):
+        """Test if a tracker without a given session opens one per operation and returns readable objects."""
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}")
+
+        habit = habit_tracker.add_habit(name="Drink water", description=None, periodicity=1)
+        check_off = habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1))
+
+        assert habit_tracker.session is None
+        assert check_off.date_time == datetime(2024, 1, 1)
+        assert habit_tracker.get_habit(habit.id).streak.longest_streak == 1
+        assert habit_tracker.engine.pool.checkedout() == 0
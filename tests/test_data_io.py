@@ -0,0 +1,32 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from data_io import FORMAT_CSV, FORMAT_JSONL, detect_format, read_rows, write_rows
+
+
+class TestDataIO:
+    def test_detect_format(self):
+        """Test if the file format is guessed from the extension unless given explicitly."""
+        assert detect_format("habits.csv") == FORMAT_CSV
+        assert detect_format("habits.jsonl") == FORMAT_JSONL
+        assert detect_format("habits.txt", FORMAT_JSONL) == FORMAT_JSONL
+
+        with pytest.raises(ValueError):
+            detect_format("habits.csv", "xml")
+
+    @pytest.mark.parametrize("fmt", [FORMAT_CSV, FORMAT_JSONL])
+    def test_write_and_read_rows(self, fmt):
+        """Test if rows written to a file are read back in the same order."""
+        file = io.StringIO()
+        rows = [(1, "Drink water", None, datetime(2024, 1, 1, 8, 30)), (2, "Read", "Read a book", datetime(2024, 1, 2))]
+
+        count = write_rows(file, ["id", "name", "description", "date_time"], iter(rows), fmt)
+        file.seek(0)
+        read = list(read_rows(file, fmt))
+
+        assert count == 2
+        assert [str(row["id"]) for row in read] == ["1", "2"]
+        assert read[0]["description"] in ("", None)
+        assert read[1]["date_time"] == "2024-01-02T00:00:00"
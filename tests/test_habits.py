@@ -1,11 +1,17 @@
-from datetime import datetime, timedelta
+import random
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
 from unittest.mock import MagicMock
 
 import pytest
+from sqlalchemy.exc import IntegrityError
 
-from exceptions import InvalidStartDateError, MultipleCheckOffError
-from habit import Habit, CheckOff
+from exceptions import HabitNotFoundError, InvalidStartDateError, MultipleCheckOffError
+from habit import Habit, CheckOff, CheckOffRollup, HabitStreak
 from habit_tracker import HabitTracker
+from tests import create_sqlite_session
 
 class TestHabitTracker:
     def test_create_habit(self):
@@ -46,31 +52,58 @@ class TestHabitTracker:
         """Test if a habit is deleted correctly."""
         mock_db_session = MagicMock()
 
-        habit = Habit(id=1, name="Drink water", description="Drink 2 liters of water daily", periodicity=1)
-        mock_db_session.get.return_value = habit
-
         habit_tracker = HabitTracker(mock_db_session)
         habit_tracker.delete_habit(1)
 
-        mock_db_session.delete.assert_called_once_with(habit)
+        # One set-based delete for the check offs, streak cache, rollups, archive index and the habit, without loading them
+        assert mock_db_session.execute.call_count == 5
+        mock_db_session.delete.assert_not_called()
         mock_db_session.commit.assert_called_once()
 
+    def test_delete_habit_not_found(self):
+        """Test if a HabitNotFoundError exception is raised when deleting a habit that does not exist."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+
+        with pytest.raises(HabitNotFoundError):
+            habit_tracker.delete_habit(1)
+
     def test_delete_all_habits(self):
         """Test if all habits are deleted correctly."""
         mock_db_session = MagicMock()
 
-        habit1 = Habit(id=1, name="Drink water", description="Drink 2 liters of water daily", periodicity=1)
-        habit2 = Habit(id=2, name="Buy groceries", description="Buy groceries", periodicity=2)
-
-        mock_db_session.query.return_value.all.return_value = [habit1, habit2]
-
         habit_tracker = HabitTracker(mock_db_session)
         habit_tracker.delete_all_habits()
 
-        mock_db_session.delete.assert_any_call(habit1)
-        mock_db_session.delete.assert_any_call(habit2)
+        assert mock_db_session.execute.call_count == 5
+        mock_db_session.query.assert_not_called()
+        mock_db_session.delete.assert_not_called()
         mock_db_session.commit.assert_called_once()
 
+    def test_add_habits_and_delete_habits(self):
+        """Test if habits are added in bulk and deleted by id and by filter with their check offs and caches."""
+        session = create_sqlite_session()
+        habit_tracker = HabitTracker(session)
+
+        habits = habit_tracker.add_habits(
+            {"name": f"Habit {i}", "description": None, "periodicity": 1 + i % 2} for i in range(6)
+        )
+        for habit in habits:
+            habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1))
+
+        assert [habit.name for habit in habits] == [f"Habit {i}" for i in range(6)]
+        assert habit_tracker.get_longest_check_off_streaks() == dict.fromkeys([habit.id for habit in habits], 1)
+
+        assert habit_tracker.delete_habits([habits[0].id, habits[1].id, 999]) == 2
+        assert habit_tracker.delete_habits_where(periodicity=2) == 2
+        with pytest.raises(ValueError):
+            habit_tracker.delete_habits_where()
+
+        remaining = [habits[2].id, habits[4].id]
+        assert [habit.id for habit in habit_tracker.get_habits()] == remaining
+        assert {habit_id for _, habit_id, _ in habit_tracker.get_check_off_rows()} == set(remaining)
+        assert {streak.habit_id for streak in session.query(HabitStreak)} == set(remaining)
+        assert {rollup.habit_id for rollup in session.query(CheckOffRollup)} == set(remaining)
+
     def test_check_off_habit(self):
         """Test if a habit is checked off correctly."""
         mock_db_session = MagicMock()
@@ -102,6 +135,22 @@ class TestHabitTracker:
         with pytest.raises(MultipleCheckOffError):
             habit_tracker.check_off_habit(habit_id=1, check_off_date=check_off_date)
 
+    def test_check_off_habit_concurrent_duplicate(self):
+        """Test if a MultipleCheckOffError is raised when the unique check-off day index rejects the insert."""
+        mock_db_session = MagicMock()
+
+        habit = Habit(id=1, name="Drink water", description="Drink 2 liters of water daily", periodicity=1)
+        mock_db_session.get.return_value = habit
+        mock_db_session.query.return_value.filter_by.return_value.filter.return_value.first.return_value = None
+        mock_db_session.commit.side_effect = IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+
+        habit_tracker = HabitTracker(mock_db_session)
+
+        with pytest.raises(MultipleCheckOffError):
+            habit_tracker.check_off_habit(habit_id=1, check_off_date=datetime(2024, 1, 1))
+
+        mock_db_session.rollback.assert_called_once()
+
     def test_get_last_check_off_for_habit(self):
         """Test if the last check off for a habit is returned correctly."""
         mock_db_session = MagicMock()
@@ -210,31 +259,18 @@ class TestHabitTracker:
         """Test if the longest check off streak of all habits is calculated correctly."""
         mock_session = MagicMock()
 
-        habit1 = Habit(id=1, name="Drink Water", description="Drink 2 liters of water daily", periodicity=1)
-        habit2 = Habit(id=2, name="Buy groceries", description="Buy groceries", periodicity=2)
-
-        mock_session.query.return_value.all.return_value = [habit1, habit2]
-
-        # Mock the filter_by method to return the check offs for each habit
-        def mock_filter_by(habit_id):
-            if habit_id == habit1.id:
-                return MagicMock(order_by=MagicMock(return_value=MagicMock(all=MagicMock(return_value=[
-                    CheckOff(habit_id=1, date_time=datetime(2024, 1, 1)),
-                    CheckOff(habit_id=1, date_time=datetime(2024, 1, 2)),
-                    CheckOff(habit_id=1, date_time=datetime(2024, 1, 3)),
-                    CheckOff(habit_id=1, date_time=datetime(2024, 1, 5)),
-                ]))))
-            elif habit_id == habit2.id:
-                return MagicMock(order_by=MagicMock(return_value=MagicMock(all=MagicMock(return_value=[
-                    CheckOff(habit_id=2, date_time=datetime(2024, 1, 1)),
-                    CheckOff(habit_id=2, date_time=datetime(2024, 1, 8)),
-                    CheckOff(habit_id=2, date_time=datetime(2024, 1, 15)),
-                    CheckOff(habit_id=2, date_time=datetime(2024, 1, 22)),
-                    CheckOff(habit_id=2, date_time=datetime(2024, 2, 14)),
-                ]))))
-
-        mock_session.query.return_value.filter_by.side_effect = mock_filter_by
-
+        # Mock the single ordered scan over all habits and their check offs
+        mock_session.query.return_value.outerjoin.return_value.order_by.return_value.all.return_value = [
+            (1, 1, datetime(2024, 1, 1)),
+            (1, 1, datetime(2024, 1, 2)),
+            (1, 1, datetime(2024, 1, 3)),
+            (1, 1, datetime(2024, 1, 5)),
+            (2, 2, datetime(2024, 1, 1)),
+            (2, 2, datetime(2024, 1, 8)),
+            (2, 2, datetime(2024, 1, 15)),
+            (2, 2, datetime(2024, 1, 22)),
+            (2, 2, datetime(2024, 2, 14)),
+        ]
 
         habit_tracker = HabitTracker(mock_session)
         streak, habit_id = habit_tracker.get_longest_streak_of_all_habits()
@@ -245,6 +281,221 @@ class TestHabitTracker:
         assert habit_id == 2
 
 
+    def test_get_longest_check_off_streaks(self):
+        """Test if the longest check off streak of every habit is calculated in a single query."""
+        mock_session = MagicMock()
+
+        mock_session.query.return_value.outerjoin.return_value.order_by.return_value.all.return_value = [
+            (1, 1, datetime(2024, 1, 1)),
+            (1, 1, datetime(2024, 1, 2)),
+            (1, 1, datetime(2024, 1, 4)),
+            (2, 2, datetime(2024, 1, 1)),
+            (2, 2, datetime(2024, 1, 8)),
+            (3, 1, None),
+        ]
+
+        habit_tracker = HabitTracker(mock_session)
+        streaks = habit_tracker.get_longest_check_off_streaks()
+
+        assert streaks == {1: 2, 2: 8, 3: 0}
+        mock_session.query.assert_called_once()
+
+
+    def test_check_off_habit_advances_streak_cache(self):
+        """Test if the cached streak of a habit is advanced when a habit is checked off."""
+        mock_db_session = MagicMock()
+
+        habit = Habit(id=1, name="Drink water", description="Drink 2 liters of water daily", periodicity=1)
+        habit.streak = HabitStreak(
+            current_streak=2,
+            current_streak_start=datetime(2024, 1, 1),
+            longest_streak=2,
+            last_check_off=datetime(2024, 1, 2),
+        )
+        # Once the habit is cached, only its streak row and creation date are read
+        mock_db_session.get.return_value = habit
+        mock_db_session.execute.return_value.first.return_value = SimpleNamespace(
+            HabitStreak=habit.streak, creation_date=habit.creation_date
+        )
+        mock_db_session.query.return_value.filter_by.return_value.filter.return_value.first.return_value = None
+
+        habit_tracker = HabitTracker(mock_db_session)
+        habit_tracker.check_off_habit(habit_id=1, check_off_date=datetime(2024, 1, 3))
+
+        assert habit.streak.current_streak == 3
+        assert habit.streak.longest_streak == 3
+        assert habit.streak.last_check_off == datetime(2024, 1, 3)
+
+        habit_tracker.check_off_habit(habit_id=1, check_off_date=datetime(2024, 1, 5))
+
+        assert habit.streak.current_streak == 1
+        assert habit.streak.current_streak_start == datetime(2024, 1, 5)
+        assert habit.streak.longest_streak == 3
+
+    def test_concurrent_check_offs_keep_streak_cache(self, tmp_path):
+        """Test if check-offs of a habit from several threads, in any order, all reach its cached streak."""
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}")
+        rng = random.Random(1)
+
+        # Lost updates depend on thread timing, so several habits are checked off in turn
+        for index in range(8):
+            habit = habit_tracker.add_habit(f"Habit {index}", "Description", 1)
+            days = [datetime(2024, 1, 1, 8) + timedelta(days=day) for day in range(28)]
+            rng.shuffle(days)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(lambda day: habit_tracker.check_off_habit(habit.id, day), days))
+
+            assert habit_tracker.get_longest_check_off_streak_for_habit(habit.id) == 28
+            assert habit_tracker.get_checked_off_periods(datetime(2024, 1, 1), datetime(2024, 2, 1), habit.id) == {habit.id: 28}
+
+    def test_rejected_check_off_releases_write_lock(self, tmp_path):
+        """Test if a rejected check-off on a shared session ends its transaction, so other connections can write."""
+        path = tmp_path / "habits.db"
+        habit_tracker = HabitTracker(create_sqlite_session(f"sqlite:///{path}"))
+        habit = habit_tracker.add_habit("Drink water", "Drink 2 liters of water daily", 1)
+        habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1, 8))
+
+        with pytest.raises(MultipleCheckOffError):
+            habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1, 20))
+        with pytest.raises(HabitNotFoundError):
+            habit_tracker.check_off_habit(999, datetime(2024, 1, 1, 20))
+
+        connection = sqlite3.connect(path, timeout=0.1)
+        try:
+            connection.execute("UPDATE habits SET name = 'Drink tea'")
+            connection.commit()
+        finally:
+            connection.close()
+
+    def test_habit_cache_ignores_reused_ids(self, tmp_path):
+        """Test if a habit deleted by another tracker does not leave its cached metadata to a new habit with its id."""
+        url = f"sqlite:///{tmp_path / 'habits.db'}"
+        habit_tracker, other_tracker = HabitTracker(database_url=url), HabitTracker(database_url=url)
+        weekly = habit_tracker.add_habit("Groceries", "Buy groceries", 2)
+        habit_tracker.check_off_habit(weekly.id, datetime(2024, 1, 1, 8))
+
+        other_tracker.delete_habit(weekly.id)
+        daily = other_tracker.add_habit("Drink water", "Drink 2 liters of water daily", 1)
+        assert daily.id == weekly.id
+
+        habit_tracker.check_off_habit(daily.id, datetime(2024, 1, 1, 8))
+        habit_tracker.check_off_habit(daily.id, datetime(2024, 1, 2, 8))
+        assert habit_tracker.get_longest_check_off_streak_for_habit(daily.id) == 2
+
+    def test_get_longest_check_off_streak_for_habit_from_cache(self):
+        """Test if the longest check off streak is read from the streak cache without scanning the check offs."""
+        mock_session = MagicMock()
+
+        habit = Habit(id=1, name="Drink Water", description="Drink 2 liters of water daily", periodicity=1)
+        habit.streak = HabitStreak(current_streak=1, longest_streak=5, last_check_off=datetime(2024, 1, 9))
+        mock_session.get.return_value = habit
+
+        habit_tracker = HabitTracker(mock_session)
+        streak = habit_tracker.get_longest_check_off_streak_for_habit(1)
+
+        assert streak == 5
+        mock_session.query.assert_not_called()
+
+    def test_get_current_streak(self):
+        """Test if the current streak is read from the streak cache and is 0 once the streak is broken."""
+        mock_session = MagicMock()
+
+        habit = Habit(id=1, name="Drink Water", description="Drink 2 liters of water daily", periodicity=1)
+        habit.streak = HabitStreak(current_streak=3, longest_streak=5, last_check_off=datetime(2024, 1, 9))
+        mock_session.get.side_effect = lambda model, habit_id: habit.streak if model is HabitStreak else habit
+
+        habit_tracker = HabitTracker(mock_session)
+
+        assert habit_tracker.get_current_streak(1, now=datetime(2024, 1, 10, 12)) == 3
+        assert habit_tracker.get_current_streak(1, now=datetime(2024, 1, 11, 12)) == 0
+        mock_session.query.assert_not_called()
+
+    def test_check_off_habit_uses_habit_cache(self):
+        """Test if a cached habit is checked off without loading it again, and is evicted from the cache when deleted."""
+        mock_db_session = MagicMock()
+
+        habit = Habit(id=1, name="Drink water", description="Drink 2 liters of water daily", periodicity=1)
+        habit.streak = HabitStreak(
+            current_streak=1,
+            current_streak_start=datetime(2024, 1, 1),
+            longest_streak=1,
+            last_check_off=datetime(2024, 1, 1),
+        )
+        mock_db_session.get.return_value = habit
+        # The streak row of a cached habit is read with the creation date the cached metadata is checked against
+        mock_db_session.execute.return_value.first.return_value = SimpleNamespace(
+            HabitStreak=habit.streak, creation_date=habit.creation_date
+        )
+
+        habit_tracker = HabitTracker(mock_db_session)
+        habit_tracker.check_off_habit(habit_id=1, check_off_date=datetime(2024, 1, 2))
+        habit_tracker.check_off_habit(habit_id=1, check_off_date=datetime(2024, 1, 3))
+
+        loaded_models = [call.args[0] for call in mock_db_session.get.call_args_list]
+        assert loaded_models == [Habit]
+        # Check-offs after the last one are validated from the streak cache
+        mock_db_session.query.assert_not_called()
+        assert habit.streak.current_streak == 3
+
+        with pytest.raises(MultipleCheckOffError):
+            habit_tracker.check_off_habit(habit_id=1, check_off_date=datetime(2024, 1, 3, 18))
+
+        habit_tracker.delete_habit(1)
+        assert len(habit_tracker.habit_cache) == 0
+
+    def test_period_histories(self):
+        """Test if check-offs keep the period history of a habit in sync, also when the streak cache is rebuilt."""
+        session = create_sqlite_session()
+        habit_tracker = HabitTracker(session)
+        daily, weekly = habit_tracker.add_habits([
+            {"name": "Drink water", "description": None, "periodicity": 1, "creation_date": datetime(2024, 1, 1)},
+            {"name": "Groceries", "description": None, "periodicity": 2, "creation_date": datetime(2024, 1, 1)},
+        ])
+        for day in (1, 2, 3, 5):
+            habit_tracker.check_off_habit(daily.id, datetime(2024, 1, day, 9))
+        habit_tracker.check_off_habit(daily.id, datetime(2024, 1, 4, 9))
+        habit_tracker.bulk_check_off([(weekly.id, datetime(2024, 1, 2, 9)), (weekly.id, datetime(2024, 1, 9, 9))])
+
+        history = habit_tracker.get_period_history(daily.id)
+        assert history.origin == date(2024, 1, 1)
+        assert history.bits == 0b11111
+        assert habit_tracker.get_period_streaks(now=datetime(2024, 1, 6, 12)) == {daily.id: (5, 5), weekly.id: (1, 2)}
+        assert habit_tracker.get_period_streaks(now=datetime(2024, 1, 9, 12)) == {daily.id: (0, 5), weekly.id: (2, 2)}
+        assert habit_tracker.get_checked_off_periods(datetime(2024, 1, 2), datetime(2024, 1, 4)) == {daily.id: 2, weekly.id: 1}
+
+        habit_tracker.rebuild_streak_cache()
+        assert habit_tracker.get_period_history(daily.id) == history
+        with pytest.raises(HabitNotFoundError):
+            habit_tracker.get_period_history(99)
+
+    def test_get_dashboard_and_habits_at_risk(self):
+        """Test if the dashboard reports current streaks and habits at risk, also for habits without cached streaks."""
+        session = create_sqlite_session()
+        habit_tracker = HabitTracker(session)
+        now = datetime(2024, 1, 20, 12)
+
+        daily = habit_tracker.add_habit(name="Drink water", description=None, periodicity=1)
+        done_today = habit_tracker.add_habit(name="Read", description=None, periodicity=1)
+        weekly = habit_tracker.add_habit(name="Groceries", description=None, periodicity=2)
+        habit_tracker.add_habit(name="Never", description=None, periodicity=1)
+        for offset in range(3):
+            habit_tracker.check_off_habit(daily.id, datetime(2024, 1, 17, 9) + timedelta(days=offset))
+            habit_tracker.check_off_habit(done_today.id, datetime(2024, 1, 18, 9) + timedelta(days=offset))
+        habit_tracker.check_off_habit(weekly.id, datetime(2024, 1, 14, 9))
+
+        session.delete(weekly.streak)
+        session.commit()
+
+        assert habit_tracker.get_dashboard(now) == [
+            (daily.id, "Drink water", 1, 3, 3, datetime(2024, 1, 19, 9), True),
+            (done_today.id, "Read", 1, 3, 3, datetime(2024, 1, 20, 9), False),
+            (weekly.id, "Groceries", 2, 1, 1, datetime(2024, 1, 14, 9), True),
+            (4, "Never", 1, 0, 0, None, False),
+        ]
+        assert [row[0] for row in habit_tracker.get_habits_at_risk(now)] == [daily.id, weekly.id]
+        assert habit_tracker.get_current_streak(weekly.id, now) == 1
+        assert habit_tracker.get_current_streak(daily.id, datetime(2024, 1, 22)) == 0
+
     def test_generate_example_data_with_invalid_date(self):
         """Test if an InvalidStartDateError exception is raised when the start date is invalid when generating example data."""
         mock_session = MagicMock()
@@ -259,3 +510,79 @@ class TestHabitTracker:
         with pytest.raises(InvalidStartDateError) as e:
             habit_tracker = HabitTracker(mock_session)
             habit_tracker.generate_example_data(predefined_habits=predefined_habits, start_date=invalid_start_date, weeks=weeks)
+
+    def test_bulk_check_off(self):
+        """Test if valid check offs are inserted in bulk and invalid ones are reported instead of raised."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+        daily = habit_tracker.add_habit(name="Drink water", description="Drink 2 liters of water daily", periodicity=1)
+        weekly = habit_tracker.add_habit(name="Buy groceries", description="Buy groceries", periodicity=2)
+        habit_tracker.check_off_habit(daily.id, datetime(2024, 1, 2))
+
+        inserted, rejected = habit_tracker.bulk_check_off([
+            (daily.id, datetime(2024, 1, 1)),
+            (daily.id, datetime(2024, 1, 2, 12)),
+            (daily.id, datetime(2024, 1, 3)),
+            (weekly.id, datetime(2024, 1, 1)),
+            (weekly.id, datetime(2024, 1, 5)),
+            (weekly.id, datetime(2024, 1, 8)),
+            (99, datetime(2024, 1, 1)),
+        ], batch_size=2)
+
+        assert inserted == 4
+        assert rejected == [
+            (daily.id, datetime(2024, 1, 2, 12), "You can only check off once per day."),
+            (weekly.id, datetime(2024, 1, 5), "You can only check off once every 7 days."),
+            (99, datetime(2024, 1, 1), "Habit with id 99 does not exist."),
+        ]
+        assert habit_tracker.get_longest_check_off_streak_for_habit(daily.id) == 3
+        assert habit_tracker.get_longest_check_off_streak_for_habit(weekly.id) == 8
+
+    def test_generate_example_data(self):
+        """Test if example data is generated for every predefined habit."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+
+        predefined_habits = [
+            {"name": "Drink Water", "description": "Drink 2 liters of water", "periodicity": 1},
+            {"name": "Grocery Shopping", "description": "Do grocery shopping", "periodicity": 2},
+        ]
+        habits = habit_tracker.generate_example_data(predefined_habits=predefined_habits, start_date=datetime(2024, 1, 1), weeks=4)
+
+        assert len(habit_tracker.get_all_check_offs_for_habit(habits[0].id)) == 28
+        assert len(habit_tracker.get_all_check_offs_for_habit(habits[1].id)) == 4
+        assert habit_tracker.get_longest_streak_of_all_habits() == (28, habits[0].id)
+
+    def test_export_and_import(self, tmp_path):
+        """Test if habits and check offs exported to files are restored into an empty database."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+        habit = habit_tracker.add_habit(name="Buy groceries", description="Buy groceries", periodicity=2)
+        habit_tracker.bulk_check_off([(habit.id, datetime(2024, 1, 1)), (habit.id, datetime(2024, 1, 8))])
+
+        assert habit_tracker.export_habits(str(tmp_path / "habits.csv")) == 1
+        assert habit_tracker.export_check_offs(str(tmp_path / "check_offs.jsonl")) == 2
+
+        restored = HabitTracker(create_sqlite_session())
+        assert restored.import_habits(str(tmp_path / "habits.csv")) == 1
+        assert restored.import_check_offs(str(tmp_path / "check_offs.jsonl")) == (2, [])
+
+        assert restored.get_habit(habit.id).name == "Buy groceries"
+        assert restored.get_longest_check_off_streak_for_habit(habit.id) == 8
+
+    def test_paginate_habits_and_check_offs(self):
+        """Test if habits and check offs are listed page by page after the last seen id."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+        habits = [habit_tracker.add_habit(name=f"Habit {i}", description=None, periodicity=1) for i in range(5)]
+        habit_tracker.bulk_check_off([(habits[0].id, datetime(2024, 1, day)) for day in range(1, 11)])
+
+        first_page = habit_tracker.get_habits(limit=2)
+        second_page = habit_tracker.get_habit_rows(after_id=first_page[-1].id, limit=2)
+
+        assert [habit.id for habit in first_page] == [habits[0].id, habits[1].id]
+        assert [row.id for row in second_page] == [habits[2].id, habits[3].id]
+
+        check_offs = habit_tracker.get_all_check_offs_for_habit(
+            habits[0].id, limit=3, since=datetime(2024, 1, 3), until=datetime(2024, 1, 9)
+        )
+        rows = habit_tracker.get_check_off_rows(after_id=check_offs[-1].id, since=datetime(2024, 1, 3), until=datetime(2024, 1, 9))
+
+        assert [check_off.date_time.day for check_off in check_offs] == [3, 4, 5]
+        assert [row.date_time.day for row in rows] == [6, 7, 8]
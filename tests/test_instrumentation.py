@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from exceptions import MultipleCheckOffError
+from habit_tracker import HabitTracker
+from instrumentation import Instrumentation, to_prometheus
+from server import dispatch
+from tests import create_sqlite_session
+
+
+@pytest.fixture
+def habit_tracker():
+    return HabitTracker(create_sqlite_session(), instrumentation=Instrumentation(buckets=(0.001, 1.0)))
+
+
+class TestInstrumentation:
+    def test_operation_statistics(self, habit_tracker):
+        """Test if calls, errors, statements, rows and latency buckets are recorded per operation."""
+        habits = [habit_tracker.add_habit(name=f"Habit {i}", description=None, periodicity=1) for i in range(3)]
+        for habit in habits:
+            for offset in range(4):
+                habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1) + timedelta(days=offset))
+        with pytest.raises(MultipleCheckOffError):
+            habit_tracker.check_off_habit(habits[0].id, datetime(2024, 1, 1, 12))
+
+        habit_tracker.get_longest_streak_of_all_habits()
+        snapshot = habit_tracker.instrumentation.snapshot()
+
+        check_off = snapshot["operations"]["check_off_habit"]
+        assert check_off["count"] == 13
+        assert check_off["errors"] == 1
+        assert check_off["buckets"][-1] == ["+Inf", 13]
+        assert [upper_bound for upper_bound, _ in check_off["buckets"]] == [0.001, 1.0, "+Inf"]
+        # All streaks come from a single query, whatever the number of habits
+        assert snapshot["operations"]["get_longest_streak_of_all_habits"]["max_statements"] == 1
+        assert snapshot["operations"]["get_longest_streak_of_all_habits"]["rows"] == 12
+        assert snapshot["operations"]["get_longest_check_off_streaks"]["count"] == 1
+        assert snapshot["caches"]["streak"] == {"hits": 12, "misses": 0}
+        assert snapshot["statements"] >= check_off["statements"] > 0
+
+    def test_streak_cache_miss_on_backfill(self, habit_tracker):
+        """Test if a backfilled check-off counts as a miss of the streak cache."""
+        habit = habit_tracker.add_habit(name="Read", description=None, periodicity=1)
+        habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 2))
+        habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1))
+
+        assert habit_tracker.instrumentation.snapshot()["caches"]["streak"] == {"hits": 1, "misses": 1}
+
+    def test_to_prometheus(self, habit_tracker):
+        """Test if a snapshot is exported in the Prometheus text format."""
+        habit_tracker.add_habit(name="Read", description=None, periodicity=1)
+
+        text = to_prometheus(habit_tracker.instrumentation.snapshot())
+
+        assert 'habit_tracker_operation_duration_seconds_bucket{operation="add_habit",le="+Inf"} 1' in text
+        assert 'habit_tracker_operation_duration_seconds_count{operation="add_habit"} 1' in text
+        assert 'habit_tracker_operation_statements_total{operation="add_habit"}' in text
+        assert text.endswith("\n")
+
+    def test_stats_without_instrumentation(self):
+        """Test if no statistics are reported when the instrumentation is off."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+
+        habit_tracker.add_habit(name="Read", description=None, periodicity=1)
+
+        assert habit_tracker.instrumentation is None
+        assert dispatch(habit_tracker, "get_stats") is None
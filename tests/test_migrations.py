@@ -0,0 +1,122 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect
+
+from archive import CheckOffArchive
+from constants import SCHEMA_VERSION
+from migrations import upgrade_schema
+
+
+class TestMigrations:
+    def test_upgrade_legacy_database(self, tmp_path):
+        """Test if a database created before check-off days were stored is upgraded in place."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "CREATE TABLE habits (id INTEGER PRIMARY KEY, name VARCHAR(150), description VARCHAR(400), "
+                "periodicity INTEGER, creation_date TIMESTAMP)"
+            )
+            connection.exec_driver_sql(
+                "CREATE TABLE check_offs (id INTEGER PRIMARY KEY, "
+                "habit_id INTEGER REFERENCES habits (id) ON DELETE CASCADE, date_time TIMESTAMP)"
+            )
+            connection.exec_driver_sql("INSERT INTO habits VALUES (1, 'Drink water', NULL, 1, '2024-01-01 00:00:00')")
+            connection.exec_driver_sql(
+                "INSERT INTO check_offs (habit_id, date_time) VALUES "
+                "(1, '2024-01-01 08:00:00.000000'), (1, '2024-01-01 09:00:00.000000'), (1, '2024-01-02 08:00:00.000000')"
+            )
+
+        upgrade_schema(engine)
+
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql("SELECT id, day FROM check_offs ORDER BY id").all()
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        indexes = {index["name"] for index in inspect(engine).get_indexes("check_offs")}
+
+        assert rows == [(1, "2024-01-01"), (3, "2024-01-02")]
+        assert version == SCHEMA_VERSION
+        assert {"ix_check_offs_habit_id_date_time", "ix_check_offs_date_time", "ux_check_offs_habit_id_day"} <= indexes
+        assert inspect(engine).has_table("habit_streaks")
+        with engine.connect() as connection:
+            rollups = connection.exec_driver_sql("SELECT habit_id, month, check_offs FROM check_off_rollups").all()
+        assert rollups == [(1, "2024-01-01", 2)]
+
+    def test_upgrade_new_database(self, tmp_path):
+        """Test if a new database is created with the current schema version."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+
+        upgrade_schema(engine)
+        upgrade_schema(engine)
+
+        with engine.connect() as connection:
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        columns = {column["name"] for column in inspect(engine).get_columns("check_offs")}
+
+        assert version == SCHEMA_VERSION
+        assert "day" in columns
+
+    def test_upgrade_adds_streak_histories(self, tmp_path):
+        """Test if the period histories of cached streaks are computed from the check-offs when upgrading."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'v3.db'}")
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "CREATE TABLE habits (id INTEGER PRIMARY KEY, name VARCHAR(150), description VARCHAR(400), "
+                "periodicity INTEGER, creation_date TIMESTAMP)"
+            )
+            connection.exec_driver_sql(
+                "CREATE TABLE check_offs (id INTEGER PRIMARY KEY, habit_id INTEGER, date_time TIMESTAMP, day DATE)"
+            )
+            connection.exec_driver_sql(
+                "CREATE TABLE habit_streaks (habit_id INTEGER PRIMARY KEY, current_streak INTEGER, "
+                "current_streak_start TIMESTAMP, longest_streak INTEGER, last_check_off TIMESTAMP)"
+            )
+            connection.exec_driver_sql("INSERT INTO habits VALUES (1, 'Drink water', NULL, 1, '2024-01-01 00:00:00')")
+            connection.exec_driver_sql(
+                "INSERT INTO check_offs (habit_id, date_time, day) VALUES "
+                "(1, '2024-01-01 08:00:00.000000', '2024-01-01'), (1, '2024-01-03 08:00:00.000000', '2024-01-03')"
+            )
+            connection.exec_driver_sql("INSERT INTO habit_streaks (habit_id) VALUES (1)")
+            connection.exec_driver_sql("PRAGMA user_version = 3")
+
+        upgrade_schema(engine)
+
+        with engine.connect() as connection:
+            origin, history = connection.exec_driver_sql("SELECT history_origin, history FROM habit_streaks").one()
+
+        assert origin == "2024-01-01"
+        assert history == bytes([0b101])
+
+    def test_upgrade_adds_check_off_autoincrement(self, tmp_path):
+        """Test if check_offs is rebuilt with AUTOINCREMENT ids that continue after the largest archived id."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'v5.db'}")
+        upgrade_schema(engine)
+        with engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE check_offs")
+            connection.exec_driver_sql(
+                "CREATE TABLE check_offs (id INTEGER PRIMARY KEY, "
+                "habit_id INTEGER REFERENCES habits (id) ON DELETE CASCADE, date_time TIMESTAMP, day DATE)"
+            )
+            connection.exec_driver_sql("INSERT INTO habits VALUES (1, 'Drink water', NULL, 1, '2024-01-01 00:00:00')")
+            connection.exec_driver_sql(
+                "INSERT INTO check_offs VALUES (1, 1, '2024-01-01 08:00:00.000000', '2024-01-01'), "
+                "(2, 1, '2024-01-02 08:00:00.000000', '2024-01-02')"
+            )
+            connection.exec_driver_sql("PRAGMA user_version = 5")
+        # Check-offs 3 and 4 were archived, so the live table alone would give out id 3 again
+        archive = CheckOffArchive(str(tmp_path / "archive"))
+        archive.write_segment([(3, 1, datetime(2024, 1, 3, 8)), (4, 1, datetime(2024, 1, 4, 8))])
+
+        upgrade_schema(engine, archive)
+
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO check_offs (habit_id, date_time, day) VALUES (1, '2024-01-05 08:00:00.000000', '2024-01-05')"
+            )
+            rows = connection.exec_driver_sql("SELECT id, day FROM check_offs ORDER BY id").all()
+            sql = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'check_offs'").scalar()
+        indexes = {index["name"] for index in inspect(engine).get_indexes("check_offs")}
+
+        assert rows == [(1, "2024-01-01"), (2, "2024-01-02"), (5, "2024-01-05")]
+        assert "AUTOINCREMENT" in sql
+        assert {"ix_check_offs_habit_id_date_time", "ix_check_offs_date_time", "ux_check_offs_habit_id_day"} <= indexes
+        assert [foreign_key["referred_table"] for foreign_key in inspect(engine).get_foreign_keys("check_offs")] == ["habits"]
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+from habit import HabitStreak
+from habit_tracker import HabitTracker
+from parallel import habit_id_shards
+from benchmarks.synthetic_data import generate_synthetic_data
+
+
+class TestParallelAnalytics:
+    def test_habit_id_shards(self):
+        """Test if habit ids are split in ranges of about the same number of habits."""
+        assert habit_id_shards([1, 2, 5, 9, 10, 11, 20], 3) == [(1, 5), (9, 11), (20, 20)]
+        assert habit_id_shards([4], 8) == [(4, 4)]
+        assert habit_id_shards([], 8) == []
+
+    def test_parallel_streaks(self, tmp_path):
+        """Test if streaks computed by worker processes are the same as those computed in a single process."""
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}")
+        generate_synthetic_data(habit_tracker, habits=30, days=60, weekly_ratio=0.3, seed=3)
+
+        def streak_cache():
+            with habit_tracker._session_scope() as session:
+                return sorted(
+                    (streak.habit_id, streak.current_streak, streak.longest_streak, streak.last_check_off, streak.history)
+                    for streak in session.query(HabitStreak)
+                )
+
+        expected_cache = streak_cache()
+        expected = habit_tracker.get_longest_check_off_streaks()
+
+        try:
+            assert habit_tracker.get_longest_check_off_streaks(workers=2) == expected
+            assert habit_tracker.get_longest_streak_of_all_habits(workers=2) == habit_tracker.get_longest_streak_of_all_habits()
+            assert habit_tracker.rebuild_streak_cache(workers=2) == 30
+            assert streak_cache() == expected_cache
+        finally:
+            habit_tracker.engine.dispose()
+
+    def test_parallel_rebuild_keeps_concurrent_check_offs(self, tmp_path):
+        """Test if a check-off committed while worker processes rebuild the streak cache is not overwritten by it."""
+        url = f"sqlite:///{tmp_path / 'habits.db'}"
+        habit_tracker, other_tracker = HabitTracker(database_url=url), HabitTracker(database_url=url)
+        habits = [habit_tracker.add_habit(f"Habit {index}", "Description", 1) for index in range(2)]
+        for day in range(1, 4):
+            habit_tracker.check_off_habit(habits[0].id, datetime(2024, 1, day, 8))
+
+        map_shards = habit_tracker._map_shards
+        executor = ThreadPoolExecutor(max_workers=1)
+        check_offs = []
+
+        def map_shards_then_check_off(task, workers):
+            states = map_shards(task, workers)
+            # Given a moment to commit before the rebuilt states are written
+            check_offs.append(executor.submit(other_tracker.check_off_habit, habits[0].id, datetime(2024, 1, 4, 8)))
+            wait(check_offs, timeout=0.5)
+            return states
+
+        habit_tracker._map_shards = map_shards_then_check_off
+        try:
+            assert habit_tracker.rebuild_streak_cache(workers=2) == 2
+            check_offs[0].result()
+            assert habit_tracker.get_longest_check_off_streak_for_habit(habits[0].id) == 4
+        finally:
+            executor.shutdown()
+            habit_tracker.engine.dispose()
+            other_tracker.engine.dispose()
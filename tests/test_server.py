@@ -0,0 +1,82 @@
+import socket
+import threading
+from datetime import datetime
+
+import pytest
+
+from client import HabitTrackerClient
+from exceptions import DaemonError, HabitNotFoundError, MultipleCheckOffError
+from habit_tracker import HabitTracker
+from server import HabitTrackerServer, dispatch
+from tests import create_sqlite_session
+
+
+class TestServer:
+    def test_dispatch(self):
+        """Test if daemon API methods return JSON serializable results."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+        habit = dispatch(habit_tracker, "add_habit", {"name": "Drink water", "description": None, "periodicity": 1})
+        dispatch(habit_tracker, "check_off_habit", {"habit_id": habit["id"], "check_off_date": "2024-01-01T08:00:00"})
+
+        assert dispatch(habit_tracker, "get_check_off_rows", {"habit_id": habit["id"]}) == [[1, habit["id"], "2024-01-01T08:00:00"]]
+        assert dispatch(habit_tracker, "get_longest_streak_of_all_habits") == [1, habit["id"]]
+        assert dispatch(habit_tracker, "get_dashboard", {"now": "2024-01-02T08:00:00", "at_risk_only": True}) == [
+            [habit["id"], "Drink water", 1, 1, 1, "2024-01-01T08:00:00", True],
+        ]
+
+    def test_client_and_server(self, tmp_path):
+        """Test if the client sends requests over the socket and raises the errors reported by the daemon."""
+        habit_tracker = HabitTracker(create_sqlite_session(f"sqlite:///{tmp_path / 'habits.db'}"))
+        habit_id = habit_tracker.add_habit(name="Drink water", description=None, periodicity=1).id
+        socket_path = str(tmp_path / "habits.sock")
+
+        server = HabitTrackerServer(habit_tracker, socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            assert HabitTrackerClient.is_running(socket_path)
+            with HabitTrackerClient(socket_path) as client:
+                client.call("check_off_habit", habit_id=habit_id, check_off_date=datetime(2024, 1, 1).isoformat())
+
+                with pytest.raises(MultipleCheckOffError):
+                    client.call("check_off_habit", habit_id=habit_id, check_off_date=datetime(2024, 1, 1, 12).isoformat())
+                with pytest.raises(HabitNotFoundError):
+                    client.call("get_longest_check_off_streak_for_habit", habit_id=99)
+
+                assert client.call("get_longest_check_off_streak_for_habit", habit_id=habit_id) == 1
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        assert not HabitTrackerClient.is_running(socket_path)
+
+    def test_connections_are_served_concurrently(self, tmp_path):
+        """Test if a client keeping its connection open does not block the requests of another client."""
+        habit_tracker = HabitTracker(create_sqlite_session(f"sqlite:///{tmp_path / 'habits.db'}"))
+        habit_id = habit_tracker.add_habit(name="Drink water", description=None, periodicity=1).id
+        socket_path = str(tmp_path / "habits.sock")
+
+        server = HabitTrackerServer(habit_tracker, socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with HabitTrackerClient(socket_path) as first, HabitTrackerClient(socket_path, timeout=2) as second:
+                first.call("get_habit_rows")
+                assert second.call("get_habit_rows")[0][1] == "Drink water"
+                assert first.call("get_longest_check_off_streak_for_habit", habit_id=habit_id) == 0
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_client_timeout(self, tmp_path):
+        """Test if a daemon that does not answer in time is reported as a DaemonError."""
+        socket_path = str(tmp_path / "habits.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+            listener.bind(socket_path)
+            listener.listen()
+            client = HabitTrackerClient(socket_path, timeout=0.1)
+
+            with pytest.raises(DaemonError, match="did not answer"):
+                client.call("get_habit_rows")
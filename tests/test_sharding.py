@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import random
+
+import pytest
+
+from config import load_config
+from exceptions import HabitNotFoundError, MultipleCheckOffError
+from habit_tracker import HabitTracker
+from sharding import ShardedHabitTracker, shard_config
+
+
+def add_history(habit_tracker, seed: int) -> None:
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    habits = habit_tracker.add_habits(
+        {"name": f"Habit {index}", "periodicity": rng.choice([1, 1, 7]), "creation_date": start} for index in range(20)
+    )
+    habit_tracker.bulk_check_off(
+        (habit.id, start + timedelta(days=day, hours=rng.randrange(24)))
+        for habit in habits
+        for day in range(0, 60, habit.periodicity)
+        if rng.random() < 0.8
+    )
+
+
+@pytest.fixture
+def sharded_tracker(tmp_path):
+    tracker = ShardedHabitTracker(config=load_config(database_url=f"sqlite:///{tmp_path / 'habits.db'}", shards=3))
+    yield tracker
+    tracker.close()
+
+
+class TestShardedHabitTracker:
+    def test_shard_config(self):
+        """Test if each shard gets its own database file and archive directory."""
+        config = load_config(database_url="sqlite:///data/habits.db", archive_path="archive", shards=4)
+        assert shard_config(config, 2)["database_url"] == "sqlite:///data/habits-shard2.db"
+        assert shard_config(config, 2)["archive_path"] == "archive/shard2"
+        assert shard_config(load_config(database_url="sqlite://"), 0)["database_url"] == "sqlite://"
+
+    def test_habits_are_routed_to_their_shard(self, sharded_tracker, tmp_path):
+        """Test if habits get ids congruent to their shard, and their check-offs are stored in that shard."""
+        habits = [sharded_tracker.add_habit(f"Habit {index}", "Description", 1) for index in range(5)]
+        assert len({habit.id for habit in habits}) == 5
+        assert {sharded_tracker.shard_index(habit.id) for habit in habits} == {0, 1, 2}
+
+        keyed = [sharded_tracker.add_habit("Read", "Read a book", 1, shard_key="alice") for _ in range(3)]
+        shard = sharded_tracker.shard_index(keyed[0].id)
+        assert [sharded_tracker.shard_index(habit.id) for habit in keyed] == [shard] * 3
+
+        check_off = sharded_tracker.check_off_habit(keyed[1].id, datetime(2024, 1, 1, 8))
+        assert check_off.id % 3 == keyed[1].id % 3
+        assert len(sharded_tracker.shards[shard].get_all_check_offs()) == 1
+        assert sorted((tmp_path).glob("habits-shard*.db")) == [tmp_path / f"habits-shard{index}.db" for index in range(3)]
+
+        with pytest.raises(MultipleCheckOffError):
+            sharded_tracker.check_off_habit(keyed[1].id, datetime(2024, 1, 1, 20))
+        sharded_tracker.delete_habit(keyed[1].id)
+        with pytest.raises(HabitNotFoundError):
+            sharded_tracker.get_habit(keyed[1].id)
+
+    def test_fan_out_matches_single_database(self, sharded_tracker, tmp_path):
+        """Test if queries over all shards return the same results as with a single database."""
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{tmp_path / 'single.db'}")
+        for tracker in (habit_tracker, sharded_tracker):
+            add_history(tracker, seed=5)
+
+        # Habits get other ids in the shards, so results are compared by habit name
+        def by_name(tracker, streaks):
+            names = {habit.id: habit.name for habit in tracker.get_habits()}
+            return {names[habit_id]: streak for habit_id, streak in streaks.items()}
+
+        now = datetime(2024, 3, 1)
+        since, until = datetime(2024, 1, 1), datetime(2024, 3, 1)
+        ids = [habit.id for habit in sharded_tracker.get_habits()]
+        assert ids == sorted(ids) and len(ids) == 20
+        assert [habit.id for habit in sharded_tracker.get_habits(after_id=ids[3], limit=8)] == ids[4:12]
+        assert sharded_tracker.get_longest_streak_of_all_habits()[0] == habit_tracker.get_longest_streak_of_all_habits()[0]
+        for tracker in (sharded_tracker, habit_tracker):
+            assert list(tracker.get_longest_check_off_streaks()) == sorted(tracker.get_longest_check_off_streaks())
+        assert by_name(sharded_tracker, sharded_tracker.get_longest_check_off_streaks()) == by_name(
+            habit_tracker, habit_tracker.get_longest_check_off_streaks()
+        )
+        assert by_name(sharded_tracker, sharded_tracker.get_period_streaks(now)) == by_name(
+            habit_tracker, habit_tracker.get_period_streaks(now)
+        )
+        assert sorted(row[1:] for row in sharded_tracker.get_dashboard(now)) == sorted(
+            row[1:] for row in habit_tracker.get_dashboard(now)
+        )
+        assert sharded_tracker.get_check_off_counts("week", since, until) == habit_tracker.get_check_off_counts("week", since, until)
+        sharded_rates = sharded_tracker.get_completion_rates(since, until)
+        rates = habit_tracker.get_completion_rates(since, until)
+        assert sharded_rates["habit_id"] == sorted(sharded_rates["habit_id"])
+        assert sorted(zip(*list(sharded_rates.values())[1:])) == sorted(zip(*list(rates.values())[1:]))
+        assert len(sharded_tracker.get_check_off_rows()) == len(habit_tracker.get_check_off_rows())
+
+    def test_check_off_pagination(self, sharded_tracker):
+        """Test if check-off ids are unique across shards and pages after an id cover every check-off once."""
+        habits = sharded_tracker.add_habits([{"name": f"Habit {index}", "periodicity": 1} for index in range(4)])
+        start = datetime(2024, 1, 1, 8)
+        inserted, rejected = sharded_tracker.bulk_check_off(
+            (habit.id, start + timedelta(days=day)) for habit in habits for day in range(5)
+        )
+        assert inserted == 20 and rejected == []
+
+        rows = sharded_tracker.get_check_off_rows()
+        assert len({row[0] for row in rows}) == 20
+
+        pages, after_id = [], None
+        while True:
+            page = sharded_tracker.get_check_off_rows(after_id=after_id, limit=6)
+            if not page:
+                break
+            pages.extend(page)
+            after_id = page[-1][0]
+        assert pages == sorted(rows)
+
+        check_offs = [(check_off.id, check_off.date_time) for check_off in sharded_tracker.get_all_check_offs_for_habit(habits[2].id)]
+        page = sharded_tracker.get_all_check_offs_for_habit(habits[2].id, after_id=check_offs[1][0], limit=2)
+        assert [(check_off.id, check_off.date_time) for check_off in page] == check_offs[2:4]
+
+    def test_import_streams_in_chunks(self, sharded_tracker, tmp_path):
+        """Test if imports are written in chunks of the batch size per shard instead of reading the whole file first."""
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{tmp_path / 'single.db'}")
+        add_history(habit_tracker, seed=7)
+        habit_tracker.export_habits(str(tmp_path / "habits.csv"))
+        habit_tracker.export_check_offs(str(tmp_path / "check_offs.csv"))
+
+        chunk_sizes = []
+        for shard in sharded_tracker.shards:
+            bulk_check_off = shard.bulk_check_off
+            shard.bulk_check_off = lambda records, batch_size, bulk_check_off=bulk_check_off: (
+                chunk_sizes.append(len(records)) or bulk_check_off(records, batch_size)
+            )
+
+        assert sharded_tracker.import_habits(str(tmp_path / "habits.csv"), batch_size=4) == 20
+        inserted, rejected = sharded_tracker.import_check_offs(str(tmp_path / "check_offs.csv"), batch_size=10)
+
+        assert (inserted, rejected) == (len(habit_tracker.get_check_off_rows()), [])
+        assert max(chunk_sizes) <= 30 and sum(chunk_sizes) == inserted
+        assert sharded_tracker.get_longest_check_off_streaks() == habit_tracker.get_longest_check_off_streaks()
@@ -0,0 +1,86 @@
+import random
+from datetime import datetime, timedelta
+
+from streaks import (
+    _summarize_numpy,
+    _summarize_python,
+    is_streak_at_risk,
+    longest_streaks,
+    running_streak,
+    streak_interval,
+    summarize_streaks,
+)
+
+
+class TestStreaks:
+    def test_streak_interval(self):
+        """Test if daily habits continue a streak after 1 day and weekly habits after 7 days."""
+        assert streak_interval(1) == 1
+        assert streak_interval(2) == 7
+
+    def test_longest_streaks(self):
+        """Test if the longest streak of every habit is calculated from ordered rows."""
+        rows = [
+            (1, 1, datetime(2024, 1, 1)),
+            (1, 1, datetime(2024, 1, 2)),
+            (1, 1, datetime(2024, 1, 2)),
+            (1, 1, datetime(2024, 1, 3)),
+            (1, 1, datetime(2024, 1, 5)),
+            (2, 2, datetime(2024, 1, 1)),
+            (2, 2, datetime(2024, 1, 8)),
+            (2, 2, datetime(2024, 1, 15)),
+            (2, 2, datetime(2024, 1, 22)),
+            (2, 2, datetime(2024, 2, 14)),
+            (3, 1, None),
+        ]
+
+        assert longest_streaks(rows) == {1: 3, 2: 22, 3: 0}
+
+    def test_summarize_streaks_current_streak(self):
+        """Test if the last streak of a habit is reported as its current streak."""
+        rows = [
+            (1, 1, datetime(2024, 1, 1)),
+            (1, 1, datetime(2024, 1, 2)),
+            (1, 1, datetime(2024, 1, 3)),
+            (1, 1, datetime(2024, 1, 5)),
+            (1, 1, datetime(2024, 1, 6)),
+        ]
+
+        assert summarize_streaks(rows) == {1: (3, datetime(2024, 1, 5), datetime(2024, 1, 6), 2)}
+
+    def test_running_streak(self):
+        """Test if a streak is running until a check-off could no longer continue it."""
+        last_check_off = datetime(2024, 1, 10, 20)
+
+        assert running_streak(4, last_check_off, 1, datetime(2024, 1, 11, 8)) == 4
+        assert running_streak(4, last_check_off, 1, datetime(2024, 1, 12, 19)) == 4
+        assert running_streak(4, last_check_off, 1, datetime(2024, 1, 12, 20)) == 0
+        assert running_streak(8, last_check_off, 2, datetime(2024, 1, 17, 21)) == 8
+        assert running_streak(8, last_check_off, 2, datetime(2024, 1, 18, 21)) == 0
+        assert running_streak(0, None, 1, datetime(2024, 1, 11)) == 0
+
+    def test_is_streak_at_risk(self):
+        """Test if daily habits not checked off today and weekly habits checked off 6 or more days ago are at risk."""
+        last_check_off = datetime(2024, 1, 10, 20)
+
+        assert not is_streak_at_risk(4, last_check_off, 1, datetime(2024, 1, 10, 22))
+        assert is_streak_at_risk(4, last_check_off, 1, datetime(2024, 1, 11, 8))
+        assert not is_streak_at_risk(4, last_check_off, 1, datetime(2024, 1, 13))
+        assert not is_streak_at_risk(8, last_check_off, 2, datetime(2024, 1, 15))
+        assert is_streak_at_risk(8, last_check_off, 2, datetime(2024, 1, 16))
+        assert not is_streak_at_risk(0, None, 1, datetime(2024, 1, 11))
+
+    def test_python_and_numpy_kernels_match(self):
+        """Test if the pure Python and NumPy kernels give identical results."""
+        generator = random.Random(42)
+        rows = []
+        for habit_id in range(1, 20):
+            periodicity = generator.choice([1, 2])
+            step = streak_interval(periodicity)
+            dates = sorted(
+                datetime(2024, 1, 1) + timedelta(days=generator.randint(0, 90) * step, hours=generator.choice([0, 6, 23]))
+                for _ in range(generator.randint(0, 60))
+            )
+            rows += [(habit_id, periodicity, date) for date in dates] or [(habit_id, periodicity, None)]
+
+        assert _summarize_python(rows) == _summarize_numpy(rows)
@@ -0,0 +1,89 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from exceptions import HabitNotFoundError, MultipleCheckOffError
+from habit_tracker import HabitTracker
+from tests import create_sqlite_session
+from validation import DAILY_CHECK_OFF_LIMIT_MESSAGE
+
+
+class TestWriteBehindQueue:
+    def test_check_offs_are_written_on_close(self):
+        """Test if queued check-offs are validated right away and written with their streaks when the queue is closed."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+        daily = habit_tracker.add_habit(name="Drink water", description=None, periodicity=1)
+        weekly = habit_tracker.add_habit(name="Groceries", description=None, periodicity=2)
+
+        with habit_tracker.write_behind(batch_size=100) as queue:
+            queue.check_off_habit(daily.id, datetime(2024, 1, 1, 8))
+            queue.check_off_habit(daily.id, datetime(2024, 1, 2, 8))
+            queue.check_off_habit(weekly.id, datetime(2024, 1, 1, 8))
+            with pytest.raises(MultipleCheckOffError):
+                queue.check_off_habit(daily.id, datetime(2024, 1, 2, 20))
+            with pytest.raises(MultipleCheckOffError):
+                queue.check_off_habit(weekly.id, datetime(2024, 1, 5, 8))
+            with pytest.raises(HabitNotFoundError):
+                queue.check_off_habit(99, datetime(2024, 1, 1, 8))
+
+            assert len(queue) == 3
+            assert habit_tracker.get_all_check_offs() == []
+
+        assert len(habit_tracker.get_all_check_offs()) == 3
+        assert habit_tracker.get_longest_check_off_streak_for_habit(daily.id) == 2
+
+    def test_backfills_are_validated(self):
+        """Test if daily check-offs older than the last one are checked against the queue and the stored check-offs."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+        habit = habit_tracker.add_habit(name="Drink water", description=None, periodicity=1)
+        habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 1, 8))
+
+        with habit_tracker.write_behind() as queue:
+            queue.check_off_habit(habit.id, datetime(2024, 1, 5, 8))
+            queue.check_off_habit(habit.id, datetime(2024, 1, 3, 8))
+            with pytest.raises(MultipleCheckOffError):
+                queue.check_off_habit(habit.id, datetime(2024, 1, 3, 20))
+            with pytest.raises(MultipleCheckOffError):
+                queue.check_off_habit(habit.id, datetime(2024, 1, 1, 20))
+            queue.check_off_habit(habit.id, datetime(2024, 1, 4, 8))
+
+        assert habit_tracker.get_current_streak(habit.id, now=datetime(2024, 1, 5, 12)) == 3
+
+    def test_full_queue_is_written_by_background_thread(self, tmp_path):
+        """Test if a background thread writes the queue in group commits once it is full or its oldest entry is due."""
+        habit_tracker = HabitTracker(database_url=f"sqlite:///{tmp_path / 'habits.db'}")
+        habit_ids = [habit.id for habit in habit_tracker.add_habits(
+            {"name": f"Habit {index}", "description": None, "periodicity": 1} for index in range(10)
+        )]
+
+        queue = habit_tracker.write_behind(batch_size=4, max_latency=0.05)
+        try:
+            for habit_id in habit_ids:
+                queue.check_off_habit(habit_id, datetime(2024, 1, 1, 8))
+
+            deadline = time.monotonic() + 5
+            while len(habit_tracker.get_all_check_offs()) < len(habit_ids) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(habit_tracker.get_all_check_offs()) == len(habit_ids)
+        finally:
+            queue.close()
+            habit_tracker.engine.dispose()
+
+    def test_conflicting_check_offs_are_rejected_on_write(self):
+        """Test if check-offs made elsewhere after a habit was loaded reject the queued check-offs they conflict with."""
+        habit_tracker = HabitTracker(create_sqlite_session())
+        habit = habit_tracker.add_habit(name="Drink water", description=None, periodicity=1)
+
+        queue = habit_tracker.write_behind()
+        queue.check_off_habit(habit.id, datetime(2024, 1, 1, 8))
+        habit_tracker.check_off_habit(habit.id, datetime(2024, 1, 2, 8))
+        queue.check_off_habit(habit.id, datetime(2024, 1, 2, 20))
+        queue.close()
+
+        assert len(habit_tracker.get_all_check_offs()) == 2
+        assert [(habit_id, error) for habit_id, _, error in queue.rejected] == [
+            (habit.id, DAILY_CHECK_OFF_LIMIT_MESSAGE),
+        ]
+        with pytest.raises(RuntimeError):
+            queue.check_off_habit(habit.id)
@@ -0,0 +1,32 @@
+from datetime import date, datetime
+from typing import Optional
+
+from constants import WEEKLY_CHECK_OFF_LIMIT_DAYS
+
+DAILY_CHECK_OFF_LIMIT_MESSAGE = "You can only check off once per day."
+WEEKLY_CHECK_OFF_LIMIT_MESSAGE = "You can only check off once every 7 days."
+
+
+def daily_check_off_error(already_checked_off: bool) -> Optional[str]:
+    """
+    Return why a daily habit cannot be checked off, or None if it can.
+    """
+    return DAILY_CHECK_OFF_LIMIT_MESSAGE if already_checked_off else None
+
+
+def weekly_check_off_error(last_check_off: Optional[datetime], check_off_day: date) -> Optional[str]:
+    """
+    Return why a weekly habit last checked off at last_check_off cannot be checked off on check_off_day,
+    or None if it can.
+    """
+    if last_check_off and (check_off_day - last_check_off.date()).days < WEEKLY_CHECK_OFF_LIMIT_DAYS:
+        return WEEKLY_CHECK_OFF_LIMIT_MESSAGE
+    return None
+
+
+def habit_not_found_message(habit_id: int) -> str:
+    return f"Habit with id {habit_id} does not exist."
+
+
+def invalid_periodicity_message(habit_id: int, periodicity: int) -> str:
+    return f"Habit with id {habit_id} has periodicity {periodicity}, which cannot be checked off. Use daily or weekly."
@@ -0,0 +1,218 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from constants import PERIODICITY_DAILY, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_MAX_LATENCY_SECONDS
+from exceptions import MultipleCheckOffError
+from habit import CheckOff
+from validation import daily_check_off_error, weekly_check_off_error
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Buffered check-offs of a HabitTracker, written in group commits.
+    check_off_habit validates a check-off against the periodicity and last check-off of the habit kept in memory and
+    raises MultipleCheckOffError right away, like HabitTracker.check_off_habit, but only queues the check-off.
+    Queued check-offs are written in one transaction with bulk_check_off once batch_size of them are queued or the
+    oldest one has waited max_latency seconds, by a background thread when the tracker opens a session per operation.
+    flush writes the queue synchronously; close, also called when leaving a with block and at interpreter exit,
+    stops the thread and flushes what is left.
+
+    The in-memory state only knows the check-offs made through this queue: check-offs of the same habits made
+    elsewhere are detected when the queue is written, and the rejected check-offs are logged and kept in rejected.
+    """
+
+    def __init__(
+        self,
+        habit_tracker,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        max_latency: float = WRITE_BEHIND_MAX_LATENCY_SECONDS,
+    ):
+        self.habit_tracker = habit_tracker
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.rejected: List[Tuple[int, datetime, str]] = []
+        self.closed = False
+
+        self._pending: List[Tuple[int, datetime]] = []
+        self._oldest_pending: Optional[float] = None
+        # Periodicity and last check-off of every habit checked off through the queue, queued check-offs included
+        self._habits: Dict[int, Tuple[int, Optional[datetime]]] = {}
+        self._lock = threading.Condition()
+        # Serializes writes, so batches are committed in the order they were queued
+        self._write_lock = threading.Lock()
+
+        # An injected session is not thread-safe, so it is only used by the threads calling the queue
+        self._thread = None
+        if habit_tracker.session is None:
+            self._thread = threading.Thread(target=self._run, name="check-off-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self) -> "WriteBehindQueue":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def check_off_habit(self, habit_id: int, check_off_date: Optional[datetime] = None) -> CheckOff:
+        """
+        Validate and queue a check-off. Returns the check-off, without an id until it is written.
+        Daily check-offs older than the last check-off of their habit are looked up in the queue and the database.
+        """
+        if check_off_date is None:
+            check_off_date = datetime.utcnow()
+        if self.closed:
+            raise RuntimeError("The write-behind queue is closed.")
+
+        periodicity, last_check_off = self._get_habit_state(habit_id)
+        day = check_off_date.date()
+
+        if periodicity == PERIODICITY_DAILY and last_check_off is not None and check_off_date < last_check_off:
+            # Writes are held until the backfill is queued, so its day cannot be committed in between
+            with self._write_lock:
+                error = daily_check_off_error(self._is_checked_off(habit_id, day))
+                full = self._enqueue(habit_id, check_off_date, periodicity, last_check_off, error)
+        else:
+            if periodicity == PERIODICITY_DAILY:
+                error = daily_check_off_error(last_check_off is not None and last_check_off.date() == day)
+            else:
+                error = weekly_check_off_error(last_check_off, day)
+            full = self._enqueue(habit_id, check_off_date, periodicity, last_check_off, error)
+
+        if full is None:
+            # Another thread checked off the habit meanwhile, validate again against its new state
+            return self.check_off_habit(habit_id, check_off_date)
+        if full and self._thread is None:
+            self.flush()
+        return CheckOff(habit_id=habit_id, date_time=check_off_date, day=day)
+
+    def _enqueue(
+        self,
+        habit_id: int,
+        check_off_date: datetime,
+        periodicity: int,
+        last_check_off: Optional[datetime],
+        error: Optional[str],
+    ) -> Optional[bool]:
+        """
+        Queue a check-off validated against last_check_off. Returns whether the queue is full,
+        or None if the state of the habit changed since it was validated.
+        """
+        with self._lock:
+            if self._habits.get(habit_id) != (periodicity, last_check_off):
+                return None
+            if error:
+                raise MultipleCheckOffError(error)
+
+            self._habits[habit_id] = (periodicity, max(check_off_date, last_check_off or check_off_date))
+            self._pending.append((habit_id, check_off_date))
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            full = len(self._pending) >= self.batch_size
+            if full:
+                self._lock.notify()
+            return full
+
+    def _is_checked_off(self, habit_id: int, day: date) -> bool:
+        with self._lock:
+            if any(queued_habit_id == habit_id and date_time.date() == day for queued_habit_id, date_time in self._pending):
+                return True
+
+        with self.habit_tracker._session_scope() as session:
+            return self.habit_tracker._is_checked_off(session, habit_id, day)
+
+    def _get_habit_state(self, habit_id: int) -> Tuple[int, Optional[datetime]]:
+        with self._lock:
+            state = self._habits.get(habit_id)
+        if state is not None:
+            return state
+
+        tracker = self.habit_tracker
+        with tracker._session_scope() as session:
+            habit, streak = tracker._get_habit_state(session, habit_id)
+            if streak is not None:
+                last_check_off = streak.last_check_off
+            else:
+                last_check_offs = {}
+                tracker._load_check_off_state(session, [habit_id], {}, last_check_offs)
+                last_check_off = last_check_offs[habit_id]
+
+        with self._lock:
+            return self._habits.setdefault(habit_id, (habit.periodicity, last_check_off))
+
+    def flush(self) -> int:
+        """
+        Write the queued check-offs in one transaction. Returns the number of written check-offs.
+        """
+        with self._write_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+                self._oldest_pending = None
+            if not batch:
+                return 0
+
+            try:
+                inserted, rejected = self.habit_tracker.bulk_check_off(batch)
+            except Exception:
+                # Keep the batch at the head of the queue, so it is written by the next flush
+                with self._lock:
+                    self._pending[:0] = batch
+                    self._oldest_pending = self._oldest_pending or time.monotonic()
+                raise
+
+        for habit_id, check_off_date, error in rejected:
+            logger.warning(f"Queued check-off of habit {habit_id} at {check_off_date} rejected: {error}")
+        if rejected:
+            # The in-memory state of these habits missed check-offs made elsewhere
+            with self._lock:
+                for habit_id, _, _ in rejected:
+                    self._habits.pop(habit_id, None)
+                self.rejected.extend(rejected)
+        return inserted
+
+    def close(self) -> None:
+        """
+        Stop the background thread and write the check-offs still queued.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        if self._thread is not None:
+            with self._lock:
+                self._lock.notify()
+            self._thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self.closed and not self._due():
+                    timeout = None
+                    if self._oldest_pending is not None:
+                        timeout = self._oldest_pending + self.max_latency - time.monotonic()
+                    self._lock.wait(timeout)
+                if self.closed:
+                    return
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing queued check-offs failed, retrying.")
+                with self._lock:
+                    self._lock.wait(self.max_latency)
+
+    def _due(self) -> bool:
+        if not self._pending:
+            return False
+        return len(self._pending) >= self.batch_size or time.monotonic() - self._oldest_pending >= self.max_latency